@@ -0,0 +1,8 @@
+"""Benchmarks for lovett.
+
+Each module in this package can be run as a script from the top of the
+source tree, e.g. ``python -m bench.psd_parse``.  They work on synthetic
+corpora generated by :mod:`bench.synthetic`, so that the numbers do not
+depend on access to any particular treebank.
+
+"""
@@ -0,0 +1,45 @@
+"""Compare cold parses with warm loads from the on-disk cache."""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from lovett import corpus, psd
+from . import synthetic
+
+def main(n=20000):
+    d = tempfile.mkdtemp()
+    try:
+        text = synthetic.deep_corpus(n)
+        cache_dir = os.path.join(d, "cache")
+        print("Loading %d synthetic trees" % n)
+
+        t_cold, c = synthetic.timed(psd.parse_deep_string, text, repeat=1)
+        synthetic.report("deep string: cold parse", t_cold, n)
+        psd.parse_deep_string(text, cache_dir=cache_dir)
+        t_warm, _ = synthetic.timed(
+            lambda: psd.parse_deep_string(text, cache_dir=cache_dir))
+        synthetic.report("deep string: warm cache load", t_warm, n)
+        print("speedup: %.2fx" % (t_cold / t_warm))
+
+        path = os.path.join(d, "corpus.deep")
+        with open(path, "w") as f:
+            f.write(text)
+        t_cold, _ = synthetic.timed(corpus.parse_files, [path], 1, repeat=1)
+        synthetic.report("deep file: cold parse", t_cold, n)
+        corpus.parse_files([path], 1, cache=cache_dir)
+        t_warm, _ = synthetic.timed(
+            lambda: corpus.parse_files([path], 1, cache=cache_dir))
+        synthetic.report("deep file: warm cache load", t_warm, n)
+        print("speedup: %.2fx" % (t_cold / t_warm))
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        t_hash, _ = synthetic.timed(
+            lambda: corpus.parse_files([path], 1, cache=cache_dir), repeat=1)
+        synthetic.report("deep file: touched, load by hash", t_hash, n)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
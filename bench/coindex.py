@@ -0,0 +1,72 @@
+"""Measure coindexation lookups.
+
+Runs deep(isTrace() & antecedent()) and deep(hasCoIndexed()) over every
+tree of a synthetic corpus.  The old antecedent and hasCoIndexed read the
+index of every node of the tree for each trace.  The new ones look the
+index up in the tree's coindexation table, which is built once per
+sentence.  The synthetic traces bear random indices from 1 to 9, so their
+only coindexed nodes are other traces which happen to share one.
+"""
+
+import sys
+
+from lovett import psd
+from lovett.cs.searchfns import (SearchFunction, deep, isTrace, antecedent,
+                                 hasCoIndexed, identity)
+from lovett.util import index
+from . import synthetic
+
+def _old_root(t):
+    while True:
+        p = t.getparent()
+        if p is None or p.tag == "sentence":
+            return t
+        t = p
+
+def _old_coindexed_with(t, the_idx):
+    root = _old_root(t)
+    return [x for x in root.iter("nonterminal", "text", "trace", "ec")
+            if index(x) == the_idx and x is not t]
+
+def _old_antecedent(fn=identity):
+    def _antecedent(t):
+        the_idx = index(t)
+        if the_idx is None:
+            return None
+        c = _old_coindexed_with(t, the_idx)
+        if len(c) == 1 and fn(c[0]) is not None:
+            return c[0]
+        return None
+    return SearchFunction(_antecedent, fn)
+
+def _old_hasCoIndexed(fn=identity):
+    def _hasCoIndexed(t):
+        the_idx = index(t)
+        if the_idx is None:
+            return None
+        c = [x for x in _old_coindexed_with(t, the_idx) if fn(x) is not None]
+        return t if c else None
+    return SearchFunction(_hasCoIndexed, fn)
+
+def _search(fn, sentences):
+    return sum(len(fn(s.tree())) for s in sentences)
+
+def main(n=5000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n, max_depth=8))
+    c.pin()
+    sentences = list(c)
+    print("Searching %d synthetic trees" % n)
+    for name, old, new in [
+            ("antecedent", deep(isTrace() & _old_antecedent()),
+             deep(isTrace() & antecedent())),
+            ("hasCoIndexed", deep(_old_hasCoIndexed()),
+             deep(hasCoIndexed()))]:
+        t_old, hits_old = synthetic.timed(_search, old, sentences)
+        t_new, hits_new = synthetic.timed(_search, new, sentences)
+        assert hits_old == hits_new
+        synthetic.report("%s: scan per trace" % name, t_old, n)
+        synthetic.report("%s: coindexation table" % name, t_new, n)
+        print("%d matches; speedup: %.2fx" % (hits_new, t_old / t_new))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
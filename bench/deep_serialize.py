@@ -0,0 +1,91 @@
+"""Measure deep serialization of long sentences.
+
+The old serializer searched backwards from every text leaf for the leaf
+before it, and rebuilt the text of every subtree at every level of
+embedding; it is kept here to compare against.
+"""
+
+import random
+import sys
+
+from lovett import psd
+from lovett.tree import (NonTerminal, Text, _meta_to_deep, _calc_trace)
+from . import synthetic
+
+def _old_nonterminal_to_deep(self, offset=0, _state=None):
+    l = self.label()
+    c = list(map(lambda x: x.to_deep(offset + len(l) + 2), self.children()))
+    c[0] = c[0].lstrip()
+    m = self.find("meta")
+    if m is not None:
+        c.append(_meta_to_deep(m, offset + len(l) + 2))
+    return " " * offset + ("(%s " % l) + "\n".join(c) + ")"
+
+def _old_text_to_deep(self, offset=0, _state=None):
+    def acceptable(x):
+        return x is not None and x is not self and x.tag in ["text", "trace", "ec"]
+    pre_dollar = False
+    p = self
+    while not acceptable(p):
+        if p is None:
+            break
+        if p.tag == "nonterminal":
+            p = p[len(p)-1]
+            continue
+        if p.getprevious() is None:
+            if p.getparent() is None or p.getparent().tag == "sentence":
+                break
+            p = p.getparent().getprevious()
+        else:
+            p = p.getprevious()
+    if p is not None and p.metadata().get("has_continuation", None) == "yes":
+        pre_dollar = True
+    m = self.find("meta")
+    ms = ""
+    l = self.label()
+    ts = _calc_trace(self)
+    if m is not None:
+        ms = _meta_to_deep(m, offset + len(l) + 2)
+        if ms != "":
+            ms = "\n" + ms
+    return "%s(%s%s (ORTHO %s%s%s)%s)" % \
+        (" " * offset,
+         l,
+         ts,
+         "$" if pre_dollar else "",
+         self.text,
+         "$" if self.metadata().get("has_continuation", None) == "yes" else "",
+         ms)
+
+def _serialize(c):
+    return [s.to_deep() for s in c]
+
+def _best(text):
+    # Serialization strips trace indices from the metadata, so every run
+    # needs a freshly parsed corpus.
+    return min(synthetic.timed(_serialize, psd.parse_deep_string(text),
+                               repeat=1)[0] for i in range(3))
+
+def main(n=100):
+    print("Serializing %d synthetic trees at increasing depth" % n)
+    for depth in (6, 12, 18):
+        rng = random.Random(depth)
+        text = "\n\n".join(synthetic.deep_tree(rng, i, max_depth=depth)
+                           for i in range(n))
+        leaves = sum(1 for s in psd.parse_deep_string(text)
+                     for x in s.iter("text", "trace", "ec"))
+        t_new = _best(text)
+        new = (NonTerminal.to_deep, Text.to_deep)
+        NonTerminal.to_deep = _old_nonterminal_to_deep
+        Text.to_deep = _old_text_to_deep
+        try:
+            t_old = _best(text)
+        finally:
+            NonTerminal.to_deep, Text.to_deep = new
+        print("max depth %d, %d leaves per tree" % (depth, leaves // n))
+        synthetic.report("  old", t_old, leaves, "leaves")
+        synthetic.report("  one pass", t_new, leaves, "leaves")
+        print("  speedup: %.2fx" % (t_old / t_new))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,55 @@
+"""Compare the memory and search speed of live and frozen corpora.
+
+Each kind of corpus is loaded in a fresh interpreter, so that resident set
+sizes can be compared.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from . import synthetic
+
+def _rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def _measure(mode, path):
+    from lovett import corpus, frozen
+    from lovett.cs.searchfns import deep, hasLabel, hasParent
+    before = _rss()
+    if mode == "live":
+        c = corpus.parse_files([path], workers=1, format="deep")
+    else:
+        c = frozen.freeze_file(path, format="deep")
+    size = _rss() - before
+    fn = deep(hasLabel("N") & hasParent(hasLabel("NP")))
+    t, hits = synthetic.timed(lambda: sum(len(fn(s.tree()))
+                                          for s in c.trees()))
+    print("%s %d %f %d" % (mode, size, t, hits))
+
+def main(n=20000):
+    d = tempfile.mkdtemp()
+    try:
+        path = os.path.join(d, "corpus.psd")
+        with open(path, "w") as f:
+            f.write(synthetic.deep_corpus(n))
+        print("Loading and searching %d synthetic trees" % n)
+        for mode in ("live", "frozen"):
+            out = subprocess.check_output(
+                [sys.executable, "-m", "bench.frozen", "--measure", mode,
+                 path], universal_newlines=True)
+            _, size, t, hits = out.split()
+            print("%-8s resident memory %7.1f MB" % (mode, int(size) / 1e6))
+            synthetic.report("%s: search (%s hits)" % (mode, hits),
+                             float(t), n)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        _measure(*sys.argv[2:])
+    else:
+        main(*map(int, sys.argv[1:]))
@@ -0,0 +1,51 @@
+"""Measure searches seeded from a label index.
+
+Runs queries which start with a label test over every tree of a synthetic
+corpus, scanning every node and then visiting only the nodes the label
+index lists.  CP-QUE is made rare by relabelling a few hundred nodes with
+set_label, which updates the index in place.  Both runs pin the corpus, as
+the index does.
+"""
+
+import random
+import sys
+
+from lovett import psd
+from lovett.cs.searchfns import (deep, hasLabel, hasParent, iPrecedes)
+from . import synthetic
+
+def _queries():
+    return [deep(hasLabel("CP-QUE") & hasParent(hasLabel("IP"))),
+            deep(hasLabel("CP-REL")),
+            deep(hasLabel("WPRO") & iPrecedes(hasLabel("N"))),
+            deep(hasLabel("NP") & hasParent(hasLabel("PP")))]
+
+def _search(fn, trees):
+    return sum(len(fn(t)) for t in trees)
+
+def main(n=5000, rare=300):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n))
+    c.pin()
+    trees = [s.tree() for s in c]
+    rng = random.Random(0)
+    cps = [x for t in trees for x in t.iter("nonterminal")
+           if x.label() == "CP-REL"]
+    t_build, index = synthetic.timed(c.index_labels, repeat=1)
+    for x in rng.sample(cps, rare):
+        x.set_label("CP-QUE")
+    assert index._current()
+    print("Searching %d synthetic trees (%d nodes)" % (n, len(index)))
+    synthetic.report("building the index", t_build, n)
+    for q in _queries():
+        t_index, hits = synthetic.timed(_search, q, trees)
+        c.drop_labels()
+        t_scan, hits_scan = synthetic.timed(_search, q, trees)
+        c.index_labels()
+        assert hits == hits_scan
+        print(q)
+        synthetic.report("  scan", t_scan, n)
+        synthetic.report("  label index", t_index, n)
+        print("  %d matches; speedup: %.2fx" % (hits, t_scan / t_index))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,69 @@
+"""Measure label matching with deep(hasLabel(...)).
+
+Compares the interned, cached labels with the old hasLabel, which rebuilt
+and compared label strings for every node.
+"""
+
+import re
+import sys
+
+from lovett import psd
+from lovett.cs.searchfns import (SearchFunction, deep, hasLabel)
+from lovett.tree import TreeNode
+from . import synthetic
+
+def _old_label(self):
+    cat = self.get("category")
+    subcat = self.get("subcategory", None)
+    if subcat is not None:
+        return cat + "-" + subcat
+    else:
+        return cat
+
+def _old_hasLabel(label, exact=False):
+    def _hasLabel(t):
+        to_match = _old_label(t)
+        if hasattr(label, "match"):
+            if label.match(to_match):
+                return t
+            else:
+                return None
+        else:
+            exact_match = label == to_match
+            if exact_match:
+                return t
+            elif not exact and to_match.startswith(label + "-"):
+                return t
+            else:
+                return None
+    return SearchFunction(_hasLabel, label)
+
+def _search(fn, trees):
+    return sum(len(fn(t)) for t in trees)
+
+def main(n=10000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n))
+    trees = [s.tree() for s in c]
+    print("Searching %d synthetic trees" % n)
+    for arg in ("NP", re.compile("^(N|V)")):
+        old = deep(_old_hasLabel(arg))
+        new = deep(hasLabel(arg))
+        t_old, hits_old = synthetic.timed(_search, old, trees)
+        t_new, hits_new = synthetic.timed(_search, new, trees)
+        assert hits_old == hits_new
+        name = arg if isinstance(arg, str) else arg.pattern
+        synthetic.report("hasLabel(%r): old" % name, t_old, n)
+        synthetic.report("hasLabel(%r): interned" % name, t_new, n)
+        # With the node objects kept alive, their cached labels persist
+        # from one search to the next.
+        c.pin()
+        t_old_pin, _ = synthetic.timed(_search, old, trees)
+        synthetic.report("hasLabel(%r): old, pinned" % name, t_old_pin, n)
+        t_pin, _ = synthetic.timed(_search, new, trees)
+        synthetic.report("hasLabel(%r): interned, pinned" % name, t_pin, n)
+        c.unpin()
+        print("speedup: %.2fx (%.2fx pinned)" % (t_old / t_new,
+                                                 t_old_pin / t_pin))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,57 @@
+"""Measure memoizing search function results.
+
+Runs queries which test the same predicate on the same node more than once
+over every tree of a synthetic corpus, with and without a Memo, using one
+memo run per sentence as TreeTransformer.findNodes does.  The hit and miss
+counters show how many predicate calls the memo saved.
+"""
+
+import sys
+
+from lovett import psd
+from lovett.cs.searchfns import (Memo, deep, hasLabel, hasParent,
+                                 hasAncestor, hasSister, hasDaughter,
+                                 iPrecedes)
+from . import synthetic
+
+def _queries():
+    return [deep(hasLabel("N") & hasParent(hasLabel("NP"))),
+            deep(hasLabel("N") & hasAncestor(hasLabel("PP"))),
+            deep(hasDaughter(hasSister(hasLabel("D")))),
+            deep(hasSister(hasDaughter(hasLabel("N")))),
+            deep(hasLabel("N") & hasAncestor(hasDaughter(hasLabel("P")))),
+            deep(hasAncestor(hasDaughter(hasLabel("P")))),
+            deep(hasLabel("D") & iPrecedes(hasLabel("N") |
+                                           hasDaughter(hasLabel("N"))))]
+
+def _search(fn, trees):
+    return sum(len(fn(t)) for t in trees)
+
+def _search_memo(fn, trees, memo):
+    n = 0
+    for t in trees:
+        with memo:
+            n += len(fn(t))
+    return n
+
+def main(n=5000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n))
+    c.pin()
+    trees = [s.tree() for s in c]
+    print("Searching %d synthetic trees" % n)
+    for q in _queries():
+        memo = Memo()
+        t_plain, hits = synthetic.timed(_search, q, trees)
+        t_memo, hits_memo = synthetic.timed(_search_memo, q, trees, memo,
+                                            repeat=1)
+        assert hits == hits_memo
+        print(q)
+        synthetic.report("  plain", t_plain, n)
+        synthetic.report("  memo", t_memo, n)
+        calls = memo.hits + memo.misses
+        print("  %d calls, %d hits (%.0f%%); speedup: %.2fx" %
+              (calls, memo.hits, 100.0 * memo.hits / calls,
+               t_plain / t_memo))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
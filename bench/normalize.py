@@ -0,0 +1,36 @@
+"""Measure the cost of lower-casing tags after parsing PSDX."""
+
+import re
+import sys
+
+from lxml import etree
+
+from lovett import corpus, psd
+from . import synthetic
+
+def _old_postprocess(r):
+    for x in r.iter():
+        x.tag = x.tag.lower()
+    return r
+
+def main(n=20000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n))
+    lower = etree.tostring(c)
+    upper = re.sub(rb"<(/?)([a-z]+)",
+                   lambda m: b"<" + m.group(1) + m.group(2).upper(), lower)
+    print("Normalizing case of %d synthetic trees" % n)
+    for name, data in (("lower-case", lower), ("upper-case", upper)):
+        def run(fn):
+            r = etree.fromstring(data, corpus.parser)
+            return synthetic.timed(fn, r, repeat=1)[0]
+        t_parse, _ = synthetic.timed(etree.fromstring, data, corpus.parser)
+        synthetic.report("%s: parse only" % name, t_parse, n)
+        t_old = min(run(_old_postprocess) for i in range(3))
+        synthetic.report("%s: full pass" % name, t_old, n)
+        t_new = min(run(corpus._postprocess_parsed) for i in range(3))
+        synthetic.report("%s: _postprocess_parsed" % name, t_new, n)
+        print("time saved per parse: %.3fs (%.1fx)" % (t_old - t_new,
+                                                      t_old / t_new))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
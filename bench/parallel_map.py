@@ -0,0 +1,47 @@
+"""Measure Corpus.map and Corpus.filter with different numbers of workers.
+
+The per-sentence work is a handful of searches, which is typical of a bulk
+transformation.  With more than one worker, each sentence also has to be
+serialized, sent to a worker and parsed there, so the speedup depends on
+how much work is done per sentence, and on the number of CPUs.
+"""
+
+import os
+import sys
+
+from lovett import psd
+from lovett.cs.searchfns import (deep, hasLabel, iPrecedes, hasAncestor)
+from . import synthetic
+
+def _work(sentence):
+    t = sentence.tree()
+    return (len(deep(hasLabel("N") & hasAncestor(hasLabel("PP")))(t)) +
+            len(deep(hasLabel("D") & iPrecedes(hasLabel("N")))(t)) +
+            len(deep(hasLabel("NP"))(t)))
+
+def _has_pp(sentence):
+    return len(deep(hasLabel("N") & hasAncestor(hasLabel("PP")))(
+        sentence.tree())) > 0
+
+def main(n=5000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n))
+    cpus = os.cpu_count() or 1
+    print("Mapping over %d synthetic trees with up to %d workers" % (n, cpus))
+    counts = sorted(set([1, 2, cpus]))
+    base = None
+    for workers in counts:
+        t, r = synthetic.timed(lambda: sum(c.map(_work, workers=workers)),
+                               repeat=1)
+        base = base or t
+        synthetic.report("map, %d workers" % workers, t, n)
+        print("speedup: %.2fx" % (base / t))
+    base = None
+    for workers in counts:
+        t, r = synthetic.timed(lambda: sum(1 for s in c.filter(
+            _has_pp, workers=workers)), repeat=1)
+        base = base or t
+        synthetic.report("filter, %d workers" % workers, t, n)
+        print("speedup: %.2fx" % (base / t))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
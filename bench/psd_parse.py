@@ -0,0 +1,22 @@
+"""Compare the single-pass PSD parser with the psd_tree-based one."""
+
+import sys
+
+from lovett import psd
+from . import synthetic
+
+def main(n=20000):
+    trees = synthetic.deep_corpus(n).split("\n\n")
+    print("Parsing %d synthetic deep-format trees" % n)
+
+    def run(fn):
+        return [fn(t, "deep") for t in trees]
+
+    t_old, _ = synthetic.timed(run, psd._parse_sentence_legacy)
+    synthetic.report("psd_tree.Tree.parse + _parse_node_psdx", t_old, n)
+    t_new, _ = synthetic.timed(run, psd._parse_sentence)
+    synthetic.report("psd._parse_sentence (single pass)", t_new, n)
+    print("speedup: %.2fx" % (t_old / t_new))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
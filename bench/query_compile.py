@@ -0,0 +1,51 @@
+"""Measure compiled search functions.
+
+Runs the queries used across the other benchmarks and the search tests, in
+their plain and compiled forms, over every tree of a synthetic corpus.  The
+plain form goes through SearchFunction.__call__ once per operator per node;
+the compiled form runs the boolean logic inline, and looks each node's label
+up once.
+"""
+
+import re
+import sys
+
+from lovett import psd
+from lovett.cs.searchfns import (deep, hasLabel, hasParent, hasAncestor,
+                                 hasSister, hasDaughter, iPrecedes)
+from . import synthetic
+
+def _queries():
+    return [deep(hasLabel("NP")),
+            deep(hasLabel("N") & hasParent(hasLabel("NP"))),
+            deep(hasLabel("N") & hasAncestor(hasLabel("PP"))),
+            deep(hasLabel("D") & iPrecedes(hasLabel("N"))),
+            deep((hasLabel("N") | hasLabel("ADJ")) & ~hasLabel("NP") &
+                 hasSister(hasLabel("D"))),
+            deep(hasLabel(re.compile("^(N|V)")) &
+                 hasDaughter(hasLabel("N") | hasLabel("D")))]
+
+def _search(fn, trees):
+    return sum(len(fn(t)) for t in trees)
+
+def main(n=5000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n))
+    c.pin()
+    trees = [s.tree() for s in c]
+    print("Searching %d synthetic trees" % n)
+    total_plain = total_compiled = 0
+    for q in _queries():
+        compiled = q.compile()
+        t_plain, hits = synthetic.timed(_search, q, trees)
+        t_compiled, hits_compiled = synthetic.timed(_search, compiled, trees)
+        assert hits == hits_compiled
+        total_plain += t_plain
+        total_compiled += t_compiled
+        print(q)
+        synthetic.report("  plain", t_plain, n)
+        synthetic.report("  compiled", t_compiled, n)
+        print("  speedup: %.2fx" % (t_plain / t_compiled))
+    print("overall speedup: %.2fx" % (total_plain / total_compiled))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,40 @@
+"""Measure precedence and dominance predicates with and without span
+indexes.
+
+Each predicate is applied to every node of the corpus.  The plain
+predicates walk sibling and parent chains or enumerate subtrees; with an
+index they compare preorder numbers.  The list of nodes keeps their Python
+objects alive in both cases, as an index does.
+"""
+
+import sys
+
+from lovett import psd
+from lovett.cs.searchfns import (hasLabel, iPrecedes, domsWords)
+from . import synthetic
+
+def _apply(fn, nodes):
+    return sum(1 for x in nodes if fn(x) is not None)
+
+def main(n=5000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n, max_depth=8))
+    c.pin()
+    nodes = [x for s in c for x in s.tree().subtrees()]
+    fns = [("iPrecedes", iPrecedes(hasLabel("N"))),
+           ("domsWords", domsWords(2))]
+    print("Testing %d nodes of %d synthetic trees" % (len(nodes), n))
+    t_build, _ = synthetic.timed(c.index_spans, repeat=1)
+    synthetic.report("building the indexes", t_build, n)
+    for name, fn in fns:
+        c.drop_spans()
+        t_plain, hits = synthetic.timed(_apply, fn, nodes)
+        c.index_spans()
+        t_index, hits_index = synthetic.timed(_apply, fn, nodes)
+        assert hits == hits_index
+        synthetic.report("%s: plain" % name, t_plain, len(nodes), "nodes")
+        synthetic.report("%s: span index" % name, t_index, len(nodes),
+                         "nodes")
+        print("speedup: %.2fx" % (t_plain / t_index))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,81 @@
+"""Measure deduplicating trees.
+
+Compares pairwise comparison with the old __eq__, which stripped empty meta
+elements from both trees and then compared them recursively, with putting
+the trees in a set, which uses their structural hashes.
+"""
+
+import random
+import sys
+
+from lovett import psd
+from . import synthetic
+
+def _old_match(one, other):
+    if one.tag != other.tag:
+        return False
+    for name, value in one.attrib.items():
+        if other.attrib.get(name) != value:
+            return False
+    for name in other.attrib.keys():
+        if name not in one.attrib.keys():
+            return False
+    if not one.text == other.text:
+        return False
+    if not one.tail == other.tail:
+        return False
+    cl1 = one.getchildren()
+    cl2 = other.getchildren()
+    if len(cl1) != len(cl2):
+        return False
+    for c1, c2 in zip(cl1, cl2):
+        m = _old_match(c1, c2)
+        if not m:
+            return False
+    return True
+
+def _old_strip_empty_meta(node):
+    for m in node.getiterator("meta"):
+        if len(m) == 0:
+            t = m.tail
+            p = m.getparent()
+            p.remove(m)
+            if t is not None and t != "":
+                p.text = p.text or ""
+                p.text += t
+
+def _old_eq(one, other):
+    _old_strip_empty_meta(one)
+    _old_strip_empty_meta(other)
+    return _old_match(one, other)
+
+def _dedup_pairwise(trees):
+    r = []
+    for t in trees:
+        if not any(_old_eq(t, u) for u in r):
+            r.append(t)
+    return len(r)
+
+def _dedup_hashed(trees):
+    return len(set(trees))
+
+def main(n=1000):
+    # Every tree appears twice, in a random order.
+    rng = random.Random(0)
+    text = synthetic.deep_corpus(n // 2)
+    trees = [s.tree() for s in psd.parse_deep_string(text + "\n\n" + text)]
+    rng.shuffle(trees)
+    print("Deduplicating %d synthetic trees" % len(trees))
+    t_old, old = synthetic.timed(_dedup_pairwise, trees, repeat=1)
+    t_new, new = synthetic.timed(_dedup_hashed, trees, repeat=1)
+    assert old == new
+    # The list keeps the trees' Python objects alive, so now their hashes
+    # are cached.
+    t_cached, _ = synthetic.timed(_dedup_hashed, trees)
+    synthetic.report("pairwise __eq__", t_old, len(trees))
+    synthetic.report("set of structural hashes", t_new, len(trees))
+    synthetic.report("set, hashes cached", t_cached, len(trees))
+    print("speedup: %.1fx" % (t_old / t_new))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,79 @@
+"""Measure NonTerminal.subtrees against the old recursive generators.
+
+The old version passed every node up through one ``yield from`` for each
+level above it, so its cost per node grew with depth.  The trees are the
+usual synthetic ones, plus chains of nested nonterminals to show the
+effect of depth.  (lxml's own iterator slows down somewhat on very deep
+trees as well, but far less.)
+"""
+
+import sys
+
+from lovett import psd
+from lovett.cs.searchfns import (deep, hasLabel)
+from lovett.cs.transformer import TreeTransformer
+from lovett.tree import (Terminal, NonTerminal)
+from . import synthetic
+
+def _old_children(t):
+    yield from (x for x in t.iterchildren() if not x.tag == "meta")
+
+def _old_subtrees(t):
+    for c in _old_children(t):
+        if isinstance(c, Terminal):
+            yield c
+        else:
+            yield c
+            yield from _old_subtrees(c)
+
+def _count(subtrees, trees):
+    return sum(sum(1 for x in subtrees(t)) for t in trees)
+
+def _chain(depth):
+    # A tree of nested NPs, each with a word on either side
+    return "( " + "(NP (D (ORTHO a)) " * depth + "(N (ORTHO b))" + \
+        " (N (ORTHO c)))" * depth + "\n  (ID CHAIN))"
+
+def _find(trees):
+    n = 0
+    for s in trees:
+        n += len(TreeTransformer(s).findNodes(hasLabel("N")).matches())
+    return n
+
+def main(n=5000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n, max_depth=8))
+    trees = [s.tree() for s in c]
+    new = lambda t: t.subtrees()
+    print("Traversing %d synthetic trees" % n)
+    t_old, n_old = synthetic.timed(_count, _old_subtrees, trees)
+    t_new, n_new = synthetic.timed(_count, new, trees)
+    assert n_old == n_new
+    synthetic.report("subtrees: old", t_old, n_old, "nodes")
+    synthetic.report("subtrees: iter", t_new, n_new, "nodes")
+    print("speedup: %.2fx" % (t_old / t_new))
+    search = lambda: sum(len(deep(hasLabel("N"))(t)) for t in trees)
+    sentences = list(c)
+    new_subtrees = NonTerminal.subtrees
+    NonTerminal.subtrees = _old_subtrees
+    try:
+        t_deep_old, _ = synthetic.timed(search)
+        t_find_old, _ = synthetic.timed(_find, sentences)
+    finally:
+        NonTerminal.subtrees = new_subtrees
+    t_deep, _ = synthetic.timed(search)
+    t_find, _ = synthetic.timed(_find, sentences)
+    synthetic.report("deep(hasLabel('N')): old", t_deep_old, n)
+    synthetic.report("deep(hasLabel('N')): iter", t_deep, n)
+    synthetic.report("TreeTransformer.findNodes: old", t_find_old, n)
+    synthetic.report("TreeTransformer.findNodes: iter", t_find, n)
+    for depth in (10, 100, 400):
+        tree = psd.parse_deep_string(_chain(depth))[0].tree()
+        t_old, n_old = synthetic.timed(_count, _old_subtrees,
+                                       [tree] * 20)
+        t_new, n_new = synthetic.timed(_count, new, [tree] * 20)
+        assert n_old == n_new
+        synthetic.report("depth %d: old" % depth, t_old, n_old, "nodes")
+        synthetic.report("depth %d: iter" % depth, t_new, n_new, "nodes")
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,64 @@
+"""Generate synthetic deep-format corpora for benchmarking."""
+
+import random
+import time
+
+_PHRASES = ["NP", "NP-SBJ", "NP-OB1", "PP", "ADVP", "ADJP", "CP-REL", "IP-SUB",
+            "IP-INF", "CP-THT"]
+_WORDS = ["the", "man", "saw", "a", "dog", "in", "park", "yesterday", "who",
+          "quickly", "that", "ran", "big", "old", "house", "to", "give"]
+_TAGS = ["D", "N", "VBD", "P", "ADV", "ADJ", "WPRO", "C", "TO", "VB", "NPR"]
+
+def _leaf(rng, offset):
+    r = rng.random()
+    if r < 0.05:
+        return "%s(NP-OB1 (ALT-ORTHO *T*-%d))" % (" " * offset,
+                                                  rng.randint(1, 9))
+    if r < 0.08:
+        return "%s(NP-SBJ (ALT-ORTHO *pro*))" % (" " * offset)
+    if r < 0.1:
+        return "%s(C (ALT-ORTHO 0))" % (" " * offset)
+    tag = rng.choice(_TAGS)
+    word = rng.choice(_WORDS)
+    if r < 0.4:
+        return "%s(%s (ORTHO %s)\n%s (META (LEMMA %s)))" % \
+            (" " * offset, tag, word, " " * (offset + len(tag) + 1), word)
+    return "%s(%s (ORTHO %s))" % (" " * offset, tag, word)
+
+def _node(rng, offset, depth, max_depth):
+    label = rng.choice(_PHRASES)
+    n = rng.randint(1, 4)
+    kids = []
+    for i in range(n):
+        o = offset + len(label) + 2
+        if depth < max_depth and rng.random() < 0.45:
+            kids.append(_node(rng, o, depth + 1, max_depth))
+        else:
+            kids.append(_leaf(rng, o))
+    kids[0] = kids[0].lstrip()
+    return " " * offset + "(%s " % label + "\n".join(kids) + ")"
+
+def deep_tree(rng, i, max_depth=6):
+    """Return one synthetic deep-format tree, with ID ``SYN,<i>``."""
+    return "( " + _node(rng, 2, 0, max_depth).lstrip() + \
+        "\n  (ID SYN,%d))" % i
+
+def deep_corpus(n, seed=0, max_depth=6):
+    """Return a string of ``n`` synthetic deep-format trees."""
+    rng = random.Random(seed)
+    return "\n\n".join(deep_tree(rng, i, max_depth) for i in range(n))
+
+def timed(fn, *args, repeat=3):
+    """Call ``fn(*args)`` ``repeat`` times; return the best time and the last
+    result."""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        res = fn(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, res
+
+def report(name, seconds, n, unit="trees"):
+    print("%-40s %8.3fs  %10.0f %s/s" % (name, seconds, n / seconds, unit))
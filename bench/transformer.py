@@ -0,0 +1,62 @@
+"""Measure speculative transformations which are thrown away.
+
+Compares copying every sentence before transforming it, which was the only
+way to leave the original alone, with transforming the sentence in place
+and rolling the transformer back, which records only what is needed to undo
+each change (copying at most the metadata of coindexed nodes).  Both the
+time taken and the number of nodes copied are reported.
+"""
+
+import copy
+import sys
+
+from lxml import etree
+
+from lovett import psd
+from lovett.cs.searchfns import hasLabel
+from lovett.cs.transformer import TreeTransformer
+from . import synthetic
+
+def _transform(tt):
+    tt.findNodes(hasLabel("IP")).changeLabel("XP")
+    tt.findNodes(hasLabel("ADJ")).changeLabel("ADJR")
+    tt.findNodes(hasLabel("ADVP")).addParentNode("XP")
+
+def _copying(sentences):
+    for s in sentences:
+        _transform(TreeTransformer(copy.deepcopy(s)))
+    # Every node of every sentence
+    return sum(1 for s in sentences for x in s.iter())
+
+def _copied(saved):
+    # The number of nodes copied for an entry of the undo log
+    if isinstance(saved, tuple):
+        saved = saved[2] if saved[0] == "meta" else None
+    if isinstance(saved, etree._Element):
+        return sum(1 for x in saved.iter())
+    return 0
+
+def _rollback(sentences):
+    copied = 0
+    for s in sentences:
+        tt = TreeTransformer(s)
+        _transform(tt)
+        copied += sum(_copied(x) for _, x in tt._undo)
+        tt.rollback()
+    return copied
+
+def main(n=5000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n))
+    sentences = list(c)
+    before = etree.tostring(c)
+    print("Transforming %d synthetic trees" % n)
+    t_copy, n_copy = synthetic.timed(_copying, sentences)
+    t_roll, n_roll = synthetic.timed(_rollback, sentences)
+    assert etree.tostring(c) == before
+    synthetic.report("deepcopy, then transform", t_copy, n)
+    synthetic.report("transform, then roll back", t_roll, n)
+    print("nodes copied: %d copying sentences, %d rolling back (%.1f%%)" %
+          (n_copy, n_roll, 100.0 * n_roll / n_copy))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
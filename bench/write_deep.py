@@ -0,0 +1,30 @@
+"""Measure the time and peak memory of writing a corpus in deep format."""
+
+import os
+import sys
+import tracemalloc
+
+from lovett import psd
+from . import synthetic
+
+def _join(c, f):
+    f.write(c.to_deep())
+
+def _stream(c, f):
+    c.write_deep(f)
+
+def main(n=5000):
+    c = psd.parse_deep_string(synthetic.deep_corpus(n))
+    print("Writing %d synthetic trees in deep format" % n)
+    for name, fn in (("join", _join), ("DeepWriter", _stream)):
+        with open(os.devnull, "w") as f:
+            t, _ = synthetic.timed(fn, c, f)
+            tracemalloc.start()
+            fn(c, f)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        synthetic.report(name, t, n)
+        print("%s: peak Python allocation %.1f MB" % (name, peak / 1e6))
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -1,23 +1,27 @@
 from __future__ import unicode_literals
 
+import functools
+
 import lovett.cs.transformer as TT
 import lovett.corpus
+import lovett.psd
 
 
-def _flagIfHelper(tree, expr):
-    trans = TT.TreeTransformer(tree)
+def _flagIfHelper(sentence, expr):
+    trans = TT.TreeTransformer(sentence)
     trans.findNodes(expr)
-    if len(trans.matches()) > 0:
-        trans.changeLabel(lambda x: x + "-FLAG")
-    return trans.tree()
+    trans.addDashTag("FLAG")
+    return sentence
 
 def flagIf(expr):
     def _flagIfInner(version, trees):
         trees = trees.replace("-FLAG", "")
-        trees = trees.split("\n\n")
-        c = lovett.corpus.Corpus.fromTreeStrings(trees, version)
-        c._mapTrees(lambda x: _flagIfHelper(x, expr))
-        r = '\n\n'.join(map(str, c.trees))
+        c = lovett.psd.parse_deep_string(trees)
+        # Search functions are closures, which cannot be sent to worker
+        # processes.
+        flagged = c.map(functools.partial(_flagIfHelper, expr=expr),
+                        workers=1)
+        r = '\n\n'.join(s.to_deep() for s in flagged)
         return r
     return _flagIfInner
 
@@ -0,0 +1,153 @@
+"""An on-disk cache of parsed corpora.
+
+lxml elements cannot be pickled, so a cache entry holds the parsed corpus
+in normalized XML form (lower-cased tags, no ignorable whitespace).  lxml's
+C parser reads this back about ten times faster than the corpus can be
+re-parsed from PSD or deep format.  PSDX files are not cached: they are
+already XML, and loading an entry would save little over parsing them.
+
+An entry records the size, modification time and SHA-1 hash of its source.
+It is considered fresh if the size and time match; if they do not, the
+source is hashed, and the entry is still used if the contents are
+unchanged.  Only the entry's header is then rewritten, to record the new
+size and time.
+
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from lxml import etree
+
+from .corpus import parser
+
+__docformat__ = "restructuredtext en"
+
+_MAGIC = b"LOVETT-CACHE\n"
+# Bump this whenever the parsers change in a way that affects their output.
+_VERSION = 2
+# The header line is padded to this many bytes, so that it can be rewritten
+# in place.
+_HEADER_SIZE = 256
+
+def _hash_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def cache_path(path, cache_dir=None):
+    """Return the name of the cache entry for a corpus file.
+
+    :param str path: The corpus file
+    :param str cache_dir: A directory to keep cache entries in.  If
+        ``None``, the entry is kept next to the corpus file.
+    :rtype: str
+
+    """
+    if cache_dir is None:
+        return path + ".lvc"
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key + ".lvc")
+
+def _read_entry(entry):
+    try:
+        with open(entry, "rb") as f:
+            if f.readline() != _MAGIC:
+                return None, None
+            header = json.loads(f.read(_HEADER_SIZE).decode("utf-8"))
+            if header.get("version") != _VERSION:
+                return None, None
+            return header, f.read()
+    except (OSError, ValueError):
+        return None, None
+
+def _header_bytes(header):
+    # The header as JSON, padded with spaces (which JSON ignores)
+    b = json.dumps(dict(header, version=_VERSION)).encode("utf-8")
+    if len(b) >= _HEADER_SIZE:
+        raise ValueError("cache entry header too long: %r" % header)
+    return b.ljust(_HEADER_SIZE - 1) + b"\n"
+
+def _write_entry(entry, header, root):
+    d = os.path.dirname(entry) or "."
+    try:
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=d, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(_MAGIC)
+            f.write(_header_bytes(header))
+            f.write(etree.tostring(root, encoding="utf-8"))
+        os.replace(tmp, entry)
+    except OSError:
+        # Caching is an optimization; failing to write is not an error.
+        pass
+
+def _write_header(entry, header):
+    try:
+        with open(entry, "r+b") as f:
+            f.seek(len(_MAGIC))
+            f.write(_header_bytes(header))
+    except OSError:
+        pass
+
+def _load(data):
+    return etree.fromstring(data, parser)
+
+def load_file(path, parse, format, cache_dir=None):
+    """Parse a corpus file, going through the cache.
+
+    :param str path: The corpus file
+    :param parse: A function of one argument (the file name) which parses
+        the file and returns the root element of the corpus
+    :param str format: The format of the file, to keep entries for different
+        parses of the same file apart
+    :param str cache_dir: As for :func:`cache_path`
+    :returns: The root element of the corpus
+
+    """
+    entry = cache_path(path, cache_dir)
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    header, data = _read_entry(entry)
+    digest = None
+    if header is not None and header.get("format") == format:
+        if header.get("stamp") == stamp:
+            return _load(data)
+        digest = _hash_file(path)
+        if header.get("sha1") == digest:
+            header["stamp"] = stamp
+            _write_header(entry, header)
+            return _load(data)
+    root = parse(path)
+    _write_entry(entry, {"format": format,
+                         "stamp": stamp,
+                         "sha1": digest or _hash_file(path)},
+                 root)
+    return root
+
+def load_string(s, parse, format, cache_dir):
+    """Parse a corpus held in a string, going through the cache.
+
+    Entries for strings are named by the hash of their contents, so they
+    never go stale.
+
+    :param str s: The corpus text
+    :param parse: A function of one argument (the string) which parses
+        it and returns the root element of the corpus
+    :param str format: The format of the string
+    :param str cache_dir: The directory to keep cache entries in
+    :returns: The root element of the corpus
+
+    """
+    digest = hashlib.sha1((format + "\0" + s).encode("utf-8")).hexdigest()
+    entry = os.path.join(cache_dir, digest + ".lvc")
+    header, data = _read_entry(entry)
+    if header is not None:
+        return _load(data)
+    root = parse(s)
+    _write_entry(entry, {"format": format, "sha1": digest}, root)
+    return root
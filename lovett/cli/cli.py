@@ -7,10 +7,17 @@ import click
 # from .. import __version__
 
 from lovett.corpus import (parse_file, _validate_psdx)
+from lovett.compression import open_file
 from lxml import etree
 
 logging.basicConfig(format="%(message)s", level=logging.INFO)
 
+def _open(filename, mode):
+    # "-" is stdin/stdout; anything else may be compressed
+    if filename == "-":
+        return click.open_file(filename, mode)
+    return open_file(filename, mode)
+
 @click.group()
 @click.option("--debug", "-d", is_flag=True)
 def cli(debug):
@@ -31,25 +38,32 @@ def validate(filename):
         sys.exit(1)
 
 @cli.command()
-@click.argument("infile", nargs=1, type=click.File("r"))
-@click.argument("outfile", nargs=1, type=click.File("w"))
+@click.argument("infile", nargs=1, type=click.Path(allow_dash=True))
+@click.argument("outfile", nargs=1, type=click.Path(allow_dash=True))
 def format(infile, outfile):
-    s = etree.tostring(etree.parse(infile), pretty_print=True, encoding="utf-8")
-    outfile.write(s.decode("utf-8"))
+    with _open(infile, "rb") as f:
+        s = etree.tostring(etree.parse(f), pretty_print=True, encoding="utf-8")
+    with _open(outfile, "wb") as f:
+        f.write(s)
 
 # TODO: factor out common file handling code
 @cli.command()
 # "from" clashes with a python keyword, so assign a different name
 @click.option("--from", "-f", "frm", type=click.Choice(["psdx", "deep"]))
 @click.option("--to", "-t", type=click.Choice(["psdx", "deep"]))
-@click.argument("infile", nargs=1, type=click.File("r"))
-@click.argument("outfile", nargs=1, type=click.File("w"))
+@click.argument("infile", nargs=1, type=click.Path(allow_dash=True))
+@click.argument("outfile", nargs=1, type=click.Path(allow_dash=True))
 def convert(frm, to, infile, outfile):
     if frm == "psdx":
-        corpus = parse_file(infile)
+        with _open(infile, "rb") as f:
+            corpus = parse_file(f)
     else:
         raise NotImplemented("convert from: %s" % frm)
     if to == "deep":
-        outfile.write("\n\n".join(map(lambda x: x.to_deep(), corpus.getroot().trees())))
+        with _open(outfile, "w") as f:
+            corpus.getroot().write_deep(f)
+    elif to == "psdx":
+        with _open(outfile, "wb") as f:
+            corpus.getroot().write_psdx(f, pretty_print=True)
     else:
         raise NotImplemented("convert to: %s" % to)
@@ -0,0 +1,124 @@
+"""Looking up coindexed nodes.
+
+Finding the nodes which share an index with a trace means reading the index
+of every node of its tree, so a search over the traces of a sentence is
+quadratic in the size of the sentence.  A :class:`CoindexTable` reads them
+once, and maps each index to the nodes which bear it.  The search functions
+of :mod:`lovett.cs.searchfns` (``coIndexed``, ``antecedent`` and the like)
+and :func:`lovett.util.validateIndices` build one on demand with
+:func:`coindex_table`, and keep it on the sentence, until a tree changes
+(see :func:`lovett.tree.invalidate_hashes`; :func:`lovett.util.set_index`
+and :func:`lovett.util.remove_index` go through it).
+
+"""
+
+from . import tree as _tree
+from .util import (index, index_type, is_trace)
+
+__docformat__ = "restructuredtext en"
+
+_indexed_tags = ("nonterminal", "text", "trace", "ec")
+
+class CoindexTable(object):
+    """The indexed nodes of one tree, by index.
+
+    :param root: The topmost node of the tree (the child of the sentence)
+
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._nodes = {}
+        for x in root.iter(*_indexed_tags):
+            i = index(x)
+            if i is not None:
+                self._nodes.setdefault(i, []).append(x)
+        self._generation = _tree.tree_generation(root)
+
+    def indices(self):
+        """Return the indices used in the tree.
+
+        :rtype: list of str
+
+        """
+        return list(self._nodes)
+
+    def nodes(self, i):
+        """Return the nodes bearing an index, in document order.
+
+        :param str i: The index
+        :rtype: list
+
+        """
+        return self._nodes.get(i, [])
+
+    def entry(self, i):
+        """Return the roles of the nodes bearing an index.
+
+        The traces are the ``trace`` nodes, and the gapped nodes those
+        whose index type is ``gap``.  The antecedent is the one remaining
+        node, or ``None`` if there is none, or more than one.
+
+        :param str i: The index
+        :returns: ``(antecedent, traces, gapped)``
+        :rtype: tuple
+
+        """
+        traces = []
+        gapped = []
+        others = []
+        for x in self.nodes(i):
+            if is_trace(x):
+                traces.append(x)
+            elif index_type(x) == "gap":
+                gapped.append(x)
+            else:
+                others.append(x)
+        return (others[0] if len(others) == 1 else None), traces, gapped
+
+    def valid(self):
+        """Test whether every index in the tree is borne by more than one
+        node.
+
+        :rtype: bool
+
+        """
+        return all(len(v) > 1 for v in self._nodes.values())
+
+def _root(t):
+    # The topmost node of the tree containing t (below the sentence node)
+    while True:
+        p = t.getparent()
+        if p is None or p.tag == "sentence":
+            return t
+        t = p
+
+def coindex_table(node):
+    """Return the coindexation table of the tree containing a node.
+
+    The table is kept on the sentence (or on the root of a tree without
+    one) for as long as its Python object is alive, as it is while a
+    :class:`lovett.cs.transformer.TreeTransformer` works on it or its
+    corpus is pinned, and is rebuilt after the tree has changed.  Tables for
+    :class:`lovett.frozen.FrozenNode` trees are kept on their corpus.
+
+    :param node: Any node of the tree
+    :rtype: :class:`CoindexTable`
+
+    """
+    root = _root(node)
+    if not hasattr(root, "__dict__"):
+        # A frozen node: frozen corpora do not change
+        tables = root.corpus.__dict__.setdefault("_coindex_tables", {})
+        table = tables.get(root.i)
+        if table is None:
+            table = tables[root.i] = CoindexTable(root)
+        return table
+    holder = root.getparent()
+    if holder is None:
+        holder = root
+    table = getattr(holder, "_coindex", None)
+    if table is None or table.root is not root or \
+       table._generation != _tree.tree_generation(holder):
+        table = holder._coindex = CoindexTable(root)
+    return table
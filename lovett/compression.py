@@ -0,0 +1,82 @@
+"""Transparent reading and writing of compressed corpus files.
+
+gzip, bzip2 and xz compression are supported.  Compression is recognized by
+the file extension (``.gz``, ``.bz2`` or ``.xz``), or, when reading, by the
+magic bytes at the start of the file.  Data is decompressed as it is read,
+so the decompressed text never needs to be held in memory at once.
+
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+
+__docformat__ = "restructuredtext en"
+
+_extensions = {".gz": gzip.open,
+               ".bz2": bz2.open,
+               ".xz": lzma.open}
+
+_magic = ((b"\x1f\x8b", gzip.open),
+          (b"BZh", bz2.open),
+          (b"\xfd7zXZ\x00", lzma.open))
+
+def _opener(path, sniff=True):
+    opener = _extensions.get(os.path.splitext(path)[1].lower())
+    if opener is None and sniff:
+        try:
+            with open(path, "rb") as f:
+                head = f.read(6)
+        except OSError:
+            return None
+        for magic, fn in _magic:
+            if head.startswith(magic):
+                return fn
+    return opener
+
+def is_compressed(path):
+    """Test whether a file is compressed in a format that we can read.
+
+    :param str path: The file name
+    :rtype: bool
+
+    """
+    return _opener(path) is not None
+
+def strip_extension(path):
+    """Remove a compression extension, if any, from a file name.
+
+    This makes it possible to recognize the format of a file like
+    ``corpus.psdx.gz``.
+
+    :param str path: The file name
+    :rtype: str
+
+    """
+    root, ext = os.path.splitext(path)
+    if ext.lower() in _extensions:
+        return root
+    return path
+
+def open_file(path, mode="rb", encoding=None):
+    """Open a file, compressing or decompressing it if necessary.
+
+    When reading, compression is recognized by the file extension or the
+    contents of the file; when writing, by the extension alone.
+
+    :param str path: The file name
+    :param str mode: As for the builtin :func:`open`; text mode is the
+        default for compressed files too.
+    :param str encoding: The encoding for text mode (default: UTF-8)
+    :returns: a file object
+
+    """
+    if "b" not in mode and encoding is None:
+        encoding = "utf-8"
+    opener = _opener(path, sniff="r" in mode)
+    if opener is None:
+        return open(path, mode, encoding=encoding)
+    if "b" not in mode and "t" not in mode:
+        mode += "t"
+    return opener(path, mode, encoding=encoding)
@@ -1,33 +1,244 @@
+import collections
+import itertools
+import os
 import pkg_resources
 
 from lxml import etree
-from .tree import (Sentence, NonTerminal, Text, Trace, Ec, Comment)
+from .tree import (TreeNode, Sentence, NonTerminal, Text, Trace, Ec,
+                   Comment, _Mutable)
+from .util import (imap_ordered, default_workers)
+from .compression import (open_file, is_compressed, strip_extension)
 
 # TODO: __all__ etc.
 
-class Corpus(etree.ElementBase):
+class _Sentences(object):
+    # Methods which need only the trees() of a corpus.  Shared by Corpus
+    # and LazyCorpus.
+
+    def to_deep(self):
+        return "\n\n".join(map(lambda s: s.to_deep(), self.trees()))
+
+    def write_deep(self, file):
+        """Write the corpus in the deep format, one sentence at a time.
+
+        The output is the same as that of :meth:`to_deep`, but the text of
+        the whole corpus is never held in memory.
+
+        :param file: a file name or a file object opened in text mode
+
+        """
+        from .writers import DeepWriter
+        with DeepWriter(file) as w:
+            w.write_all(self.trees())
+
+    def write_psdx(self, file, pretty_print=False):
+        """Write the corpus as PSDX, one sentence at a time.
+
+        :param file: a file name or a file object opened in binary mode
+        :param bool pretty_print: Whether to indent the output
+
+        """
+        from .writers import PsdxWriter
+        with PsdxWriter(file, pretty_print) as w:
+            w.write_all(self.trees())
+
+    def freeze(self):
+        """Make a compact, read-only copy of the corpus for searching.
+
+        :rtype: :class:`lovett.frozen.FrozenCorpus`
+
+        """
+        from .frozen import FrozenCorpus
+        return FrozenCorpus(self.trees())
+
+    def map(self, fn, workers=None, chunk_size=100):
+        """Apply a function to every sentence, in a pool of worker
+        processes.
+
+        See :func:`map_sentences`.  The trees of a :class:`LazyCorpus` are
+        read from the file as they are needed, so the whole corpus is never
+        in memory at once.
+
+        :rtype: iterator
+
+        """
+        return map_sentences(fn, self.trees(), workers, chunk_size)
+
+    def filter(self, pred, workers=None, chunk_size=100):
+        """Iterate over the sentences for which a predicate holds, testing
+        them in a pool of worker processes.
+
+        See :func:`filter_sentences`.
+
+        :rtype: iterator of :class:`lovett.tree.Sentence`
+
+        """
+        return filter_sentences(pred, self.trees(), workers, chunk_size)
+
+class Corpus(_Sentences, _Mutable, etree.ElementBase):
     """Class representing a corpus."""
     def trees(self):
         """Get iterator over trees in this corpus."""
         # TODO: filter out meta nodes
         return iter(self)
-    # TODO: join two corpora together, map and filter corpus
 
-    def to_deep(self):
-        return "\n\n".join(map(lambda s: s.to_deep(), self.trees()))
+    def pin(self):
+        """Keep the Python objects for all the corpus's nodes alive.
+
+        lxml creates the Python object for a node when it is accessed, and
+        discards it when nothing refers to it any more, together with
+        anything cached on it.  Pinning makes searches faster, by saving
+        the cost of creating these objects and by caching the id of every
+        node's label (see :meth:`lovett.tree.TreeNode.label_id`), for as
+        long as this corpus object is alive.  The cost is the memory for
+        one object per node.
+
+        """
+        pinned = list(self.iter())
+        for x in pinned:
+            if isinstance(x, TreeNode):
+                x._cache_label()
+        self._pinned = pinned
+
+    def unpin(self):
+        """Undo :meth:`pin`."""
+        self.__dict__.pop("_pinned", None)
+
+    def index_spans(self):
+        """Build a span index for every sentence of the corpus.
+
+        The indexes last for as long as this corpus object is alive.  See
+        :meth:`lovett.tree.Sentence.index_spans`.
+
+        """
+        self._span_indexes = [s.index_spans() for s in self.trees()]
+
+    def drop_spans(self):
+        """Undo :meth:`index_spans`."""
+        for index in self.__dict__.pop("_span_indexes", ()):
+            index.detach()
+
+    def index_labels(self):
+        """Build a label index for the corpus, or return the one it has.
+
+        Searches whose query starts with a ``hasLabel`` test then visit
+        only the nodes with matching labels.  The index lasts for as long
+        as this corpus object is alive.  See :mod:`lovett.labels`.
+
+        :rtype: :class:`lovett.labels.LabelIndex`
+
+        """
+        from .labels import LabelIndex
+        index = self.__dict__.get("_label_index")
+        if index is None:
+            index = self._label_index = LabelIndex(self)
+        return index
+
+    def drop_labels(self):
+        """Undo :meth:`index_labels`."""
+        index = self.__dict__.pop("_label_index", None)
+        if index is not None:
+            index.detach()
+
+    def index_lexicon(self):
+        """Build a lexical index for the corpus, or return the one it has.
+
+        Searches whose query starts with ``hasText``, ``hasWord`` or
+        ``hasLemma`` then visit only the leaves with matching words or
+        lemmas.  The index lasts for as long as this corpus object is
+        alive.  See :mod:`lovett.lexicon`.
+
+        :rtype: :class:`lovett.lexicon.LexicalIndex`
+
+        """
+        from .lexicon import LexicalIndex
+        index = self.__dict__.get("_lexicon_index")
+        if index is None:
+            index = self._lexicon_index = LexicalIndex(self)
+        return index
+
+    def drop_lexicon(self):
+        """Undo :meth:`index_lexicon`."""
+        index = self.__dict__.pop("_lexicon_index", None)
+        if index is not None:
+            index.detach()
+
+    # TODO: join two corpora together
+
+class LazyCorpus(_Sentences):
+    """A corpus backed by a file, whose trees are parsed on first access.
+
+    The position of each tree in the file is recorded up front (see
+    :class:`lovett.offsets.OffsetIndex`), but a tree is only read and parsed
+    when it is iterated over or indexed.  Parsed trees are kept in a cache
+    of bounded size, from which the least recently used ones are dropped, so
+    that memory use has a ceiling.  Since a dropped tree is parsed afresh
+    the next time it is needed, changes made to trees are not persistent.
+
+    :param str path: The corpus file
+    :param str format: One of ``"psdx"``, ``"psd"`` or ``"deep"``.  By
+        default this is guessed from the file's extension.
+    :param int cache_size: The maximum number of parsed trees to keep
+
+    """
+
+    def __init__(self, path, format=None, cache_size=1024):
+        from .offsets import OffsetIndex
+        self._index = OffsetIndex(path, format)
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        spans = self._index.spans()
+        if i < 0:
+            i += len(spans)
+        if i < 0 or i >= len(spans):
+            raise IndexError("corpus index out of range")
+        try:
+            self._cache.move_to_end(i)
+            return self._cache[i]
+        except KeyError:
+            pass
+        from .offsets import parse_span
+        _, start, end = spans[i]
+        sentence = parse_span(self._index.path, start, end,
+                              self._index.format)
+        self._cache[i] = sentence
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return sentence
+
+    def get_sentence(self, sentence_id):
+        """Get a sentence by its ID.
+
+        :param str sentence_id: The ID of the sentence
+        :rtype: :class:`lovett.tree.Sentence`
+        :raises KeyError: if there is no such sentence
+
+        """
+        return self[self._index.position(sentence_id)]
+
+    def trees(self):
+        """Get iterator over trees in this corpus."""
+        for i in range(len(self)):
+            yield self[i]
 
 _lookup = etree.ElementNamespaceClassLookup()
 _ns = _lookup.get_namespace(None)
 # Annoyance: xml generated from a browser is typically case-insensitive,
 # whereas in Python-land case matters.  We define both upper and lowercase
 # versions, to be safe.
-for p in (("corpus", Corpus),
-          ("sentence", Sentence),
-          ("nonterminal", NonTerminal),
-          ("trace", Trace),
-          ("ec", Ec),
-          ("text", Text),
-          ("comment", Comment)):
+_classes = (("corpus", Corpus),
+            ("sentence", Sentence),
+            ("nonterminal", NonTerminal),
+            ("trace", Trace),
+            ("ec", Ec),
+            ("text", Text),
+            ("comment", Comment))
+for p in _classes:
     _ns[p[0]] = p[1]
     _ns[p[0].upper()] = p[1]
 parser = etree.XMLParser(remove_blank_text=True)
@@ -42,13 +253,314 @@ def parse_string(s):
     return _postprocess_parsed(r)
 
 def parse_file(file):
-    """Parse PSDX from a file."""
+    """Parse PSDX from a file.
+
+    :param file: a file name or file object.  Compressed files are
+        decompressed on the fly (see :mod:`lovett.compression`).
+
+    """
+    if isinstance(file, str) and is_compressed(file):
+        with open_file(file, "rb") as f:
+            return parse_file(f)
     r = etree.parse(file, parser=parser)
     return _postprocess_parsed(r)
 
+def iter_sentences(file):
+    """Iterate over the sentences of a PSDX file, one at a time.
+
+    Unlike :func:`parse_file`, this does not build the whole corpus in
+    memory.  Each sentence is detached from the document as soon as it has
+    been parsed, so it can be garbage collected once the caller drops its
+    reference to it, and memory use stays flat regardless of the size of
+    the corpus.
+
+    :param file: a file name or file object.  Compressed files are
+        decompressed on the fly (see :mod:`lovett.compression`).
+    :returns: the sentences of the corpus, in document order
+    :rtype: iterator of :class:`lovett.tree.Sentence`
+
+    """
+    if isinstance(file, str) and is_compressed(file):
+        with open_file(file, "rb") as f:
+            yield from iter_sentences(f)
+        return
+    context = etree.iterparse(file, events=("end",),
+                              tag=("sentence", "SENTENCE"),
+                              remove_blank_text=True)
+    context.set_element_class_lookup(_lookup)
+    for _, sentence in context:
+        parent = sentence.getparent()
+        if parent is not None:
+            parent.remove(sentence)
+        yield _postprocess_parsed(sentence)
+
+def parse_files(paths, workers=None, format=None, cache=None):
+    """Parse several corpus files into one corpus.
+
+    See :func:`iter_files`.
+
+    :param cache: whether to go through the on-disk cache of parsed corpora
+        for PSD and deep files (see :mod:`lovett.cache`).  ``True`` keeps
+        each cache entry next to its file; a string names a directory to
+        keep them in.
+    :rtype: :class:`Corpus`
+
+    """
+    if not cache:
+        return make_corpus(iter_files(paths, workers, format))
+    import lovett.cache
+    cache_dir = None if cache is True else cache
+
+    def sentences():
+        for path in paths:
+            fmt = format or _guess_format(path)
+            if fmt == "psdx":
+                yield from iter_sentences(path)
+            else:
+                root = lovett.cache.load_file(
+                    path, lambda p: parse_files([p], workers, fmt), fmt,
+                    cache_dir)
+                yield from list(root)
+    return make_corpus(sentences())
+
+def iter_files(paths, workers=None, format=None, chunk_size=500):
+    """Iterate over the sentences of several corpus files.
+
+    PSD and deep files are split into chunks of ``chunk_size`` trees, which
+    are parsed in a pool of worker processes.  PSDX files are parsed in this
+    process, since lxml's parser is already fast and sending the result
+    between processes would cost more than it saves.  Sentences are yielded
+    in their original order, and are identical to those produced by parsing
+    the files one at a time.
+
+    :param paths: The file names to parse
+    :param int workers: The number of processes to use (default: one per
+        CPU, unless ``lovett.parallel`` is ``False``)
+    :param str format: One of ``"psdx"``, ``"psd"`` or ``"deep"``.  By
+        default this is guessed from each file's extension.
+    :param int chunk_size: The number of trees to send to a worker at a time
+    :rtype: iterator of :class:`lovett.tree.Sentence`
+
+    """
+    from . import psd
+    if workers is None:
+        workers = default_workers()
+    if workers == 1:
+        for path in paths:
+            fmt = format or _guess_format(path)
+            if fmt == "psdx":
+                yield from iter_sentences(path)
+            else:
+                yield from psd.iter_psd_file(path, fmt)
+        return
+
+    submitted = collections.deque()
+
+    def tasks():
+        for path in paths:
+            fmt = format or _guess_format(path)
+            if fmt == "psdx":
+                task = (fmt, path)
+                submitted.append(task)
+                yield task
+            else:
+                with open_file(path, "r") as f:
+                    for chunk in psd._chunk_trees(f, chunk_size):
+                        task = (fmt, chunk)
+                        submitted.append(task)
+                        yield task
+
+    for result in imap_ordered(_parse_task, tasks(), workers):
+        fmt, data = submitted.popleft()
+        if fmt == "psdx":
+            yield from iter_sentences(data)
+        else:
+            for s in result:
+                yield etree.fromstring(s, parser)
+
+def make_corpus(sentences):
+    """Collect sentences into a new corpus.
+
+    Each sentence is moved out of any corpus it belongs to.
+
+    :param sentences: An iterable of sentences
+    :rtype: :class:`Corpus`
+
+    """
+    corpus = parser.makeelement("corpus")
+    for sentence in sentences:
+        corpus.append(sentence)
+    return corpus
+
+def _chunks(iterable, chunk_size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+def _copy(sentence):
+    # A copy of a sentence, made as the worker processes make theirs
+    return etree.fromstring(etree.tostring(sentence, with_tail=False), parser)
+
+def map_sentences(fn, sentences, workers=None, chunk_size=100):
+    """Apply a function to sentences in a pool of worker processes.
+
+    The sentences are sent to the workers ``chunk_size`` at a time, and the
+    results are yielded in the order of the input.  Sentences are read from
+    ``sentences`` only as fast as the workers get through them, so this
+    works with a stream of sentences (e.g. from :func:`iter_files`) as
+    well as with a corpus in memory.
+
+    ``fn`` runs on a copy of each sentence, in another process, so the
+    sentences passed in are never changed.  It may return an lxml element
+    (for instance the sentence, after transforming it), which is copied
+    back into a new element here, or any picklable value.
+
+    :param fn: The function to apply; it must be picklable (i.e. defined at
+        the top level of a module, or a :func:`functools.partial` of such a
+        function)
+    :param sentences: An iterable of sentences
+    :param int workers: The number of processes to use (default: one per
+        CPU, unless ``lovett.parallel`` is ``False``).  If 1, ``fn`` runs in
+        this process, but still on a copy of each sentence, so the result
+        does not depend on the number of CPUs.
+    :param int chunk_size: The number of sentences to send to a worker at a
+        time
+    :rtype: iterator
+
+    """
+    if workers is None:
+        workers = default_workers()
+    if workers == 1:
+        for s in sentences:
+            yield fn(_copy(s))
+        return
+    tasks = ((fn, [etree.tostring(s, with_tail=False) for s in chunk])
+             for chunk in _chunks(sentences, chunk_size))
+    for results in imap_ordered(_map_task, tasks, workers):
+        for is_element, r in results:
+            yield etree.fromstring(r, parser) if is_element else r
+
+def _map_task(task):
+    # Runs in a worker process.  lxml elements cannot be pickled, so they
+    # travel in both directions as XML.
+    fn, chunk = task
+    results = []
+    for data in chunk:
+        r = fn(etree.fromstring(data, parser))
+        if isinstance(r, etree._Element):
+            results.append((True, etree.tostring(r, with_tail=False)))
+        else:
+            results.append((False, r))
+    return results
+
+def _holds(r):
+    # Search functions return the node they matched, and an element's
+    # truth value is whether it has children.
+    return isinstance(r, etree._Element) or bool(r)
+
+def filter_sentences(pred, sentences, workers=None, chunk_size=100):
+    """Iterate over the sentences for which a predicate holds, testing them
+    in a pool of worker processes.
+
+    This yields the sentences passed in, not copies, in their original
+    order; only the predicate's verdicts come back from the workers.  The
+    predicate itself runs on a copy of each sentence, even with one
+    worker, as in :func:`map_sentences`, so a predicate which changes the
+    sentence does not change the result.  A predicate holds when it returns
+    an lxml element (as search functions do) or another true value.  See
+    :func:`map_sentences` for the parameters.
+
+    :rtype: iterator of :class:`lovett.tree.Sentence`
+
+    """
+    if workers is None:
+        workers = default_workers()
+    if workers == 1:
+        for s in sentences:
+            if _holds(pred(_copy(s))):
+                yield s
+        return
+    submitted = collections.deque()
+
+    def tasks():
+        for chunk in _chunks(sentences, chunk_size):
+            submitted.append(chunk)
+            yield pred, [etree.tostring(s, with_tail=False) for s in chunk]
+
+    for verdicts in imap_ordered(_filter_task, tasks(), workers):
+        for s, keep in zip(submitted.popleft(), verdicts):
+            if keep:
+                yield s
+
+def _filter_task(task):
+    # Runs in a worker process
+    pred, chunk = task
+    return [_holds(pred(etree.fromstring(data, parser))) for data in chunk]
+
+def _parse_task(task):
+    if task[0] == "psdx":
+        return None
+    from . import psd
+    return psd._parse_chunk(task)
+
+_offset_indices = {}
+
+def get_sentence(path, sentence_id, format=None):
+    """Read a single sentence from a corpus file, by ID.
+
+    This uses an :class:`lovett.offsets.OffsetIndex` stored next to the
+    file, which is built the first time it is needed and whenever the file
+    changes.  After that, only the requested tree is read and parsed.
+
+    :param str path: The corpus file
+    :param str sentence_id: The ID of the sentence
+    :param str format: One of ``"psdx"``, ``"psd"`` or ``"deep"``.  By
+        default this is guessed from the file's extension.
+    :rtype: :class:`lovett.tree.Sentence`
+    :raises KeyError: if there is no such sentence
+
+    """
+    from .offsets import OffsetIndex
+    key = (os.path.abspath(path), format)
+    index = _offset_indices.get(key)
+    if index is None:
+        index = _offset_indices[key] = OffsetIndex(path, format)
+    return index.get_sentence(sentence_id)
+
+_formats = {".psdx": "psdx", ".psd": "psd", ".deep": "deep"}
+
+def _guess_format(path):
+    ext = os.path.splitext(strip_extension(path))[1].lower()
+    try:
+        return _formats[ext]
+    except KeyError:
+        raise ValueError("cannot guess the format of %s" % path)
+
+_node_tags = tuple(p[0] for p in _classes) + ("meta",)
+_upper_node_tags = tuple(t.upper() for t in _node_tags)
+
 def _postprocess_parsed(r):
-    for x in r.iter():
+    # Lower-case all tags.  Most of the cost of a pass over the tree is
+    # lxml creating a Python proxy for each element we touch.  Upper-case
+    # input (e.g. from a browser) needs every element renamed anyway, but
+    # for lower-case input it is enough to let lxml's C-level iterator pick
+    # out any upper-case node tags, and to visit only the free-form keys
+    # inside metadata.
+    root = r.getroot() if isinstance(r, etree._ElementTree) else r
+    if not root.tag.islower():
+        for x in r.iter(etree.Element):
+            x.tag = x.tag.lower()
+        return r
+    for x in r.iter(*_upper_node_tags):
         x.tag = x.tag.lower()
+    for m in r.iter("meta"):
+        for x in m.iterdescendants(etree.Element):
+            t = x.tag
+            if not t.islower():
+                x.tag = t.lower()
     return r
 
 _psdx_rng = None
@@ -4,10 +4,16 @@ import sys
 import inspect
 import random
 import operator
+import functools
 
 from ..util import (is_leaf, index, is_trace, iter_flatten, is_text, index_type)
-
-from functools import reduce
+from ..frozen import FrozenNode
+from ..tree import label_string
+from .. import tree as _tree
+from ..spans import span_index
+from ..labels import label_index
+from ..lexicon import lexical_index
+from ..coindex import coindex_table
 
 __docformat__ = "restructuredtext en"
 
@@ -21,7 +27,18 @@ def public(f):  # pragma: no cover
     all = sys.modules[f.__module__].__dict__.setdefault('__all__', [])
     if f.__name__ not in all:  # Prevent duplicates if run from an IDE.
         all.append(f.__name__)
-    return f
+    if not inspect.isfunction(f):
+        return f
+
+    # Remember how each search function was made, so that
+    # SearchFunction.compile can make it again with compiled arguments.
+    @functools.wraps(f)
+    def _public(*args, **kwargs):
+        r = f(*args, **kwargs)
+        if isinstance(r, SearchFunction):
+            r._factory = (f, args, kwargs)
+        return r
+    return _public
 
 # Match functions
 
@@ -40,10 +57,21 @@ class SearchFunction:
         self.fn_str = fn_str
         self.arg = arg
         self.full_str = full_str
+        # The structure the compiler looks at: the operator and operands
+        # of a combination, the factory call which made the function, and
+        # the label test of hasLabel.
+        self._op = None
+        self._factory = None
+        self._label_matches = None
+        # A test which a label or lexical index can answer: every node fn
+        # matches must pass it.
+        self._seed = None
+        # Label tests and boolean combinations are cheaper to recompute
+        # than to look up in a Memo.
+        self._memoize = True
 
     # is this the place to put the ignore logic?
     def __call__(self, arg):
-        # TODO: memoize
         # This if statement is so that non-results percolate through a chained
         # function.
         if arg is not None:
@@ -55,6 +83,8 @@ class SearchFunction:
                 # and remove.
                 raise Exception("isinstance in __call__, arg is %s" % arg)
                 return map(self.fn, arg)
+            elif _memo is not None and self._memoize:
+                return _memo.call(self, arg)
             else:
                 return self.fn(arg)
         else:
@@ -68,8 +98,11 @@ class SearchFunction:
                 return res
             else:
                 return other(t)
-        return SearchFunction(_and,
-                              full_str="%s & %s" % (str(self), str(other)))
+        r = SearchFunction(_and,
+                           full_str="%s & %s" % (str(self), str(other)))
+        r._op = ("and", (self, other))
+        r._memoize = False
+        return r
 
     def __or__(self, other):
         def _or(t):
@@ -78,8 +111,11 @@ class SearchFunction:
                 return res
             else:
                 return other(t)
-        return SearchFunction(_or,
-                              full_str="%s | %s" % (str(self), str(other)))
+        r = SearchFunction(_or,
+                           full_str="%s | %s" % (str(self), str(other)))
+        r._op = ("or", (self, other))
+        r._memoize = False
+        return r
 
     def __invert__(self):
         def _not(t):
@@ -87,13 +123,139 @@ class SearchFunction:
                 return None
             else:
                 return t
-        return SearchFunction(_not, full_str="~%s" % str(self))
+        r = SearchFunction(_not, full_str="~%s" % str(self))
+        r._op = ("not", (self,))
+        r._memoize = False
+        return r
+
+    def compile(self):
+        """Return an equivalent search function which runs faster.
+
+        The combinations made with ``&``, ``|`` and ``~`` become one
+        function, in which the boolean logic is inlined and a node's label
+        is looked up once for all the ``hasLabel`` tests on it.  The
+        arguments of functions such as :func:`deep` or :func:`hasParent`
+        are compiled in turn.  The compiled function finds the same nodes,
+        and prints the same, as the original.
+
+        :rtype: :class:`SearchFunction`
+
+        """
+        if getattr(self, "_compiled", False):
+            return self
+        r = SearchFunction(_compile(self), full_str=str(self))
+        r._compiled = True
+        return r
 
     def __str__(self):
         if self.full_str is not None:
             return self.full_str
         return "%s(%s)" % (self.fn_str, _get_arg_string(self.arg))
 
+# The memo table in use, if any; see Memo
+_memo = None
+
+@public
+class Memo(object):
+    """A table of search function results, to avoid computing them twice.
+
+    Queries such as ``hasDaughter(hasSister(...))`` test the same
+    predicate on the same node many times.  While a memo is in use (as a
+    context manager, or through the ``memo`` argument of
+    :meth:`lovett.cs.transformer.TreeTransformer.findNodes`), each search
+    function remembers its result for each node it is called on.  The
+    table is emptied on leaving the ``with`` block, so that it covers one
+    run of a query over one sentence.  When a tree changes inside the
+    block, the results for its nodes are forgotten (see
+    :func:`lovett.tree.invalidate_hashes`).  The counters are kept, so that
+    one memo can collect them over a whole corpus.
+
+    Label tests and ``&``, ``|`` and ``~`` are not memoized, since they
+    cost less than a lookup in the table.  The table keeps the nodes and
+    search functions it has seen alive.
+    Compiled queries (see :meth:`SearchFunction.compile`) do not go
+    through the table inside, only at their outermost call.
+
+    Usage::
+
+        memo = Memo()
+        for s in corpus:
+            with memo:
+                matches = query(s.tree())
+        print(memo.hits, memo.misses)
+
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._table = {}
+        self._generation = _tree._generation
+        self._outer = None
+
+    def call(self, fn, node):
+        """Return ``fn(node)``, computing it only once.
+
+        :param fn: The search function
+        :type fn: :class:`SearchFunction`
+        :param node: The node, not ``None``
+
+        """
+        if self._generation != _tree._generation:
+            # A change which _forget was not told about
+            self._table.clear()
+            self._generation = _tree._generation
+        # lxml nodes are keyed by identity, which is safe because the entry
+        # keeps the node alive; frozen nodes get a new handle each time, so
+        # they are keyed by position.
+        frozen = type(node) is FrozenNode
+        key = (id(fn), node if frozen else id(node))
+        e = self._table.get(key)
+        if e is not None and (frozen or e[1] is node):
+            self.hits += 1
+            r = e[2]
+            # Callers may extend the lists returned by deep() and friends
+            return list(r) if isinstance(r, list) else r
+        self.misses += 1
+        r = fn.fn(node)
+        self._table[key] = (fn, node, r)
+        return r
+
+    def clear(self):
+        """Forget the results remembered so far (but not the counters)."""
+        self._table.clear()
+
+    def _forget(self, owner):
+        # Called by lovett.tree._changed, while the memo is in use, before
+        # the tree of owner changes: forget the results for its nodes.  The
+        # results for nodes of other trees do not depend on it.
+        for key, e in list(self._table.items()):
+            node = e[1]
+            if type(node) is not FrozenNode and _tree._owner(node) is owner:
+                del self._table[key]
+        self._generation = _tree._generation
+
+    def __len__(self):
+        return len(self._table)
+
+    def __enter__(self):
+        global _memo
+        self._outer = _memo
+        _memo = self
+        _tree._change_hooks.append(self._forget)
+        return self
+
+    def __exit__(self, *exc):
+        global _memo
+        _memo = self._outer
+        self._outer = None
+        _tree._change_hooks.remove(self._forget)
+        self.clear()
+        return False
+
+    def __repr__(self):
+        return "<Memo: %d hits, %d misses>" % (self.hits, self.misses)
+
 # TODO: add below methods to (subclass of) ParentedTree?
 
 # Ignoring things
@@ -126,17 +288,17 @@ sister_fn_map = {
 }
 def allLeftSisters(t):
     res = []
-    while t:
+    while t is not None:
         t = t.left_sibling()
-        if t and not shouldIgnore(t):
+        if t is not None and not shouldIgnore(t):
             res.append(t)
     return res
 
 def allRightSisters(t):
     res = []
-    while t:
+    while t is not None:
         t = t.right_sibling()
-        if t and not shouldIgnore(t):
+        if t is not None and not shouldIgnore(t):
             res.append(t)
     return res
 
@@ -146,7 +308,7 @@ def allSisters(t):
 
 def nextLeftSister(t):
     res = None
-    while not res and t:
+    while res is None and t is not None:
         t = t.left_sibling()
         if not shouldIgnore(t):
             res = t
@@ -154,7 +316,7 @@ def nextLeftSister(t):
 
 def nextRightSister(t):
     res = None
-    while not res and t:
+    while res is None and t is not None:
         t = t.right_sibling()
         if not shouldIgnore(t):
             res = t
@@ -226,23 +388,39 @@ def hasLabel(label, exact=False):
         extra trailing dash tags.
 
     """
+    # Whether a label matches depends only on the label, so the answer is
+    # remembered for each label id; after the first node with a given label,
+    # matching costs an integer lookup.
+    matches = _LabelMatches(label, exact)
+
     def _hasLabel(t):
-        to_match = t.label()
+        return t if matches[t.label_id()] else None
+    r = SearchFunction(_hasLabel, label)
+    r._label_matches = matches
+    r._seed = matches
+    r._memoize = False
+    return r
 
-        if hasattr(label, "match"):
-            if label.match(to_match):
-                return t
-            else:
-                return None
+class _LabelMatches(dict):
+    # Whether each label id matches a hasLabel test, filled in on demand
+    def __init__(self, label, exact):
+        self.label = label
+        self.exact = exact
+        self.prefix = None if hasattr(label, "match") else label + "-"
+
+    def __missing__(self, i):
+        if i is None:
+            # A node without a label (a frozen sentence)
+            self[i] = False
+            return False
+        to_match = label_string(i)
+        if self.prefix is None:
+            r = bool(self.label.match(to_match))
         else:
-            exact_match = label == to_match
-            if exact_match:
-                return t
-            elif not exact and to_match.startswith(label + "-"):
-                return t
-            else:
-                return None
-    return SearchFunction(_hasLabel, label)
+            r = self.label == to_match or \
+                (not self.exact and to_match.startswith(self.prefix))
+        self[i] = r
+        return r
 
 class StartsWith:
     def __init__(self, string):
@@ -256,6 +434,25 @@ class StartsWith:
 def startsWith(string):
     return StartsWith(string)
 
+class _LexicalTest(object):
+    # What hasText, hasWord or hasLemma looks for: the text of a leaf or
+    # its LEMMA metadata (field), and how the value is matched.  A
+    # lovett.lexicon.LexicalIndex uses the same test to pick the matching
+    # words or lemmas of its vocabulary.
+    def __init__(self, field, pattern, dashes=False):
+        self.field = field
+        self.pattern = pattern
+        self.regex = hasattr(pattern, "match")
+        self.prefix = pattern + "-" if dashes and not self.regex else None
+
+    def match(self, value):
+        if value is None:
+            return False
+        if self.regex:
+            return bool(self.pattern.match(value))
+        return value == self.pattern or \
+            (self.prefix is not None and value.startswith(self.prefix))
+
 # TODO: handle ignore
 # TODO: rename to hasText?
 @public
@@ -272,25 +469,16 @@ def hasText(text):
         trailing dash tags removed.
 
     """
+    test = _LexicalTest("text", text, dashes=True)
+
     def _hasText(t):
-        if is_leaf(t):
-            if hasattr(text, "match"):
-                if text.match(t.text()):
-                    return t
-                else:
-                    return None
-            else:
-                exact_match = text == t.text()
-                if exact_match:
-                    return t
-                else:
-                    if t.text[slice(len(text) + 1)] == text + "-":
-                        return t
-                    else:
-                        return None
+        if is_leaf(t) and test.match(t.text):
+            return t
         else:
             return None
-    return SearchFunction(_hasText, text)
+    r = SearchFunction(_hasText, text)
+    r._seed = test
+    return r
 
 # default_ignore_function = hasLabel("CODE") | hasLabel("ID") # ...
 @public
@@ -301,46 +489,35 @@ def hasLemma(lemma):
         a string (the latter is matched exactly against the lemma).
 
     """
+    test = _LexicalTest("lemma", lemma)
+
     def _hasLemma(t):
-        if not is_leaf(t):
-            return None
-        try:
-            the_lemma = t.metadata()['LEMMA']
-        except KeyError:
-            return None
-        if hasattr(lemma, "match"):
-            if lemma.match(the_lemma):
-                return t
-            else:
-                return None
+        if is_leaf(t) and test.match(t.get_meta('LEMMA')):
+            return t
         else:
-            if the_lemma == lemma:
-                return t
-            else:
-                return None
-    return SearchFunction(_hasLemma, lemma)
-
-# TODO: make aware of different formats (deep, dash)
-# is this redundant with hasLeafLabel?  Should this be called hasText?
+            return None
+    r = SearchFunction(_hasLemma, lemma)
+    r._seed = test
+    return r
 
-# TODO: doesn't work with startswith and friends. should be refactored for new
-# tree impl
 @public
 def hasWord(word):
     """Tests if a node has the given word (exact text).
 
-    :param word: the text to look for.  Matched rigidly against the
-        ur-text of the leaf node.  No match if the target node is not a
-        leaf.
+    :param word: the text to look for.  Matched rigidly against the text
+        of the leaf node, or a regular expression (or :func:`startsWith`)
+        to match it with.  No match if the target node is not a leaf.
 
     """
-    if hasattr(word, "pattern"):
-        word = word.pattern
-    else:
-        word = re.escape(word)
-    r = hasLeafLabel(re.compile("^(" + word + ")-"))
-    r.fn_str = "hasWord"
-    r.arg = word
+    test = _LexicalTest("text", word)
+
+    def _hasWord(t):
+        if is_leaf(t) and test.match(t.text):
+            return t
+        else:
+            return None
+    r = SearchFunction(_hasWord, word)
+    r._seed = test
     return r
 
 @public
@@ -420,7 +597,7 @@ def hasXSister(fn=identity, sister_fn=allSisters):
         sisters = sister_fn(t)
         if sisters:
             vals = [fn(s) for s in sisters]
-            if reduce(functionalOr, vals):
+            if any(v is not None for v in vals):
                 return t
             else:
                 return None
@@ -481,7 +658,7 @@ def sistersX(fn=identity, sister_fn=allSisters):
     """
     def _sisters(t):
         vals = [fn(s) for s in sister_fn(t)]
-        return [v for v in vals if v]
+        return [v for v in vals if v is not None]
     r = SearchFunction(_sisters, fn)
     s = sister_fn_map[sister_fn.__name__]
     if not s.startswith("imm"):
@@ -561,6 +738,14 @@ def parent(fn=identity):
         return fn(p)
     return SearchFunction(_parent, fn)
 
+def _ancestors(t):
+    # The ancestors of t, nearest first, stopping below the sentence node.
+    # A span index would not help here: fn must be called on each of them.
+    p = t.getparent()
+    while p is not None and p.tag != "sentence":
+        yield p
+        p = p.getparent()
+
 @public
 def hasAncestor(fn=identity):
     """Tests if any of a node's ancestors match a predicate, and returns
@@ -570,14 +755,10 @@ def hasAncestor(fn=identity):
 
     """
     def _hasAncestor(t):
-        if t is not None:
-            res = hasParent(fn)(t)
-            if res is not None or hasAncestor(fn)(t.getparent()) is not None:
+        for p in _ancestors(t):
+            if fn(p) is not None:
                 return t
-            else:
-                return None
-        else:
-            return None
+        return None
     return SearchFunction(_hasAncestor, fn)
 
 @public
@@ -589,17 +770,10 @@ def ancestor(fn=identity):
 
     """
     def _ancestor(t):
-        # All these null checks should be able to be factored out.  but then
-        # we have to call through the wrapped fn, not the underscore version
-        # as is done here.
-        if t:
-            p = t.getparent()
-            if fn(p):
+        for p in _ancestors(t):
+            if fn(p) is not None:
                 return p
-            else:
-                return _ancestor(p)
-        else:
-            return None
+        return None
     return SearchFunction(_ancestor, fn)
 
 def leftEdge(fn=identity):
@@ -611,10 +785,13 @@ def leftEdge(fn=identity):
     def _leftEdge(t):
         if fn(t) is not None:
             return t
-        down_left = t[0]
-        while shouldIgnore(down_left) and down_left.right_sibling():
+        if t.tag != "nonterminal":
+            return None
+        down_left = next(t.children(), None)
+        while down_left is not None and shouldIgnore(down_left) and \
+              down_left.right_sibling() is not None:
             down_left = down_left.right_sibling()
-        if isinstance(down_left, T.Tree):
+        if down_left is not None:
             return leftEdge(fn)(down_left)
         else:
             return None
@@ -629,6 +806,14 @@ def iPrecedes(fn=identity):
 
     """
     def _iPrecedes(t):
+        spans = span_index(t)
+        if spans is not None:
+            # The nodes beginning right after t: the next node in preorder
+            # and its chain of first daughters.
+            for x in spans.left_edge_after(t):
+                if fn(x) is not None:
+                    return t
+            return None
         this_node = t
         while this_node is not None:
             next_node = this_node.right_sibling()
@@ -638,6 +823,7 @@ def iPrecedes(fn=identity):
             if next_node is not None:
                 if leftEdge(fn)(next_node) is not None:
                     return t
+                return None
             this_node = this_node.getparent()
             if this_node.tag == "sentence":
                 this_node = None
@@ -699,6 +885,17 @@ def daughterCount(n, match="equal"):
             return None
     return SearchFunction(_daughterCount, "%s, match='%s'" % (n, match))
 
+def _same_node(x, y):
+    # lxml hands out the same proxy for a node as long as one is alive, but
+    # frozen nodes get a new handle each time, and compare by position.
+    return x is y or (isinstance(x, FrozenNode) and x == y)
+
+def _coindexed_with(t, the_idx):
+    # The other nodes of t's tree which bear the index the_idx, from the
+    # tree's coindexation table
+    return [x for x in coindex_table(t).nodes(the_idx)
+            if not _same_node(x, t)]
+
 @public
 def coIndexed(fn=identity):
     """Tests if any nodes coindexed with the original node match a
@@ -709,12 +906,10 @@ def coIndexed(fn=identity):
     """
     def _coIndexed(t):
         the_idx = index(t)
-        if the_idx == 0:
+        if the_idx is None:
             return None
-        c = t.root.subtrees(lambda x: index(x) == the_idx and
-                            x != t)
-        c = list(c)
-        c = filter(fn, c)
+        c = _coindexed_with(t, the_idx)
+        c = [x for x in c if fn(x) is not None]
         return c
     return SearchFunction(_coIndexed, fn)
 
@@ -728,12 +923,10 @@ def hasCoIndexed(fn=identity):
     """
     def _hasCoIndexed(t):
         the_idx = index(t)
-        if the_idx == 0:
+        if the_idx is None:
             return None
-        c = t.root.subtrees(lambda x: index(x) == the_idx and
-                            x != t)
-        c = list(c)
-        c = filter(fn, c)
+        c = _coindexed_with(t, the_idx)
+        c = [x for x in c if fn(x) is not None]
         if c and len(c) > 0:
             return t
         else:
@@ -753,12 +946,11 @@ def antecedent(fn=identity):
     # TODO: test whether the target node is a trace
     def _antecedent(t):
         the_idx = index(t)
-        if the_idx == 0:
+        if the_idx is None:
             return None
-        c = t.root.subtrees(lambda x: index(x) == the_idx)
-        c = list(c)
+        c = _coindexed_with(t, the_idx)
         if len(c) == 1:
-            if fn(c[0]):
+            if fn(c[0]) is not None:
                 return c[0]
             else:
                 return None
@@ -778,13 +970,11 @@ def hasAntecedent(fn=identity):
     """
     def _hasAntecedent(t):
         the_idx = index(t)
-        if the_idx == 0:
+        if the_idx is None:
             return None
-        c = t.root.subtrees(lambda x: index(x) == the_idx)
-        # Need to convert generator -> list to check length
-        c = list(c)
+        c = _coindexed_with(t, the_idx)
         if len(c) == 1:
-            if fn(c[0]):
+            if fn(c[0]) is not None:
                 return t
             else:
                 return None
@@ -841,12 +1031,12 @@ def sharesLabelWith(fn=identity, all=False):
 
     """
     def _sharesLabelWith(t):
-        the_label = t.node
+        the_label = t.label_id()
         candidates = fn(t)
         # TODO: If we mandated that searchfns return lists, then there
         # would be no need to do this...
         for c in iter_flatten([candidates]):
-            if c.node == the_label:
+            if c.label_id() == the_label:
                 if not all:
                     return t
             else:
@@ -877,14 +1067,14 @@ def sharesLabelWithMod(fn=identity, all=False, comparator=operator.eq):
 
     """
     def _sharesLabelWithMod(t):
-        the_label = t.node
+        the_label = t.label()
         candidates = fn(t)
         if not candidates:
             return None
         # TODO: If we mandated that searchfns return lists, then there
         # would be no need to do this...
         for c in iter_flatten([candidates]):
-            if comparator(the_label, c.node):
+            if comparator(the_label, c.label()):
                 if not all:
                     return t
             else:
@@ -900,12 +1090,18 @@ def sharesLabelWithMod(fn=identity, all=False, comparator=operator.eq):
 
 @public
 def domsWords(n):
-    # TODO: doc
+    """Tests if a node dominates exactly ``n`` words (``text`` nodes),
+    counting the node itself if it is one.
+
+    :param int n: the number of words
+
+    """
     def _domsWords(t):
-        wds = 0
-        for x in t.pos:
-            if is_word(x):
-                wds += 1
+        spans = span_index(t)
+        if spans is not None:
+            wds = spans.word_count(t)
+        else:
+            wds = sum(1 for x in t.iter("text"))
         if wds == n:
             return t
         else:
@@ -940,11 +1136,17 @@ def deep(fn):
     :param fn: the predicate to deepen
 
     """
+    seed = _leading_seed(fn)
+
     def _deep(t):
         # TODO: We have null handling here is because we don't go
         # through SearchFunction again.  Should we?
         if t is not None:
-            ret = t.subtrees()
+            # Only the nodes which pass the leading label or lexical test
+            # can match, if an index can say which they are.
+            ret = None if seed is None else _seeded(seed, t)
+            if ret is None:
+                ret = t.subtrees()
             ret = map(fn, ret)
             # TODO: we don't want this forcing, but without it, we get buried
             # too deep in lists
@@ -964,6 +1166,146 @@ def ignoring(ignore_fn, fn):
     return SearchFunction(_ignoring, 'ignore_fn="%s", fn="%s"' %
                           (ignore_fn, fn))
 
+# Compiling search functions
+
+class _Compiler(object):
+    # Generates the source of one function for a tree of &, | and ~.  The
+    # operands which are not combinations are leaves: hasLabel tests become
+    # lookups in their _LabelMatches, and other search functions are called
+    # through their inner function, skipping SearchFunction.__call__ (the
+    # node is known not to be None there).
+
+    def __init__(self):
+        self.lines = []
+        self.names = {}
+        self.values = {}
+        self.n_vars = 0
+
+    def name(self, prefix, value, key=None):
+        # A name in the generated function's globals for value.  Values
+        # with the same key share a name.
+        if key is None:
+            key = ("id", id(value))
+        name = self.names.get(key)
+        if name is None:
+            name = self.names[key] = "%s%d" % (prefix, len(self.names))
+            self.values[name] = value
+        return name
+
+    def var(self):
+        self.n_vars += 1
+        return "v%d" % self.n_vars
+
+    def emit(self, line, depth):
+        self.lines.append("    " * depth + line)
+
+    def operands(self, op, fns):
+        # Flatten (a & b) & c into a & b & c
+        for fn in fns:
+            if isinstance(fn, SearchFunction) and fn._op is not None and \
+               fn._op[0] == op:
+                for x in self.operands(op, fn._op[1]):
+                    yield x
+            else:
+                yield fn
+
+    def node(self, fn, target, depth, have_label):
+        # Emit code which sets target to the result of fn on t.  Returns
+        # whether the label id of t is in lid after this code has run.
+        if isinstance(fn, SearchFunction) and fn._op is not None:
+            op, fns = fn._op
+            if op == "not":
+                v = self.var()
+                have_label = self.node(fns[0], v, depth, have_label)
+                self.emit("%s = t if %s is None else None" % (target, v),
+                          depth)
+                return have_label
+            test = "is not None" if op == "and" else "is None"
+            fns = list(self.operands(op, fns))
+            # Only the first operand is sure to run.
+            have_label = self.node(fns[0], target, depth, have_label)
+            known = have_label
+            for x in fns[1:]:
+                self.emit("if %s %s:" % (target, test), depth)
+                depth += 1
+                known = self.node(x, target, depth, known)
+            return have_label
+        if isinstance(fn, SearchFunction) and fn._label_matches is not None:
+            m = fn._label_matches
+            try:
+                key = ("label", m.label, m.exact)
+                hash(key)
+            except TypeError:
+                key = None
+            name = self.name("L", m, key)
+            if not have_label:
+                self.emit("lid = t.label_id()", depth)
+            self.emit("%s = t if %s[lid] else None" % (target, name), depth)
+            return True
+        if fn is identity:
+            self.emit("%s = t" % target, depth)
+        else:
+            self.emit("%s = %s(t)" % (target, self.name("f", _leaf(fn))),
+                      depth)
+        return have_label
+
+def _leading_seed(fn):
+    # The label or lexical test which every node matched by fn must pass,
+    # if fn is such a test or a & chain which starts with one
+    while isinstance(fn, SearchFunction):
+        if fn._seed is not None:
+            return fn._seed
+        if fn._op is None or fn._op[0] != "and":
+            fn = fn.fn
+            break
+        fn = fn._op[1][0]
+    # Compiled functions remember the test of the query they came from
+    return getattr(fn, "seed", None)
+
+def _seeded(seed, t, include_node=False):
+    # The nodes below t (and t itself, if include_node) which may pass the
+    # test seed, in document order, from the index of t's corpus; None if
+    # there is no index to ask
+    if isinstance(seed, _LexicalTest):
+        index = lexical_index(t)
+    else:
+        index = label_index(t)
+    if index is None:
+        return None
+    return index._find(seed, t, include_node)
+
+def _leaf(fn):
+    # The function to call for an operand, with its search function
+    # arguments compiled
+    if not isinstance(fn, SearchFunction):
+        return fn
+    if fn._factory is not None:
+        f, args, kwargs = fn._factory
+        if any(isinstance(x, SearchFunction)
+               for x in list(args) + list(kwargs.values())):
+            args = [_compile(x) if isinstance(x, SearchFunction) else x
+                    for x in args]
+            kwargs = {k: _compile(x) if isinstance(x, SearchFunction) else x
+                      for k, x in kwargs.items()}
+            fn = f(*args, **kwargs)
+    return fn.fn
+
+def _compile(fn):
+    # Return a plain function equivalent to the search function fn
+    c = _Compiler()
+    c.node(fn, "v0", 1, False)
+    source = "\n".join(["def _query(t):",
+                         "    if t is None:",
+                         "        return None"] +
+                        c.lines +
+                        ["    return v0"])
+    namespace = dict(c.values)
+    exec(source, namespace)
+    r = namespace["_query"]
+    r.source = source
+    r.seed = _leading_seed(fn)
+    return r
+
 # Utility functions
 
 # TODO: don't export these below
@@ -5,23 +5,195 @@ import lovett.util
 
 import itertools
 
-# TODO: addDashTag
 # TODO: look at conversations w jana for good ideas
 
+def _restore_attrib(node, attrib):
+    # Give node back the attributes saved by TreeTransformer._mutate_attrib.
+    # This goes behind the back of lovett.tree, so the caller must call
+    # invalidate_hashes afterwards.
+    node.attrib.clear()
+    node.attrib.update(attrib)
+    if getattr(node, "_label_id", None) is not None:
+        del node._label_id
+
 class TreeTransformer:
+    """Search a sentence and change the nodes found.
+
+    Changes are made to the sentence in place, but they can be undone.
+    Each change records only what is needed to undo it: the attributes of a
+    relabelled node, where a node was inserted, wrapped or pruned, or the
+    metadata of a coindexed node.  Changes which cannot be described so
+    simply save a copy of the subtree they touch (and only that subtree).
+    This makes speculative transformations cheap: make them, look at the
+    result, and roll back, without copying whole sentences up front.
+
+    Nodes put back by a rollback may be saved copies rather than the
+    original objects, so matches are forgotten.
+
+    :param sentence: The sentence to transform
+    :type sentence: :class:`lovett.tree.Sentence`
+
+    """
+
     def __init__(self, sentence):
         self._sentence = sentence
         self._tree = sentence.tree()
         self._matches = []
-        self._max_trace = lovett.util.largest_index(self._tree)
-        self._made_copy = False
+        # The largest coindex in the sentence, found when first needed
+        self._max_trace = None
+        # (path, saved) pairs, in the order they were saved, where saved is
+        # a copy of the subtree at path, a dict of the attributes of the
+        # node at path, or a tuple naming a change to undo there (see
+        # _record)
+        self._undo = []
+        # The nodes copied since the last snapshot, by id
+        self._saved = {}
+        # Whether what was computed from the sentence has been forgotten
+        self._invalidated = False
+
+    def _path(self, node):
+        # The child indices leading from the sentence to a node
+        path = []
+        while node is not self._sentence:
+            p = node.getparent()
+            if p is None:
+                raise ValueError("node is not in the sentence: %r" % node)
+            path.append(p.index(node))
+            node = p
+        path.reverse()
+        return path
+
+    def _mutate(self, node=None):
+        # Called before changing the subtree under node (by default, the
+        # whole sentence) in a way that leaves node itself in place.
+        # Changes made below may bypass the methods which keep cached
+        # hashes and indexes current, so what was computed from this
+        # sentence (and only this sentence) is forgotten, once.
+        if node is None:
+            node = self._sentence
+        if not self._invalidated:
+            lovett.tree.invalidate_hashes(self._sentence)
+            self._invalidated = True
+        if self._covered(node):
+            return
+        self._undo.append((self._path(node), copy.deepcopy(node)))
+        self._saved[id(node)] = node
+
+    def _mutate_attrib(self, node):
+        # Called before changing the attributes of node, and nothing else
+        if not self._covered(node):
+            self._undo.append((self._path(node), dict(node.attrib)))
+
+    def _record(self, parent, change):
+        # Called around a change made beneath parent through the methods of
+        # lovett.tree, which keep caches current themselves.  change is one
+        # of these, where i is the position of a daughter of parent:
+        #   ("insert", i)        a node was inserted at i: remove it
+        #   ("wrap", i)          the node at i was put over the node which
+        #                        was there: take it away
+        #   ("prune", i, old, n) old was removed from i, and its n
+        #                        daughters put there: put them back under it
+        #   ("meta", i, meta)    the metadata of the node at i was changed:
+        #                        put back meta, a copy of its meta element
+        #                        (or None)
+        if not self._covered(parent):
+            self._undo.append((self._path(parent), change))
+
+    def _record_meta(self, parent, i):
+        # Called before changing the metadata of the node at i
+        meta = parent[i].find("meta")
+        self._record(parent, ("meta", i, copy.deepcopy(meta)))
+
+    def _undo_change(self, parent, change):
+        kind, i = change[:2]
+        if kind == "insert":
+            parent.remove(parent[i])
+        elif kind == "wrap":
+            new = parent[i]
+            parent.replace(new, next(new.children()))
+        elif kind == "prune":
+            _, _, old, n = change
+            for d in parent[i:i + n]:
+                old.append(d)
+            parent.insert(i, old)
+        elif kind == "meta":
+            node = parent[i]
+            meta = node.find("meta")
+            if meta is not None:
+                node.remove(meta)
+            if change[2] is not None:
+                node.insert(0, change[2])
+
+    def _covered(self, node):
+        # Whether a copy of node, or of one of its ancestors, has been
+        # saved since the last snapshot.  Rolling it back also undoes any
+        # changes beneath it.
+        if not self._saved:
+            return False
+        p = node
+        while p is not None:
+            if id(p) in self._saved:
+                return True
+            if p is self._sentence:
+                break
+            p = p.getparent()
+        return False
+
+    def snapshot(self):
+        """Mark the current state of the sentence.
+
+        :returns: a token to pass to :meth:`rollback`
+
+        """
+        self._saved = {}
+        return len(self._undo)
+
+    def rollback(self, token=0):
+        """Undo the changes made since a snapshot.
+
+        :param int token: The value returned by :meth:`snapshot`.  By
+            default, every change since the transformer was created (or
+            since the last :meth:`commit`) is undone.
+
+        """
+        restored = False
+        while len(self._undo) > token:
+            path, saved = self._undo.pop()
+            node = self._sentence
+            for i in path:
+                node = node[i]
+            if isinstance(saved, dict):
+                _restore_attrib(node, saved)
+                restored = True
+            elif isinstance(saved, tuple):
+                self._undo_change(node, saved)
+            elif path:
+                node.getparent().replace(node, saved)
+            else:
+                node[:] = saved[:]
+                node.attrib.clear()
+                node.attrib.update(saved.attrib)
+                node.text = saved.text
+                restored = True
+        if restored:
+            lovett.tree.invalidate_hashes(self._sentence)
+        self._saved = {}
+        self._invalidated = False
+        self._tree = self._sentence.tree()
+        self._matches = []
+        return self
+
+    def commit(self):
+        """Keep the changes made so far, and forget the saved copies."""
+        self._undo = []
+        self._saved = {}
+        return self
 
-    def _mutate(self):
-        pass
-    # TODO: worry about this
-        # if not self._made_copy:
-        #     self._tree = copy.deepcopy(self.tree())
-        #     self._made_copy = True
+    def _leaf(self, label, word):
+        leaf = self._tree.makeelement("text")
+        leaf.set_label(label)
+        leaf.text = word
+        return leaf
 
     # remove me?
     def _testPos(self, p, fn):
@@ -33,9 +205,37 @@ class TreeTransformer:
     # TODO: add depth argument to allow restricting the depth of
     # searches and/or add "findFromRoot" which only calls the predicate
     # with the root node
-    def findNodes(self, fn=lambda x: x, deep=True):
+    def findNodes(self, fn=lambda x: x, deep=True, memo=None):
+        """Find the nodes of the sentence which match a search function.
+
+        :param fn: The search function
+        :param bool deep: Whether to call ``fn`` on every node of the
+            tree, or only on the daughters of its root
+        :param memo: If given, the search function results are remembered
+            for the duration of this search
+        :type memo: :class:`lovett.cs.searchfns.Memo`
+
+        If the sentence's corpus has a label index (see
+        :meth:`lovett.corpus.Corpus.index_labels`) and ``fn`` starts with a
+        ``hasLabel`` test, only the nodes with matching labels are visited,
+        and likewise for a lexical index (see
+        :meth:`lovett.corpus.Corpus.index_lexicon`) and ``hasText``,
+        ``hasWord`` or ``hasLemma``.
+
+        """
+        if memo is not None:
+            with memo:
+                return self.findNodes(fn, deep)
+        from lovett.cs.searchfns import (_leading_seed, _seeded)
         self._matches = []
-        if deep:
+        seed = _leading_seed(fn) if deep else None
+        seeded = None if seed is None else \
+            _seeded(seed, self._tree, include_node=True)
+        if seeded is not None:
+            # Only the nodes which pass the query's leading label or
+            # lexical test
+            to_match = seeded
+        elif deep:
             # TODO: kludge!
             to_match = itertools.chain([self._tree], self._tree.subtrees())
         else:
@@ -78,18 +278,21 @@ class TreeTransformer:
     # matches in a coherent way.  Ex. prune should empty matches.
 
     def addParentNode(self, name, move_index=False):
-        self._mutate()
         for m in self._matches:
-            barf = lovett.tree.ParentedTree("BARF", [])
-            t = self._tree
-            pos = m.treepos
-            old = t[pos]
-            t[pos] = barf
-            new = lovett.tree.ParentedTree(name, [old])
-            if move_index:
-                index = lovett.util.remove_index(old)
-                lovett.util.set_index(new, index)
-            t[pos] = new
+            p = m.getparent()
+            i = p.index(m)
+            index = lovett.util.index(m) if move_index else None
+            if index is not None:
+                self._record_meta(p, i)
+            new = m.makeelement("nonterminal")
+            new.set_label(name)
+            p.replace(m, new)
+            new.append(m)
+            self._record(p, ("wrap", i))
+            if index is not None:
+                idxtype = lovett.util.index_type(m)
+                lovett.util.remove_index(m)
+                lovett.util.set_index(new, index, idxtype)
         return self
 
     def addParentNodeSpanning(self, name, fn, immediate=False, right=True,
@@ -150,6 +353,7 @@ class TreeTransformer:
     # Instead of immediate -- another function extendOne?
     # also need more general movt fns.
     def extendUntil(self, fn, immediate=False, right=True):
+        self._mutate()
         for m in self._matches:
             p = m
             acc = []
@@ -176,51 +380,83 @@ class TreeTransformer:
         return self
 
     def changeLabel(self, label="XXX"):
-        self._mutate()
-        if hasattr(label, "__call__"):
-            for m in self._matches:
-                m.label = label(m.label)
-        else:
-            for m in self._matches:
-                m.label = label
+        for m in self._matches:
+            self._mutate_attrib(m)
+            if hasattr(label, "__call__"):
+                m.set_label(label(m.label()))
+            else:
+                m.set_label(label)
+        return self
+
+    def addDashTag(self, tag):
+        """Add a dash tag to the end of the label of each match.
+
+        The XML form keeps only one dash tag in the ``subcategory``
+        attribute of a node (see :meth:`lovett.tree.TreeNode.set_label`), so
+        a further tag is added to the end of it: ``NP-SBJ`` becomes
+        ``NP-SBJ-FLAG``, with subcategory ``SBJ-FLAG``.
+
+        :param str tag: The dash tag, without the dash
+
+        """
+        for m in self._matches:
+            self._mutate_attrib(m)
+            sub = m.get("subcategory")
+            m.set("subcategory", tag if sub is None else sub + "-" + tag)
         return self
 
     def addSister(self, label="XXX", word="X-X", tree=None, before=True,
                   coindex=False):
-        self._mutate()
         for m in self._matches:
-            p = m.parent
-            pi = m.parent_index
-            to_insert = tree or lovett.tree.ParentedTree(label, [word])
+            p = m.getparent()
+            if tree is None:
+                to_insert = self._leaf(label, word)
+            else:
+                to_insert = copy.deepcopy(tree)
             if coindex:
+                self._record_meta(p, p.index(m))
+                if self._max_trace is None:
+                    self._max_trace = \
+                        lovett.util.largest_index(self._tree) or 0
                 index = self._max_trace + 1
                 # TODO(?): a way to add gapping indices with = instead of -
-                lovett.util.set_index(m, index)
-                lovett.util.set_index(to_insert, index)
+                lovett.util.set_index(m, str(index), "regular")
+                lovett.util.set_index(to_insert, str(index), "regular")
                 self._max_trace = index
-            if not before:
-                pi = pi + 1
-            p.insert(pi, to_insert)
+            if before:
+                m.addprevious(to_insert)
+            else:
+                m.addnext(to_insert)
+            self._record(p, ("insert", p.index(to_insert)))
         return self
 
     def addDaughter(self, label="XXX", word="X-X", tree=None):
-        self._mutate()
         for m in self._matches:
-            to_insert = tree or lovett.tree.ParentedTree(label, [word])
-            m.insert(0, to_insert)
+            if tree is None:
+                to_insert = self._leaf(label, word)
+            else:
+                to_insert = copy.deepcopy(tree)
+            first = next(m.children(), None)
+            if first is None:
+                m.append(to_insert)
+            else:
+                first.addprevious(to_insert)
+            self._record(m, ("insert", m.index(to_insert)))
         return self
 
 # TODO: add a coindex function, operating on a dual selection
 
     def prune(self):
-        self._mutate()
         for m in self._matches:
-            p = m.parent
-            pi = m.parent_index + 1
-            for d in m:
-                del self._tree[d.treepos]
-                p.insert(pi, d)
-            del self._tree[m.treepos]
+            p = m.getparent()
+            i = p.index(m)
+            daughters = list(m.children())
+            for d in daughters:
+                m.addprevious(d)
+            p.remove(m)
+            self._record(p, ("prune", i, m, len(daughters)))
+        self._matches = []
+        return self
 
     def withMatchAndData(self, fn):
         # TODO: convert all other convenience fns to special cases of this one
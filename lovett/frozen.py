@@ -0,0 +1,428 @@
+"""A compact, read-only representation of a corpus.
+
+Searching a corpus does not need mutable lxml elements, each of which costs
+a C-level node plus a Python proxy object whenever it is touched.  A
+:class:`FrozenCorpus` instead keeps every node in a set of flat arrays
+(parent, first child, next and previous sibling, label, kind, text and
+index).  Labels are ids in the symbol table of :mod:`lovett.tree`, and
+texts are interned in a string table.  Nodes are stored
+in document order, sentence by sentence.
+
+Nodes are accessed through light-weight :class:`FrozenNode` handles, which
+provide the read-only part of the :class:`lovett.tree.TreeNode` API
+(``label()``, ``children()``, ``subtrees()``, ``left_sibling()``,
+``right_sibling()``, ``getparent()``, ``metadata()``, ``get_meta()`` and
+so on), so that the predicates in :mod:`lovett.cs.searchfns` run on them
+unchanged.
+
+"""
+
+from array import array
+import types
+
+from .tree import (AnnotaldXmlError, intern_label, _label_strings)
+
+__docformat__ = "restructuredtext en"
+
+_kinds = ("sentence", "nonterminal", "text", "trace", "ec", "comment")
+_kind_ids = {k: i for i, k in enumerate(_kinds)}
+_SENTENCE = _kind_ids["sentence"]
+_COMMENT = _kind_ids["comment"]
+
+_idxtypes = (None, "regular", "gap")
+_idxtype_ids = {k: i for i, k in enumerate(_idxtypes)}
+
+def _plain_meta(m):
+    # Convert a meta element (or a nested key) into a plain dict
+    r = {}
+    for x in m:
+        if not isinstance(x.tag, str):
+            continue
+        if len(x) > 0:
+            r[x.tag] = _plain_meta(x)
+        else:
+            r[x.tag] = x.text
+    return r
+
+class _Builder(object):
+    def __init__(self, corpus):
+        self.c = corpus
+        self.strings = {}
+
+    def intern(self, table, ids, s):
+        if s is None:
+            return -1
+        i = ids.get(s)
+        if i is None:
+            i = ids[s] = len(table)
+            table.append(s)
+        return i
+
+    def add(self, kind, parent, label, text):
+        c = self.c
+        i = len(c._kind)
+        c._kind.append(kind)
+        c._parent.append(parent)
+        c._first.append(-1)
+        c._next.append(-1)
+        c._prev.append(-1)
+        c._label.append(-1 if label is None else intern_label(label))
+        c._text.append(self.intern(c._strings, self.strings, text))
+        c._index.append(-1)
+        c._idxtype.append(0)
+        return i
+
+    def link(self, parent, prev, i):
+        c = self.c
+        if prev == -1:
+            if parent != -1:
+                c._first[parent] = i
+        else:
+            c._next[prev] = i
+            c._prev[i] = prev
+
+    def set_meta(self, i, m):
+        meta = _plain_meta(m)
+        index = meta.pop("index", None)
+        idxtype = meta.pop("idxtype", None)
+        if index is not None and idxtype in _idxtype_ids and \
+           index.isdigit() and str(int(index)) == index:
+            self.c._index[i] = int(index)
+            self.c._idxtype[i] = _idxtype_ids[idxtype]
+        else:
+            # Unusual indices are kept verbatim with the rest of the
+            # metadata.
+            if index is not None:
+                meta["index"] = index
+            if idxtype is not None:
+                meta["idxtype"] = idxtype
+        if meta:
+            self.c._meta[i] = meta
+
+    def add_sentence(self, sentence):
+        c = self.c
+        i = self.add(_SENTENCE, -1, None, sentence.get("id"))
+        if c._sentences:
+            self.link(-1, c._sentences[-1], i)
+        c._sentences.append(i)
+        self.add_children(i, sentence)
+
+    def add_children(self, parent, element):
+        prev = -1
+        for x in element.iterchildren():
+            tag = x.tag
+            if not isinstance(tag, str):
+                continue
+            tag = tag.lower()
+            if tag == "meta":
+                self.set_meta(parent, x)
+                continue
+            kind = _kind_ids.get(tag)
+            if kind is None or kind == _SENTENCE:
+                raise AnnotaldXmlError("cannot freeze element: %s" % tag)
+            if kind == _COMMENT:
+                label = x.get("comtype")
+            else:
+                cat = x.get("category")
+                subcat = x.get("subcategory")
+                label = cat if subcat is None else cat + "-" + subcat
+            if tag == "trace":
+                text = x.get("tracetype")
+            elif tag == "ec":
+                text = x.get("ectype")
+            elif tag == "nonterminal":
+                text = None
+            else:
+                text = x.text
+            i = self.add(kind, parent, label, text)
+            self.link(parent, prev, i)
+            prev = i
+            if tag == "nonterminal":
+                self.add_children(i, x)
+            elif len(x) > 0:
+                for m in x.iterchildren("meta", "META"):
+                    self.set_meta(i, m)
+
+class FrozenCorpus(object):
+    """A read-only corpus whose nodes are stored in flat arrays.
+
+    Use :meth:`lovett.corpus.Corpus.freeze` or :func:`freeze_file` to make
+    one.  The structure of the arrays is an implementation detail; use the
+    :class:`FrozenNode` handles returned by :meth:`trees` and friends.
+
+    :param sentences: An iterable of :class:`lovett.tree.Sentence` elements
+
+    """
+
+    def __init__(self, sentences):
+        self._kind = array("b")
+        self._parent = array("i")
+        self._first = array("i")
+        self._next = array("i")
+        self._prev = array("i")
+        self._label = array("i")
+        self._text = array("i")
+        self._index = array("i")
+        self._idxtype = array("b")
+        self._strings = []
+        self._meta = {}
+        self._sentences = array("i")
+        b = _Builder(self)
+        for s in sentences:
+            b.add_sentence(s)
+
+    def __len__(self):
+        return len(self._sentences)
+
+    def __getitem__(self, i):
+        return FrozenNode(self, self._sentences[i])
+
+    def trees(self):
+        """Get iterator over trees in this corpus."""
+        for i in self._sentences:
+            yield FrozenNode(self, i)
+
+    def node_count(self):
+        """Return the number of nodes (including sentences) in the corpus.
+
+        :rtype: int
+
+        """
+        return len(self._kind)
+
+    def _end(self, i):
+        # The node just past the last descendant of i.  Nodes are in
+        # document order, so this is the next sibling of i or of its
+        # nearest ancestor which has one.
+        while i != -1:
+            n = self._next[i]
+            if n != -1:
+                return n
+            i = self._parent[i]
+        return len(self._kind)
+
+class FrozenNode(object):
+    """A handle on one node of a :class:`FrozenCorpus`.
+
+    Handles are created on demand and are cheap; two handles on the same
+    node compare equal.  Sentence nodes additionally provide ``id()`` and
+    ``tree()``.
+
+    """
+
+    __slots__ = ("corpus", "i")
+
+    def __init__(self, corpus, i):
+        self.corpus = corpus
+        self.i = i
+
+    def _node(self, i):
+        if i == -1:
+            return None
+        return FrozenNode(self.corpus, i)
+
+    @property
+    def tag(self):
+        return _kinds[self.corpus._kind[self.i]]
+
+    @property
+    def text(self):
+        c = self.corpus
+        if c._kind[self.i] not in (_kind_ids["text"], _COMMENT):
+            return None
+        t = c._text[self.i]
+        return None if t == -1 else c._strings[t]
+
+    def label(self):
+        """Return the label of the node.
+
+        :rtype: str
+
+        """
+        c = self.corpus
+        if c._kind[self.i] == _COMMENT:
+            return "CODE"
+        label = c._label[self.i]
+        return None if label == -1 else _label_strings[label]
+
+    def label_id(self):
+        """Return the id of the node's label in the label symbol table.
+
+        :returns: The id, or ``None`` for a sentence, which has no label
+        :rtype: int
+
+        """
+        c = self.corpus
+        if c._kind[self.i] == _COMMENT:
+            return intern_label("CODE")
+        label = c._label[self.i]
+        return None if label == -1 else label
+
+    def _attr(self, kind):
+        c = self.corpus
+        if c._kind[self.i] != _kind_ids[kind]:
+            return None
+        t = c._text[self.i]
+        return None if t == -1 else c._strings[t]
+
+    def tracetype(self):
+        return self._attr("trace")
+
+    def ectype(self):
+        return self._attr("ec")
+
+    def comtype(self):
+        c = self.corpus
+        if c._kind[self.i] != _COMMENT:
+            return None
+        label = c._label[self.i]
+        return None if label == -1 else _label_strings[label]
+
+    def id(self):
+        """Get the ID of a sentence."""
+        return self._attr("sentence")
+
+    def tree(self):
+        """Get the tree that corresponds to a sentence."""
+        return self._node(self.corpus._first[self.i])
+
+    def getparent(self):
+        return self._node(self.corpus._parent[self.i])
+
+    def left_sibling(self):
+        """Return the next sibling to the left of a node."""
+        return self._node(self.corpus._prev[self.i])
+
+    def right_sibling(self):
+        """Return the next sibling to the right of a node."""
+        return self._node(self.corpus._next[self.i])
+
+    def children(self):
+        """Access the children of a node.
+
+        :rtype: iterator
+
+        """
+        c = self.corpus
+        j = c._first[self.i]
+        while j != -1:
+            yield FrozenNode(c, j)
+            j = c._next[j]
+
+    def subtrees(self):
+        """Access the subtrees of a node, in preorder, not including the
+        node itself.
+
+        :rtype: iterator
+
+        """
+        c = self.corpus
+        for j in range(self.i + 1, c._end(self.i)):
+            yield FrozenNode(c, j)
+
+    def iter(self, *tags):
+        """Iterate over the node and its descendants, in document order.
+
+        :param tags: If given, only nodes with one of these tags are
+            returned, as for :meth:`lxml.etree._Element.iter`.
+
+        """
+        c = self.corpus
+        kinds = set(_kind_ids[t] for t in tags if t in _kind_ids)
+        for j in range(self.i, c._end(self.i)):
+            if not tags or c._kind[j] in kinds:
+                yield FrozenNode(c, j)
+
+    def urtext(self):
+        c = self.corpus
+        k = c._kind[self.i]
+        if k == _kind_ids["text"]:
+            return self.text
+        if k == _kind_ids["nonterminal"]:
+            return " ".join(filter(lambda x: x != "",
+                                   (s.urtext() for s in self.children())))
+        return ""
+
+    def _meta_dict(self):
+        c = self.corpus
+        r = dict(c._meta.get(self.i, ()))
+        if c._index[self.i] != -1:
+            r["index"] = str(c._index[self.i])
+            r["idxtype"] = _idxtypes[c._idxtype[self.i]]
+        return r
+
+    def metadata(self):
+        """Return a read-only mapping of the node's metadata.
+
+        Nested keys are plain dicts.
+
+        """
+        if self.corpus._kind[self.i] == _COMMENT:
+            raise AnnotaldXmlError("Comments don't have metadata")
+        return types.MappingProxyType(self._meta_dict())
+
+    def get_meta(self, key, default=None):
+        """Return the value of a metadata key.
+
+        :param str key: The key to look up
+        :param default: What to return if the key is not present
+
+        """
+        key = key.lower()
+        c = self.corpus
+        if c._index[self.i] != -1:
+            if key == "index":
+                return str(c._index[self.i])
+            if key == "idxtype":
+                return _idxtypes[c._idxtype[self.i]]
+        return c._meta.get(self.i, {}).get(key, default)
+
+    def has_meta(self, key=None):
+        """Test whether a node has metadata.
+
+        :param str key: The key to test for.  If ``None``, test whether the
+            node has any metadata at all.
+
+        """
+        if key is None:
+            return self.corpus._index[self.i] != -1 or \
+                self.i in self.corpus._meta
+        return self.get_meta(key) is not None
+
+    def __len__(self):
+        return sum(1 for x in self.children())
+
+    def __bool__(self):
+        # A handle always refers to a node, whether or not it has children
+        return True
+
+    def __iter__(self):
+        raise AnnotaldXmlError("you shouldn't iterate directly over an element, you'll bogusly find metadata")
+
+    def __eq__(self, other):
+        return isinstance(other, FrozenNode) and \
+            other.corpus is self.corpus and other.i == self.i
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.corpus), self.i))
+
+    def __repr__(self):
+        return "<FrozenNode %s %r at %d>" % (self.tag, self.label(), self.i)
+
+def freeze_file(path, format=None):
+    """Read a corpus file straight into a :class:`FrozenCorpus`.
+
+    The file is read one sentence at a time, so the mutable form of the
+    corpus never exists in memory all at once.
+
+    :param str path: The corpus file
+    :param str format: One of ``"psdx"``, ``"psd"`` or ``"deep"``.  By
+        default this is guessed from the file's extension.
+    :rtype: :class:`FrozenCorpus`
+
+    """
+    from .corpus import iter_files
+    return FrozenCorpus(iter_files([path], workers=1, format=format))
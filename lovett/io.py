@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 import lovett.tree
 import lovett.corpus
 import lovett.util
+from lovett.writers import TreeWriter
 
 __docformat__ = "restructuredtext en"
 
@@ -44,5 +45,5 @@ def writeTrees(metadata, trees, file):
     """
     if metadata:
         file.write(lovett.util.metadata_str(metadata) + "\n\n")
-    trees = map(str, trees)
-    file.write("\n\n".join(trees))
+    with TreeWriter(file) as w:
+        w.write_all(trees)
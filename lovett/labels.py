@@ -0,0 +1,385 @@
+"""Finding the nodes of a corpus by their label.
+
+A search such as ``deep(hasLabel("CP-REL") & ...)`` tests every node of
+every sentence, although only the few nodes labelled ``CP-REL`` can match.
+A :class:`LabelIndex` lists the nodes of a corpus with each label, in
+document order, so that :func:`lovett.cs.searchfns.deep` and
+:meth:`lovett.cs.transformer.TreeTransformer.findNodes` need only visit the
+nodes which pass a query's leading ``hasLabel`` test.
+
+An index is built with :meth:`lovett.corpus.Corpus.index_labels`.  It is
+kept up to date when a label is changed with
+:meth:`lovett.tree.TreeNode.set_label`.  After any other change to a tree,
+the changed sentence is read again the next time the index is used (see
+:func:`lovett.tree.invalidate_hashes`); the rest of the corpus is not.
+
+"""
+
+from array import array
+from bisect import bisect_left
+
+from . import tree as _tree
+from .tree import _children
+
+__docformat__ = "restructuredtext en"
+
+class _Block(object):
+    # The part of an index for one sentence: its nodes in document order,
+    # the sentence first, where the subtree of each ends, and the nodes
+    # listed under each key, as sorted arrays of their numbers within the
+    # sentence
+    __slots__ = ("n", "nodes", "pos", "end", "table")
+
+class _CorpusIndex(object):
+    # The part of an index shared by LabelIndex and
+    # lovett.lexicon.LexicalIndex: the nodes of a corpus, sentence by
+    # sentence, listed under keys which subclasses fill in from _add.
+    # lovett.tree._changed reports each sentence which is about to change
+    # (see _changed), and only the blocks of those sentences are read again
+    # before the index is next used.  The whole corpus is read again only
+    # after invalidate_hashes() without a node; a change to the corpus
+    # itself reads only the sentences which are new to the index.
+
+    # The attribute by which each node refers back to the index
+    _attr = None
+    # The kinds of change (see lovett.tree._changed) which cannot change
+    # the keys of a node
+    _ignored = ()
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self._epoch = None
+        self._blocks = []
+        self._by_sentence = {}
+        self._dirty = set()
+        self._build()
+
+    def _add(self, table, i, node):
+        # List node, numbered i within its sentence, under its keys in
+        # table
+        raise NotImplementedError
+
+    def _count(self, key, n):
+        # Add n (which may be negative) to the number of nodes under key
+        counts = self._counts
+        c = counts.get(key)
+        if c is None:
+            counts[key] = n
+            # A test may pass the new key
+            self._selected = {}
+        elif c + n:
+            counts[key] = c + n
+        else:
+            del counts[key]
+
+    def _read(self, s):
+        block = _Block()
+        nodes = block.nodes = [s]
+        end = block.end = array("i", [0])
+        table = block.table = {}
+        add = self._add
+        stack = [(_children(s), 0)]
+        while stack:
+            it, p = stack[-1]
+            x = next(it, None)
+            if x is None:
+                stack.pop()
+                end[p] = len(nodes)
+                continue
+            i = len(nodes)
+            nodes.append(x)
+            end.append(i + 1)
+            add(table, i, x)
+            if x.tag == "nonterminal":
+                stack.append((_children(x), i))
+        for x in nodes:
+            setattr(x, self._attr, self)
+        block.pos = {id(x): i for i, x in enumerate(nodes)}
+        for k, seqs in table.items():
+            self._count(k, len(seqs))
+        self._size += len(nodes)
+        return block
+
+    def _drop(self, block):
+        for k, seqs in block.table.items():
+            self._count(k, -len(seqs))
+        self._size -= len(block.nodes)
+
+    def _build(self):
+        # Bring the list of sentences up to date with the corpus, keeping
+        # the blocks of those which have not changed
+        if self._epoch != _tree._epoch:
+            self._epoch = _tree._epoch
+            self._counts = {}
+            self._selected = {}
+            self._size = 0
+            old = {}
+        else:
+            old = self._by_sentence
+        blocks = []
+        for s in self.corpus.trees():
+            block = old.pop(id(s), None)
+            if block is None or block.nodes[0] is not s or \
+               id(s) in self._dirty:
+                if block is not None:
+                    self._drop(block)
+                block = self._read(s)
+            block.n = len(blocks)
+            blocks.append(block)
+        for block in old.values():
+            self._drop(block)
+        setattr(self.corpus, self._attr, self)
+        self._blocks = blocks
+        self._by_sentence = {id(b.nodes[0]): b for b in blocks}
+        self._dirty = set()
+        self._stale = False
+        self._offsets = None
+
+    def _changed(self, owner, kind):
+        # Called by lovett.tree._changed before owner (a sentence, or the
+        # corpus) changes
+        if kind in self._ignored:
+            return
+        if owner is self.corpus:
+            self._stale = True
+            return
+        block = self._by_sentence.get(id(owner))
+        if block is not None and block.nodes[0] is owner:
+            self._dirty.add(id(owner))
+
+    def detach(self):
+        """Stop the search functions from using the index, and let go of
+        the corpus's nodes."""
+        for block in self._blocks:
+            for x in block.nodes:
+                x.__dict__.pop(self._attr, None)
+        if self.corpus is not None:
+            self.corpus.__dict__.pop(self._attr, None)
+        self.corpus = None
+        self._blocks = []
+        self._by_sentence = {}
+        self._dirty = set()
+        self._counts = {}
+        self._selected = {}
+        self._size = 0
+
+    def _current(self, node=None):
+        # Whether the index is up to date: for node's sentence, if node is
+        # given (and in the corpus), or else for the whole corpus
+        if self._stale or self._epoch != _tree._epoch:
+            return False
+        if node is None:
+            return not self._dirty
+        r = self._locate(node)
+        return r is not None and id(r[0].nodes[0]) not in self._dirty
+
+    def _check(self):
+        if self.corpus is None:
+            return
+        if self._stale or self._epoch != _tree._epoch:
+            self._build()
+            return
+        while self._dirty:
+            block = self._by_sentence[self._dirty.pop()]
+            self._drop(block)
+            new = self._read(block.nodes[0])
+            new.n = block.n
+            self._blocks[new.n] = self._by_sentence[id(new.nodes[0])] = new
+            if len(new.nodes) != len(block.nodes):
+                self._offsets = None
+
+    def _locate(self, node):
+        # The block of node's sentence, and the number of node within it;
+        # None if node is not in the corpus
+        block = self._by_sentence.get(id(_tree._owner(node)))
+        if block is None:
+            return None
+        i = block.pos.get(id(node))
+        if i is None or block.nodes[i] is not node:
+            return None
+        return block, i
+
+    def position(self, node):
+        """Return the number of a node, or ``None`` if it is not in the
+        corpus.
+
+        Nodes are numbered in document order, sentences included.
+
+        :param node: The node
+        :rtype: int
+
+        """
+        self._check()
+        r = self._locate(node)
+        if r is None:
+            return None
+        if self._offsets is None:
+            offsets = self._offsets = array("i")
+            n = 0
+            for block in self._blocks:
+                offsets.append(n)
+                n += len(block.nodes)
+        return self._offsets[r[0].n] + r[1]
+
+    def __len__(self):
+        self._check()
+        return self._size
+
+    def _collect(self, keys, node, include_node=False):
+        # The nodes listed under any of keys which are under node, or in
+        # the whole corpus, in document order
+        if node is None:
+            blocks = self._blocks if keys else []
+            start = 0
+        else:
+            r = self._locate(node)
+            if r is None:
+                raise ValueError("node is not in this corpus: %r" % node)
+            block, i = r
+            blocks = [block]
+            start, stop = (i if include_node else i + 1), block.end[i]
+        result = []
+        for block in blocks:
+            if node is None:
+                stop = len(block.nodes)
+            table = block.table
+            r = []
+            for k in keys:
+                seqs = table.get(k)
+                if seqs is not None:
+                    r.extend(seqs[bisect_left(seqs, start):
+                                  bisect_left(seqs, stop)])
+            if len(keys) > 1:
+                r.sort()
+            nodes = block.nodes
+            result.extend(nodes[i] for i in r)
+        return result
+
+    def _sentences(self, nodes):
+        # The sentences containing nodes (in document order), without
+        # repeats
+        r = []
+        last = None
+        for x in nodes:
+            s = _tree._owner(x)
+            if s is not last:
+                r.append(s)
+                last = s
+        return r
+
+class LabelIndex(_CorpusIndex):
+    """The nodes of a corpus, by label.
+
+    Like a :class:`lovett.spans.SpanIndex`, the index keeps the Python
+    object of every node alive, caching its label, and each node refers
+    back to the index.  For each sentence, the index holds the sorted
+    numbers of the nodes which bear each label id, so that a change to one
+    sentence means reading only that sentence again.
+
+    :param corpus: The corpus to index
+    :type corpus: :class:`lovett.corpus.Corpus`
+
+    """
+
+    _attr = "_labels"
+    _ignored = ("attrib", "meta")
+
+    def _add(self, table, i, node):
+        node._cache_label()
+        lid = node.label_id()
+        seqs = table.get(lid)
+        if seqs is None:
+            seqs = table[lid] = array("i")
+        seqs.append(i)
+
+    def _relabel(self, node, old):
+        # Called by set_label, when the index was current for node's
+        # sentence before the change
+        r = self._locate(node)
+        if r is None:
+            return
+        block, i = r
+        table = block.table
+        seqs = table[old]
+        del seqs[bisect_left(seqs, i)]
+        if not seqs:
+            del table[old]
+        self._count(old, -1)
+        node._cache_label()
+        lid = node.label_id()
+        seqs = table.get(lid)
+        if seqs is None:
+            seqs = table[lid] = array("i")
+        seqs.insert(bisect_left(seqs, i), i)
+        self._count(lid, 1)
+        # The change reported by set_label is accounted for
+        self._dirty.discard(id(block.nodes[0]))
+
+    def _select(self, matches):
+        # The label ids for which matches (a hasLabel test, see
+        # lovett.cs.searchfns) holds.  There are few distinct labels, so
+        # this is cheap, and it is remembered for each test.
+        r = self._selected.get(id(matches))
+        if r is None or r[0] is not matches:
+            r = self._selected[id(matches)] = \
+                (matches, [lid for lid in self._counts if matches[lid]])
+        return r[1]
+
+    def _find(self, matches, node=None, include_node=False):
+        # The nodes under node (by default, in the whole corpus) which pass
+        # the hasLabel test matches, in document order
+        self._check()
+        return self._collect(self._select(matches), node, include_node)
+
+    def nodes(self, label, node=None):
+        """Return the nodes with a label, in document order.
+
+        :param str label: The label, matched exactly
+        :param node: If given, only look among the descendants of this node
+        :rtype: list
+
+        """
+        self._check()
+        lid = _tree._label_ids.get(label)
+        return self._collect([lid] if lid in self._counts else [], node)
+
+    def category(self, category, node=None):
+        """Return the nodes of a category, with or without dash tags, in
+        document order.
+
+        :param str category: The category, such as ``NP``
+        :param node: If given, only look among the descendants of this node
+        :rtype: list
+
+        """
+        self._check()
+        prefix = category + "-"
+        lids = [lid for lid in self._counts
+                if _tree.label_string(lid) == category or
+                _tree.label_string(lid).startswith(prefix)]
+        return self._collect(lids, node)
+
+    def count(self, label):
+        """Return the number of nodes with a label.
+
+        :param str label: The label, matched exactly
+        :rtype: int
+
+        """
+        self._check()
+        return self._counts.get(_tree._label_ids.get(label), 0)
+
+def label_index(node):
+    """Return the label index of a node's corpus, if it has one.
+
+    :param node: The node
+    :rtype: :class:`LabelIndex` or ``None``
+
+    """
+    index = getattr(node, "_labels", None)
+    if index is None:
+        return None
+    index._check()
+    if index._locate(node) is None:
+        return None
+    return index
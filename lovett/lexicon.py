@@ -0,0 +1,152 @@
+"""Finding the leaves of a corpus by their word or lemma.
+
+:func:`lovett.cs.searchfns.hasText`, :func:`~lovett.cs.searchfns.hasWord`
+and :func:`~lovett.cs.searchfns.hasLemma` look at one node at a time, so a
+search such as ``deep(hasLemma("see") & ...)`` reads the text or the
+metadata of every node of the corpus.  A :class:`LexicalIndex` lists the
+leaves with each word form and each lemma, so that such a search need only
+visit the leaves it names.  A regular expression is matched once against
+each distinct word or lemma, rather than against every token.
+
+An index is built with :meth:`lovett.corpus.Corpus.index_lexicon`, and is
+used by :func:`lovett.cs.searchfns.deep` and
+:meth:`lovett.cs.transformer.TreeTransformer.findNodes` when a query starts
+with one of these tests.  After a sentence's structure or metadata has
+changed, that sentence alone is read again the next time the index is used;
+a change of label leaves the index alone.  Setting the ``text`` of a leaf
+cannot be noticed, so call :func:`lovett.tree.invalidate_hashes` with the
+leaf afterwards.
+
+"""
+
+from array import array
+
+from .labels import _CorpusIndex
+from .tree import _leaf_tags
+
+__docformat__ = "restructuredtext en"
+
+class LexicalIndex(_CorpusIndex):
+    """The leaves of a corpus, by word form and by lemma.
+
+    The word form of a leaf is its ``text``, and its lemma the ``LEMMA``
+    key of its metadata.  Like a :class:`lovett.labels.LabelIndex`, the
+    index keeps the Python object of every node alive, and each node refers
+    back to the index.
+
+    :param corpus: The corpus to index
+    :type corpus: :class:`lovett.corpus.Corpus`
+
+    """
+
+    _attr = "_lexicon"
+    # Neither words nor lemmas are attributes
+    _ignored = ("label", "attrib")
+
+    def _add(self, table, i, node):
+        # A leaf is listed under ("text", word) and ("lemma", lemma)
+        if node.tag not in _leaf_tags:
+            return
+        for key in (("text", node.text), ("lemma", node.get_meta("LEMMA"))):
+            if isinstance(key[1], str):
+                seqs = table.get(key)
+                if seqs is None:
+                    seqs = table[key] = array("i")
+                seqs.append(i)
+
+    def _entries(self, test):
+        # The keys test passes: one key for a plain string, or those found
+        # in one pass over the vocabulary otherwise
+        field = "lemma" if test.field == "lemma" else "text"
+        if test.regex or test.prefix is not None:
+            return [k for k in self._counts
+                    if k[0] == field and test.match(k[1])]
+        return [(field, test.pattern)]
+
+    def _find(self, test, node=None, include_node=False):
+        # The leaves under node (by default, in the whole corpus) which pass
+        # a lexical test (see lovett.cs.searchfns), in document order.  The
+        # entries are remembered for each test, as deep() asks once per
+        # tree.
+        self._check()
+        r = self._selected.get(id(test))
+        if r is None or r[0] is not test:
+            r = self._selected[id(test)] = (test, self._entries(test))
+        return self._collect(r[1], node, include_node)
+
+    def words(self, word, node=None):
+        """Return the leaves with a word form, in document order.
+
+        :param word: The word, matched exactly, or a regular expression
+        :param node: If given, only look among the descendants of this node
+        :rtype: list
+
+        """
+        from .cs.searchfns import _LexicalTest
+        self._check()
+        return self._collect(self._entries(_LexicalTest("text", word)), node)
+
+    def lemmas(self, lemma, node=None):
+        """Return the leaves with a lemma, in document order.
+
+        :param lemma: The lemma, matched exactly, or a regular expression
+        :param node: If given, only look among the descendants of this node
+        :rtype: list
+
+        """
+        from .cs.searchfns import _LexicalTest
+        self._check()
+        return self._collect(self._entries(_LexicalTest("lemma", lemma)),
+                             node)
+
+    def sentences(self, word=None, lemma=None):
+        """Return the sentences in which a word form or a lemma occurs, in
+        document order.
+
+        :param word: The word, matched exactly, or a regular expression
+        :param lemma: The lemma, if no word is given
+        :rtype: list of :class:`lovett.tree.Sentence`
+
+        """
+        if word is not None:
+            return self._sentences(self.words(word))
+        return self._sentences(self.lemmas(lemma))
+
+    def vocabulary(self, lemmas=False):
+        """Return the distinct word forms (or lemmas) of the corpus.
+
+        :param bool lemmas: Whether to return the lemmas
+        :rtype: list
+
+        """
+        self._check()
+        field = "lemma" if lemmas else "text"
+        return [k for f, k in self._counts if f == field]
+
+    def count(self, word=None, lemma=None):
+        """Return the number of leaves with a word form (or a lemma).
+
+        :param str word: The word, matched exactly
+        :param str lemma: The lemma, if no word is given
+        :rtype: int
+
+        """
+        self._check()
+        if word is not None:
+            return self._counts.get(("text", word), 0)
+        return self._counts.get(("lemma", lemma), 0)
+
+def lexical_index(node):
+    """Return the lexical index of a node's corpus, if it has one.
+
+    :param node: The node
+    :rtype: :class:`LexicalIndex` or ``None``
+
+    """
+    index = getattr(node, "_lexicon", None)
+    if index is None:
+        return None
+    index._check()
+    if index._locate(node) is None:
+        return None
+    return index
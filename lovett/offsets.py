@@ -0,0 +1,244 @@
+"""Random access to the sentences of a corpus file.
+
+This module records where each tree starts and ends in a PSDX, PSD or deep
+file, so that a single sentence can be read and parsed without touching the
+rest of the file.
+
+"""
+
+import json
+import mmap
+import os
+import re
+from xml.sax.saxutils import unescape
+
+from lxml import etree
+
+from .corpus import (parser, _guess_format, _postprocess_parsed)
+from .compression import is_compressed
+
+__docformat__ = "restructuredtext en"
+
+_VERSION = 1
+
+def scan_offsets(path, format=None):
+    """Find the position of every tree in a corpus file.
+
+    :param str path: The file to scan
+    :param str format: One of ``"psdx"``, ``"psd"`` or ``"deep"``.  By
+        default this is guessed from the file's extension.
+    :returns: a ``(id, start, end)`` triple for each tree, in file order.
+        ``start`` and ``end`` are byte offsets; ``id`` is ``None`` for
+        trees without an ID.
+    :rtype: list
+
+    """
+    if is_compressed(path):
+        raise ValueError("random access needs an uncompressed file: %s" % path)
+    format = format or _guess_format(path)
+    with open(path, "rb") as f:
+        if format == "psdx":
+            return _scan_psdx(f)
+        return _scan_psd(f)
+
+_id_re = re.compile(rb"\(ID\s+([^\s()]+)\s*\)")
+
+def _scan_psd(f):
+    r = []
+    pos = 0
+    start = None
+    lines = []
+    for line in f:
+        if line.strip() == b"":
+            if start is not None:
+                r.append((_psd_id(lines), start, pos))
+                start = None
+                lines = []
+        else:
+            if start is None:
+                start = pos
+            lines.append(line)
+        pos += len(line)
+    if start is not None:
+        r.append((_psd_id(lines), start, pos))
+    return r
+
+def _psd_id(lines):
+    # The ID is the last thing in a tree; search from the end.
+    for line in reversed(lines):
+        m = _id_re.search(line)
+        if m is not None:
+            return m.group(1).decode("utf-8")
+    return None
+
+_sentence_start_re = re.compile(rb"<sentence\b([^>]*?)(/?)>", re.I)
+_sentence_end_re = re.compile(rb"</sentence\s*>", re.I)
+_xml_id_re = re.compile(rb"""\bid\s*=\s*(["'])(.*?)\1""", re.I | re.S)
+
+def _scan_psdx(f):
+    r = []
+    if os.fstat(f.fileno()).st_size == 0:
+        return r
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        pos = 0
+        while True:
+            start = _sentence_start_re.search(m, pos)
+            if start is None:
+                break
+            if start.group(2):
+                end = start.end()
+            else:
+                close = _sentence_end_re.search(m, start.end())
+                if close is None:
+                    raise ValueError("unterminated sentence at byte %d" %
+                                     start.start())
+                end = close.end()
+            id_match = _xml_id_re.search(start.group(1))
+            if id_match is None:
+                sid = None
+            else:
+                sid = unescape(id_match.group(2).decode("utf-8"),
+                               {"&quot;": '"', "&apos;": "'"})
+            r.append((sid, start.start(), end))
+            pos = end
+    return r
+
+def parse_span(path, start, end, format=None):
+    """Parse the tree found between two byte offsets of a corpus file.
+
+    :param str path: The corpus file
+    :param int start: The offset of the first byte of the tree
+    :param int end: The offset just past the last byte of the tree
+    :param str format: As for :func:`scan_offsets`
+    :rtype: :class:`lovett.tree.Sentence`
+
+    """
+    format = format or _guess_format(path)
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return _parse_bytes(data, format)
+
+def _parse_bytes(data, format):
+    if format == "psdx":
+        return _postprocess_parsed(etree.fromstring(data, parser))
+    from .psd import _parse_sentence
+    return _parse_sentence(data.decode("utf-8"), format)
+
+class OffsetIndex(object):
+    """A persistent index from sentence IDs to byte offsets in a corpus file.
+
+    The index is stored in a sidecar file next to the corpus (by default, the
+    corpus file name with ``.idx`` appended).  It records the size and
+    modification time of the corpus, and is rebuilt automatically whenever
+    these change.  Compressed files cannot be indexed, since seeking in them
+    means decompressing everything up to the seek point.
+
+    :param str path: The corpus file
+    :param str format: One of ``"psdx"``, ``"psd"`` or ``"deep"``.  By
+        default this is guessed from the file's extension.
+    :param str index_path: Where to store the index
+
+    """
+
+    def __init__(self, path, format=None, index_path=None):
+        self.path = path
+        self.format = format or _guess_format(path)
+        self.index_path = index_path or path + ".idx"
+        self._stamp = None
+        self._spans = None
+        self._ids = None
+
+    def _source_stamp(self):
+        st = os.stat(self.path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _ensure(self):
+        stamp = self._source_stamp()
+        if stamp == self._stamp:
+            return
+        spans = self._load(stamp)
+        if spans is None:
+            spans = scan_offsets(self.path, self.format)
+            self._save(stamp, spans)
+        self._stamp = stamp
+        self._spans = spans
+        self._ids = {}
+        for i, span in enumerate(spans):
+            if span[0] is not None:
+                self._ids.setdefault(span[0], i)
+
+    def _load(self, stamp):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != _VERSION or \
+           data.get("format") != self.format or \
+           data.get("source") != stamp:
+            return None
+        return [tuple(s) for s in data["spans"]]
+
+    def _save(self, stamp, spans):
+        data = {"version": _VERSION,
+                "format": self.format,
+                "source": stamp,
+                "spans": spans}
+        try:
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except OSError:
+            # A read-only location just means we rescan next time.
+            pass
+
+    def spans(self):
+        """Return the ``(id, start, end)`` triple of every tree in the file.
+
+        :rtype: list
+
+        """
+        self._ensure()
+        return self._spans
+
+    def position(self, sentence_id):
+        """Return the position of a sentence among the trees in the file.
+
+        :param str sentence_id: The ID of the sentence
+        :rtype: int
+        :raises KeyError: if there is no such sentence
+
+        """
+        self._ensure()
+        return self._ids[sentence_id]
+
+    def offsets(self, sentence_id):
+        """Return the start and end byte offsets of a sentence.
+
+        :param str sentence_id: The ID of the sentence
+        :rtype: tuple
+        :raises KeyError: if there is no such sentence
+
+        """
+        i = self.position(sentence_id)
+        _, start, end = self._spans[i]
+        return start, end
+
+    def get_sentence(self, sentence_id):
+        """Read and parse a single sentence.
+
+        :param str sentence_id: The ID of the sentence
+        :rtype: :class:`lovett.tree.Sentence`
+        :raises KeyError: if there is no such sentence
+
+        """
+        start, end = self.offsets(sentence_id)
+        return parse_span(self.path, start, end, self.format)
+
+    def __contains__(self, sentence_id):
+        self._ensure()
+        return sentence_id in self._ids
+
+    def __len__(self):
+        self._ensure()
+        return len(self._spans)
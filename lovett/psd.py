@@ -1,53 +1,380 @@
+from lxml import etree
 from lxml.builder import ElementMaker
 from .corpus import parser
 from .psd_tree import Tree as PsdTree
+from .tree import AnnotaldXmlError
+from .util import imap_ordered, default_workers
+from .compression import open_file
+import itertools
 import re
 
 E = ElementMaker(makeelement=parser.makeelement)
 
-def parse_psd_string(s, _type="psd"):
+def parse_psd_string(s, _type="psd", cache_dir=None):
     """This function creates a corpus from a string of PSD-format trees separated
 by single blank lines.
 
     :param str s: The string to process
     :param _type: Internal use only
+    :param str cache_dir: If given, a directory in which to cache the parsed
+        corpus, keyed by the hash of ``s`` (see :mod:`lovett.cache`)
     :returns: The corpus
     :rtype: :class:`lovett.corpus.corpus`
 
     """
+    if cache_dir is not None:
+        import lovett.cache
+        return lovett.cache.load_string(
+            s, lambda x: parse_psd_string(x, _type), _type, cache_dir)
     corpus = E.corpus()
-    trees = s.split("\n\n")
-    inserted = False
-    for tree in trees:
-        parsed_tree = PsdTree.parse(tree)
-        sentence = E.sentence()
-        corpus.append(sentence)
-        for node in parsed_tree:
-            if node.node == "ID":
-                sentence.set_id(node[0])
-            elif node.node == "METADATA":
-                m = _parse_metadata(node)
-                sentence.insert(m, 0)
-            else:
-                if inserted:
-                    raise PsdParseException("Malformed tree:\n%s" % s)
-                if _type == "psd":
-                    sentence.append(_parse_node(node))
-                elif _type == "deep":
-                    sentence.append(_parse_node_psdx(node))
-                inserted = True
+    for tree in s.split("\n\n"):
+        corpus.append(_parse_sentence(tree, _type))
     return corpus
 
-def parse_deep_string(s):
+def iter_psd_file(f, _type="psd"):
+    """Iterate over the trees in a file of PSD-format trees separated by
+blank lines.
+
+    The file is read incrementally, so that only one tree at a time is held
+    in memory, and each sentence is yielded as soon as it has been parsed.
+
+    :param f: A file name or a file object opened in text mode.  Compressed
+        files are decompressed on the fly (see :mod:`lovett.compression`).
+    :param _type: Internal use only
+    :returns: The sentences in the file
+    :rtype: iterator of :class:`lovett.tree.Sentence`
+
+    """
+    if isinstance(f, str):
+        with open_file(f, "r") as fh:
+            yield from iter_psd_file(fh, _type)
+        return
+    for tree in _iter_tree_strings(f):
+        yield _parse_sentence(tree, _type)
+
+def iter_deep_file(f):
+    """Iterate over the trees in a file of deep-format trees separated by
+blank lines.
+
+    See :func:`iter_psd_file`.
+
+    :param f: A file name or a file object opened in text mode
+    :returns: The sentences in the file
+    :rtype: iterator of :class:`lovett.tree.Sentence`
+
+    """
+    return iter_psd_file(f, _type="deep")
+
+def parse_psd_parallel(f, workers=None, _type="psd", chunk_size=500):
+    """Parse a file of PSD-format trees in a pool of worker processes.
+
+    The file is read incrementally and split into chunks of ``chunk_size``
+    trees at blank lines.  The chunks are parsed in parallel, and the
+    sentences are yielded in their original order.  The result is identical
+    to that of :func:`iter_psd_file`.
+
+    :param f: A file name or a file object opened in text mode
+    :param int workers: The number of processes to use (default: one per
+        CPU, unless ``lovett.parallel`` is ``False``)
+    :param _type: Internal use only
+    :param int chunk_size: The number of trees to send to a worker at a time
+    :returns: The sentences in the file
+    :rtype: iterator of :class:`lovett.tree.Sentence`
+
+    """
+    if workers is None:
+        workers = default_workers()
+    if workers == 1:
+        yield from iter_psd_file(f, _type)
+        return
+    if isinstance(f, str):
+        with open_file(f, "r") as fh:
+            yield from parse_psd_parallel(fh, workers, _type, chunk_size)
+        return
+    tasks = ((_type, chunk) for chunk in _chunk_trees(f, chunk_size))
+    for result in imap_ordered(_parse_chunk, tasks, workers):
+        for s in result:
+            yield etree.fromstring(s, parser)
+
+def _chunk_trees(f, chunk_size):
+    trees = _iter_tree_strings(f)
+    while True:
+        chunk = list(itertools.islice(trees, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+def _parse_chunk(task):
+    # Runs in a worker process.  lxml elements cannot be pickled, so they
+    # are sent back to the parent serialized.
+    _type, trees = task
+    return [etree.tostring(_parse_sentence(t, _type)) for t in trees]
+
+def _iter_tree_strings(f):
+    lines = []
+    for line in f:
+        if line.strip() == "":
+            if lines:
+                yield "".join(lines)
+                lines = []
+        else:
+            lines.append(line)
+    if lines:
+        yield "".join(lines)
+
+# The parser proper.  Trees are tokenized with a single regex, and lxml
+# elements are built bottom-up as each bracket closes, so there is no
+# intermediate tree structure.  Each open bracket pushes a frame of
+# (label, children, in_meta); the children are elements, leaf strings, or
+# (label, leaf) pairs for ORTHO, ALT-ORTHO and ID nodes, which are consumed
+# by the enclosing frame.  The bottom frame of the stack collects the
+# finished sentence.
+
+_token_re = re.compile(r"\(\s*([^\s()]*)|(\))|([^\s()]+)")
+_make = parser.makeelement
+
+def _parse_sentence(tree, _type):
+    base = (None, [], False)
+    stack = [base]
+    deep = _type == "deep"
+    for label, close, leaf in _token_re.findall(tree):
+        if close:
+            if len(stack) == 1:
+                raise PsdParseError("Malformed tree:\n%s" % tree)
+            label, kids, in_meta = stack.pop()
+            depth = len(stack)
+            if depth == 1:
+                built = _build_sentence(kids, tree)
+            elif in_meta:
+                built = _build_meta(label, kids)
+            elif depth == 2 and label == "ID":
+                built = ("ID", kids[0])
+            elif deep:
+                if label == "ORTHO" or label == "ALT-ORTHO":
+                    built = (label, kids[0])
+                else:
+                    built = _build_deep(label, kids)
+            else:
+                built = _build_psd(label, kids)
+            stack[-1][1].append(built)
+        elif leaf:
+            stack[-1][1].append(leaf)
+        else:
+            in_meta = stack[-1][2] or label == "META" or \
+                (label == "METADATA" and len(stack) == 2)
+            stack.append((label, [], in_meta))
+    if len(stack) != 1 or len(base[1]) != 1 or \
+       isinstance(base[1][0], str):
+        raise PsdParseError("Malformed tree:\n%s" % tree)
+    return base[1][0]
+
+def _set_label(node, label):
+    p = label.split("-")
+    node.set("category", p[0])
+    if len(p) == 2:
+        node.set("subcategory", p[1])
+    elif len(p) > 2:
+        raise AnnotaldXmlError("cannot set multiple dash tags in XML: " +
+                               label)
+
+def _build_sentence(kids, tree):
+    sentence = _make("sentence")
+    inserted = False
+    for kid in kids:
+        if isinstance(kid, tuple):
+            sentence.set_id(kid[1])
+        elif isinstance(kid, str):
+            raise PsdParseError("Malformed tree:\n%s" % tree)
+        elif kid.tag == "meta":
+            sentence.insert(0, kid)
+        else:
+            if inserted:
+                raise PsdParseError("Malformed tree:\n%s" % tree)
+            sentence.append(kid)
+            inserted = True
+    return sentence
+
+def _build_meta(label, kids):
+    if label in ("META", "METADATA"):
+        node = _make("meta")
+    else:
+        node = _make(label)
+    once = False
+    for kid in kids:
+        if isinstance(kid, str):
+            if once or label in ("META", "METADATA"):
+                raise PsdParseError("malformed metadata: %s" % label)
+            once = True
+            node.text = kid
+        else:
+            node.append(kid)
+    return node
+
+def _set_index(node, meta, index, idxtype):
+    if meta is None:
+        meta = _make("meta")
+        node.insert(0, meta)
+    for key, val in (("index", index), ("idxtype", idxtype)):
+        m = meta.find(key)
+        if m is None:
+            m = _make(key)
+            meta.append(m)
+        m.text = val
+
+def _build_deep(label, kids):
+    meta = None
+    leaf = None
+    for kid in kids:
+        if isinstance(kid, tuple):
+            if leaf is None:
+                leaf = kid
+        elif isinstance(kid, str):
+            raise PsdParseError("Unexpected leaf %s in node %s" % (kid, label))
+        elif kid.tag == "meta" and meta is None:
+            meta = kid
+    if leaf is None:
+        r = _make("nonterminal")
+        _set_label(r, label)
+        if meta is not None:
+            r.append(meta)
+        for kid in kids:
+            if kid.tag != "meta":
+                r.append(kid)
+        return r
+    t = leaf[1]
+    index = None
+    if leaf[0] == "ORTHO":
+        r = _make("text")
+        label, index, idxtype = _get_index_parts(label)
+        if t.startswith("$"):
+            t = t[1:]
+        if t.endswith("$"):
+            t = t[:-1]
+        r.text = t
+    elif label == "CODE":
+        r = _make("comment")
+        typ, txt = t.split(":", 1)
+        r.set_comtype(typ[1:])
+        r.text = txt[:-1].replace("_", " ")
+        return r
+    elif t == "0":
+        r = _make("ec")
+        r.set_ectype("zero")
+    elif t == "*":
+        r = _make("ec")
+        r.set_ectype("star")
+    else:
+        t = t.replace("*", "")
+        tn, index, idxtype = _get_index_parts(t)
+        if tn.isupper():
+            r = _make("trace")
+            r.set_tracetype(tn)
+        elif tn.islower():
+            r = _make("ec")
+            r.set_ectype(t)
+        else:
+            raise PsdParseError("Unknown empty node: %s" % label)
+    if r.tag == "ec":
+        label, index, idxtype = _get_index_parts(label)
+    _set_label(r, label)
+    if meta is not None:
+        r.append(meta)
+    if index is not None:
+        _set_index(r, meta, index, idxtype)
+    return r
+
+def _build_psd(label, kids):
+    if len(kids) == 0:
+        raise PsdParseError("Empty node: %s" % label)
+    if not isinstance(kids[0], str):
+        r = _make("nonterminal")
+        label, index, idxtype = _get_index_parts(label)
+        _set_label(r, label)
+        if index is not None:
+            _set_index(r, None, index, idxtype)
+        for kid in kids:
+            if isinstance(kid, str):
+                raise PsdParseError("Unexpected leaf %s in node %s" %
+                                    (kid, label))
+            r.append(kid)
+        return r
+    if len(kids) > 1:
+        raise PsdParseError("Too many leaves in node %s: %s" % (label, kids))
+    t = kids[0]
+    if label == "CODE":
+        r = _make("comment")
+        if t.startswith("{") and t.endswith("}") and ":" in t:
+            typ, txt = t.split(":", 1)
+            r.set_comtype(typ[1:])
+            t = txt[:-1].replace("_", " ")
+        r.text = t
+        return r
+    label, index, idxtype = _get_index_parts(label)
+    if t[0] == "*" and t != "*":
+        tn, index_, idxtype_ = _get_index_parts(t)
+        if tn == "*" or not tn[1].islower():
+            # "*-1", A-movement trace, or "*X*-1", A-bar trace
+            if index_ is None:
+                raise PsdParseError("noninteger index for trace: " + t)
+            r = _make("trace")
+            r.set_tracetype("amovt" if tn == "*" else tn[1:-1])
+            index, idxtype = index_, idxtype_
+        else:
+            # "*abc*", empty category
+            r = _make("ec")
+            r.set_ectype(tn[1:-1])
+    elif t == "*":
+        r = _make("ec")
+        r.set_ectype("star")
+    elif t == "0":
+        r = _make("ec")
+        r.set_ectype("zero")
+    else:
+        # TODO: lemmas etc.
+        r = _make("text")
+        r.text = t
+    _set_label(r, label)
+    if index is not None:
+        _set_index(r, None, index, idxtype)
+    return r
+
+def _parse_sentence_legacy(tree, _type):
+    """Parse one tree by way of :class:`lovett.psd_tree.Tree`.
+
+    This is the pre-existing two-pass parser, kept for comparison with
+    :func:`_parse_sentence` in the benchmarks.
+
+    """
+    parsed_tree = PsdTree.parse(tree)
+    sentence = E.sentence()
+    inserted = False
+    for node in parsed_tree:
+        if node.node == "ID":
+            sentence.set_id(node[0])
+        elif node.node == "METADATA":
+            m = _parse_metadata(node)
+            sentence.insert(0, m)
+        else:
+            if inserted:
+                raise PsdParseError("Malformed tree:\n%s" % tree)
+            if _type == "psd":
+                sentence.append(_parse_node(node))
+            elif _type == "deep":
+                sentence.append(_parse_node_psdx(node))
+            inserted = True
+    return sentence
+
+def parse_deep_string(s, cache_dir=None):
     """This function creates a corpus from a string of PSDX-format trees separated
 by single blank lines.
 
     :param str s: The string to process
+    :param str cache_dir: As for :func:`parse_psd_string`
     :returns: The corpus
     :rtype: :class:`lovett.corpus.corpus`
 
     """
-    return parse_psd_string(s, _type="deep")
+    return parse_psd_string(s, _type="deep", cache_dir=cache_dir)
 
 def _parse_metadata(m):
     node = E("meta")
@@ -234,12 +561,13 @@ def _parse_empty_psdx(node):
 
 def _parse_comment_psdx(node):
     r = E.comment()
-    typ, txt = node[0].split(":")
+    typ, txt = next(filter(_find("ALT-ORTHO"), node))[0].split(":", 1)
     # Slice off leading {
     r.set_comtype(typ[1:])
     # Slice off trailing }
     # TODO: not idempotent; underscores in XML go to spaces on round trip
     r.text = txt[:-1].replace("_", " ")
+    return r
 
 def _get_index_parts(s):
     l = s.split("=")
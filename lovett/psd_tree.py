@@ -1,7 +1,7 @@
 # This Python file uses the following encoding: utf-8
 from __future__ import unicode_literals
 
-import collections
+import collections.abc
 import re
 import string
 
@@ -36,7 +36,7 @@ class Leaf(object):
         self._node = node
 
 @total_ordering
-class Tree(collections.MutableSequence):
+class Tree(collections.abc.MutableSequence):
     """foo.  TODO
 
     """
@@ -0,0 +1,237 @@
+"""Constant-time dominance and precedence tests within a sentence.
+
+Testing whether one node dominates or precedes another normally means
+walking up parent chains or across siblings.  A :class:`SpanIndex` numbers
+the nodes of a sentence in preorder and records, for each of them, where its
+subtree ends, its depth and how many leaves and words come before it, so
+that these tests become comparisons of integers.
+
+An index is built on request, with :meth:`lovett.tree.Sentence.index_spans`
+or :meth:`lovett.corpus.Corpus.index_spans`, and the search functions of
+:mod:`lovett.cs.searchfns` use it when it is present.  It is rebuilt the next
+time it is used after its sentence has changed (see
+:func:`lovett.tree.invalidate_hashes`).
+
+"""
+
+from array import array
+
+from . import tree as _tree
+from .tree import (_children, _leaf_tags)
+
+__docformat__ = "restructuredtext en"
+
+class SpanIndex(object):
+    """The preorder positions of the nodes of a sentence.
+
+    The index keeps the Python object of every node of the sentence alive,
+    caching its label as :meth:`lovett.corpus.Corpus.pin` does, and each
+    node refers back to the index, so that a search function can find it
+    from any node.
+
+    The sentence itself is node 0; the other nodes are numbered in
+    preorder, leaving out metadata.  The leaves are the ``text``,
+    ``trace``, ``ec`` and ``comment`` nodes, and the words are the
+    ``text`` nodes.
+
+    :param sentence: The sentence to index
+    :type sentence: :class:`lovett.tree.Sentence`
+
+    """
+
+    def __init__(self, sentence):
+        self.sentence = sentence
+        self._generation = None
+        self._build()
+
+    def _build(self):
+        nodes = [self.sentence]
+        parent = array("i", [-1])
+        end = array("i", [0])
+        depth = array("i", [0])
+        leaves = array("i", [0])
+        words = array("i", [0])
+        n_leaves = n_words = 0
+        stack = [(_children(self.sentence), 0)]
+        while stack:
+            it, p = stack[-1]
+            x = next(it, None)
+            if x is None:
+                stack.pop()
+                end[p] = len(nodes)
+                continue
+            i = len(nodes)
+            nodes.append(x)
+            parent.append(p)
+            end.append(i + 1)
+            depth.append(depth[p] + 1)
+            leaves.append(n_leaves)
+            words.append(n_words)
+            tag = x.tag
+            if tag == "nonterminal":
+                stack.append((_children(x), i))
+            elif tag in _leaf_tags:
+                n_leaves += 1
+                if tag == "text":
+                    n_words += 1
+        # The counts for a position just past the last node
+        leaves.append(n_leaves)
+        words.append(n_words)
+        for x in nodes:
+            x._spans = self
+            if isinstance(x, _tree.TreeNode):
+                x._cache_label()
+        self._nodes = nodes
+        self._pos = {id(x): i for i, x in enumerate(nodes)}
+        self._parent = parent
+        self._end = end
+        self._depth = depth
+        self._leaves = leaves
+        self._words = words
+        self._generation = _tree.tree_generation(self.sentence)
+
+    def detach(self):
+        """Stop the search functions from using the index, and let go of
+        the sentence's nodes."""
+        for x in self._nodes:
+            x.__dict__.pop("_spans", None)
+        self.sentence = None
+        self._nodes = []
+        self._pos = {}
+
+    def _check(self):
+        if self.sentence is not None and \
+           self._generation != _tree.tree_generation(self.sentence):
+            self._build()
+
+    def position(self, node):
+        """Return the preorder number of a node, or ``None`` if it is not in
+        the sentence.
+
+        :param node: The node
+        :rtype: int
+
+        """
+        self._check()
+        i = self._pos.get(id(node))
+        if i is None or self._nodes[i] is not node:
+            return None
+        return i
+
+    def _position(self, node):
+        i = self.position(node)
+        if i is None:
+            raise ValueError("node is not in this sentence: %r" % node)
+        return i
+
+    def node(self, i):
+        """Return the node with a preorder number.
+
+        :param int i: The preorder number
+        :rtype: :class:`lovett.tree.TreeNode`
+
+        """
+        self._check()
+        return self._nodes[i]
+
+    def __len__(self):
+        self._check()
+        return len(self._nodes)
+
+    def depth(self, node):
+        """Return the depth of a node.
+
+        The sentence has depth 0, and its tree depth 1.
+
+        :rtype: int
+
+        """
+        return self._depth[self._position(node)]
+
+    def leaf_span(self, node):
+        """Return the leaves a node dominates, as a ``(start, end)`` pair of
+        leaf offsets.
+
+        ``end`` is one past the last leaf, so a node without leaves has
+        ``start == end``.  A leaf dominates itself.
+
+        :rtype: tuple
+
+        """
+        i = self._position(node)
+        return self._leaves[i], self._leaves[self._end[i]]
+
+    def leaf_count(self, node):
+        """Return the number of leaves a node dominates.
+
+        :rtype: int
+
+        """
+        start, end = self.leaf_span(node)
+        return end - start
+
+    def word_count(self, node):
+        """Return the number of words (``text`` nodes) a node dominates.
+
+        :rtype: int
+
+        """
+        i = self._position(node)
+        return self._words[self._end[i]] - self._words[i]
+
+    def dominates(self, one, other):
+        """Test whether a node properly dominates another.
+
+        :rtype: bool
+
+        """
+        i = self._position(one)
+        j = self._position(other)
+        return i < j < self._end[i]
+
+    def precedes(self, one, other):
+        """Test whether a node comes entirely before another.
+
+        :rtype: bool
+
+        """
+        return self._end[self._position(one)] <= self._position(other)
+
+    def adjacent(self, one, other):
+        """Test whether a node precedes another with no leaves between them.
+
+        :rtype: bool
+
+        """
+        i = self._position(one)
+        j = self._position(other)
+        return self._end[i] <= j and \
+            self._leaves[self._end[i]] == self._leaves[j]
+
+    def left_edge_after(self, node):
+        """Iterate over the nodes which start right after a node ends.
+
+        These are the first node after the node's subtree in preorder, its
+        first child, that node's first child, and so on down to a leaf.
+
+        """
+        j = self._end[self._position(node)]
+        n = len(self._nodes)
+        while j < n:
+            yield self._nodes[j]
+            if j + 1 < n and self._parent[j + 1] == j:
+                j += 1
+            else:
+                break
+
+def span_index(node):
+    """Return the span index of a node's sentence, if it has one.
+
+    :param node: The node
+    :rtype: :class:`SpanIndex` or ``None``
+
+    """
+    index = getattr(node, "_spans", None)
+    if index is None or index.position(node) is None:
+        return None
+    return index
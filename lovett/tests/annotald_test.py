@@ -0,0 +1,19 @@
+import testtools
+
+from lovett.annotald import flagIf
+from lovett.cs.searchfns import hasLabel
+
+TREES = """( (IP-MAT (NP-SBJ (PRO (ORTHO they)))
+                (VBD (ORTHO saw))
+                (NP (N (ORTHO dogs))))
+  (ID A,1))"""
+
+class AnnotaldTest(testtools.TestCase):
+    def test_flag_if(self):
+        validator = flagIf(hasLabel("NP"))
+        flagged = validator(None, TREES)
+        self.assertIn("(NP-SBJ-FLAG", flagged)
+        self.assertIn("(NP-FLAG", flagged)
+        self.assertNotIn("(IP-MAT-FLAG", flagged)
+        # Old flags are removed before the trees are searched again
+        self.assertEqual(validator(None, flagged), flagged)
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+
+import testtools
+import lxml.etree
+from testtools.matchers import IsInstance
+
+from lovett.corpus import (parse_files, Corpus)
+from lovett.psd import parse_deep_string
+from lovett.tree import Sentence
+import lovett.cache
+
+DEEP = "( (IP (N (ORTHO foo)))\n  (ID ONE))"
+
+class CacheTest(testtools.TestCase):
+    def setUp(self):
+        super(CacheTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "a.deep")
+        with open(self.path, "w") as f:
+            f.write(DEEP)
+
+    def test_parse_files(self):
+        cold = parse_files([self.path], workers=1, cache=True)
+        entry = lovett.cache.cache_path(self.path)
+        self.assertTrue(os.path.exists(entry))
+        warm = parse_files([self.path], workers=1, cache=True)
+        self.assertEqual(lxml.etree.tostring(cold), lxml.etree.tostring(warm))
+        self.assertThat(warm, IsInstance(Corpus))
+        self.assertThat(warm[0], IsInstance(Sentence))
+        self.assertEqual(warm[0].tag, "sentence")
+
+    def test_invalidate(self):
+        cache_dir = os.path.join(self.dir, "cache")
+        parse_files([self.path], workers=1, cache=cache_dir)
+        with open(self.path, "w") as f:
+            f.write(DEEP.replace("foo", "bar"))
+        c = parse_files([self.path], workers=1, cache=cache_dir)
+        self.assertEqual(c[0].tree()[0].text, "bar")
+
+    def test_touched(self):
+        cache_dir = os.path.join(self.dir, "cache")
+        parse_files([self.path], workers=1, cache=cache_dir)
+        entry, = os.listdir(cache_dir)
+        entry = os.path.join(cache_dir, entry)
+        size = os.path.getsize(entry)
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        c = parse_files([self.path], workers=1, cache=cache_dir)
+        self.assertEqual(c[0].tree()[0].text, "foo")
+        # Only the header of the entry was rewritten
+        self.assertEqual(os.path.getsize(entry), size)
+        header, _ = lovett.cache._read_entry(entry)
+        self.assertEqual(header["stamp"][1], st.st_mtime_ns + 10 ** 9)
+
+    def test_parse_string(self):
+        s = "( (IP (N (ORTHO foo)))\n  (ID ONE))"
+        cache_dir = os.path.join(self.dir, "cache")
+        cold = parse_deep_string(s, cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        warm = parse_deep_string(s, cache_dir=cache_dir)
+        self.assertEqual(lxml.etree.tostring(cold), lxml.etree.tostring(warm))
+        self.assertThat(warm, IsInstance(Corpus))
@@ -0,0 +1,94 @@
+import testtools
+
+from lovett.corpus import parse_string
+from lovett.coindex import (CoindexTable, coindex_table)
+from lovett.cs.searchfns import (hasLabel, deep, isTrace, coIndexed,
+                                 hasCoIndexed, antecedent, hasAntecedent)
+import lovett.util
+
+PSDX = """<corpus>
+<sentence id="ONE">
+<nonterminal category="IP" subcategory="MAT">
+<nonterminal category="NP" subcategory="SBJ"><meta><index>1</index><idxtype>regular</idxtype></meta>
+<text category="PRO">what</text>
+</nonterminal>
+<text category="VBD">saw</text>
+<trace category="NP" subcategory="OB1" tracetype="T"><meta><index>1</index><idxtype>regular</idxtype></meta></trace>
+<nonterminal category="CONJP">
+<nonterminal category="IP" subcategory="MAT"><meta><index>2</index><idxtype>gap</idxtype></meta>
+<text category="VBD">left</text>
+</nonterminal>
+</nonterminal>
+<nonterminal category="PP"><meta><index>2</index><idxtype>regular</idxtype></meta>
+<text category="P">at</text>
+</nonterminal>
+</nonterminal>
+</sentence>
+<sentence id="TWO">
+<nonterminal category="IP" subcategory="MAT">
+<nonterminal category="NP" subcategory="SBJ"><meta><index>3</index><idxtype>regular</idxtype></meta>
+<text category="PRO">who</text>
+</nonterminal>
+</nonterminal>
+</sentence>
+</corpus>
+"""
+
+class CoindexTest(testtools.TestCase):
+    def setUp(self):
+        super(CoindexTest, self).setUp()
+        self.corpus = parse_string(PSDX)
+        self.s = self.corpus[0]
+        self.nodes = {x.label(): x for x in self.s.tree().subtrees()}
+
+    def test_table(self):
+        table = coindex_table(self.nodes["VBD"])
+        self.assertIs(coindex_table(self.nodes["NP-OB1"]), table)
+        self.assertEqual(sorted(table.indices()), ["1", "2"])
+        self.assertEqual(table.nodes("1"),
+                         [self.nodes["NP-SBJ"], self.nodes["NP-OB1"]])
+        self.assertEqual(table.nodes("4"), [])
+        self.assertEqual(table.entry("1"),
+                         (self.nodes["NP-SBJ"], [self.nodes["NP-OB1"]], []))
+        self.assertEqual(table.entry("2"),
+                         (self.nodes["PP"], [], [self.nodes["IP-MAT"]]))
+        self.assertTrue(table.valid())
+        self.assertTrue(lovett.util.validateIndices(self.s.tree()))
+        self.assertFalse(lovett.util.validateIndices(self.corpus[1].tree()))
+
+    def test_searchfns(self):
+        ip = self.s.tree()
+        trace = self.nodes["NP-OB1"]
+        self.assertEqual(antecedent()(trace), self.nodes["NP-SBJ"])
+        self.assertIsNone(antecedent(hasLabel("PP"))(trace))
+        self.assertIs(hasAntecedent(hasLabel("NP"))(trace), trace)
+        self.assertEqual(coIndexed()(self.nodes["PP"]),
+                         [self.nodes["IP-MAT"]])
+        self.assertIsNone(coIndexed()(self.nodes["VBD"]))
+        self.assertIs(hasCoIndexed(hasLabel("PP"))(self.nodes["IP-MAT"]),
+                      self.nodes["IP-MAT"])
+        self.assertEqual([x.label() for x in
+                          deep(isTrace() & antecedent())(ip)],
+                         ["NP-SBJ"])
+
+    def test_invalidated(self):
+        table = coindex_table(self.nodes["VBD"])
+        lovett.util.set_index(self.nodes["VBD"], "1")
+        self.assertIsNot(coindex_table(self.nodes["VBD"]), table)
+        self.assertIsNone(antecedent()(self.nodes["NP-OB1"]))
+        lovett.util.remove_index(self.nodes["VBD"])
+        self.assertEqual(antecedent()(self.nodes["NP-OB1"]),
+                         self.nodes["NP-SBJ"])
+        lovett.util.remove_index(self.nodes["NP-SBJ"])
+        self.assertFalse(lovett.util.validateIndices(self.s.tree()))
+
+    def test_frozen(self):
+        frozen = self.corpus.freeze()
+        ip = frozen[0].tree()
+        nodes = {x.label(): x for x in ip.subtrees()}
+        table = coindex_table(nodes["NP-OB1"])
+        self.assertIs(coindex_table(ip), table)
+        self.assertThat(table, testtools.matchers.IsInstance(CoindexTable))
+        self.assertEqual(antecedent()(nodes["NP-OB1"]), nodes["NP-SBJ"])
+        self.assertEqual(table.entry("2"),
+                         (nodes["PP"], [], [nodes["IP-MAT"]]))
@@ -0,0 +1,102 @@
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+
+import testtools
+import lxml.etree
+from click.testing import CliRunner
+
+from lovett.compression import (open_file, is_compressed, strip_extension)
+from lovett.corpus import (parse_file, iter_sentences, _guess_format)
+from lovett.psd import (iter_deep_file, parse_deep_string)
+from lovett.offsets import OffsetIndex
+from lovett.cli.cli import cli
+
+PSDX = """<corpus>
+<SENTENCE id="ONE"><TEXT CATEGORY="N">foo</TEXT></SENTENCE>
+<SENTENCE id="TWO"><TEXT CATEGORY="N">bar</TEXT></SENTENCE>
+</corpus>
+"""
+
+DEEP = """( (IP-MAT (NP-SBJ (N (ORTHO foo))))
+  (ID ONE))
+
+( (IP-MAT (NP-SBJ (N (ORTHO bar))))
+  (ID TWO))
+"""
+
+_openers = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+class CompressionTest(testtools.TestCase):
+    def setUp(self):
+        super(CompressionTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write(self, name, text, opener=None):
+        path = os.path.join(self.dir, name)
+        if opener is None:
+            opener = _openers.get(os.path.splitext(name)[1], open)
+        with opener(path, "wb") as f:
+            f.write(text.encode("utf-8"))
+        return path
+
+    def test_strip_extension(self):
+        self.assertEqual(strip_extension("a.psdx.gz"), "a.psdx")
+        self.assertEqual(strip_extension("a.psdx"), "a.psdx")
+        self.assertEqual(_guess_format("a.psd.XZ"), "psd")
+
+    def test_parse_file(self):
+        for ext in _openers:
+            path = self.write("a.psdx" + ext, PSDX)
+            self.assertTrue(is_compressed(path))
+            corpus = parse_file(path)
+            self.assertEqual(len(corpus.getroot()), 2)
+            self.assertEqual(corpus.getroot()[0].tag, "sentence")
+
+    def test_iter_sentences(self):
+        path = self.write("a.psdx.bz2", PSDX)
+        ids = [s.get("id") for s in iter_sentences(path)]
+        self.assertEqual(ids, ["ONE", "TWO"])
+
+    def test_iter_deep_file(self):
+        path = self.write("a.psd.xz", DEEP)
+        ids = [s.id() for s in iter_deep_file(path)]
+        self.assertEqual(ids, ["ONE", "TWO"])
+
+    def test_magic(self):
+        # No compression extension: recognized from the contents
+        path = self.write("a.psdx", PSDX, gzip.open)
+        self.assertTrue(is_compressed(path))
+        self.assertEqual(len(parse_file(path).getroot()), 2)
+        self.assertFalse(is_compressed(self.write("b.psdx", PSDX)))
+
+    def test_write(self):
+        path = os.path.join(self.dir, "out.psd.gz")
+        with open_file(path, "w") as f:
+            f.write(DEEP)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), DEEP)
+
+    def test_offsets(self):
+        path = self.write("a.psdx.gz", PSDX)
+        self.assertRaises(ValueError, OffsetIndex(path).spans)
+
+    def test_cli(self):
+        psdx = lxml.etree.tostring(parse_deep_string(DEEP.strip()))
+        src = self.write("a.psdx.gz", psdx.decode("utf-8"))
+        formatted = os.path.join(self.dir, "b.psdx.xz")
+        deep = os.path.join(self.dir, "b.psd.bz2")
+        runner = CliRunner()
+        result = runner.invoke(cli, ["format", src, formatted])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with lzma.open(formatted) as f:
+            self.assertEqual(len(lxml.etree.parse(f).getroot()), 2)
+        result = runner.invoke(cli, ["convert", "-f", "psdx", "-t", "deep",
+                                     formatted, deep])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with bz2.open(deep, "rt", encoding="utf-8") as f:
+            self.assertIn("(ID ONE)", f.read())
@@ -1,6 +1,13 @@
+import io
+import os
+import shutil
+import tempfile
 import testtools
-from testtools.matchers import (Not, IsInstance)
-from ..corpus import (parse_string, _validate_psdx, Corpus)
+import lxml.etree
+from testtools.matchers import (Not, Is, IsInstance)
+from ..corpus import (parse_string, _validate_psdx, Corpus, iter_sentences,
+                      parse_files, LazyCorpus, iter_files, map_sentences,
+                      make_corpus)
 from .utils import PassesValidation
 from ..tree import (Sentence, NonTerminal, Text, Trace, Ec, Comment)
 
@@ -45,3 +52,174 @@ class TestCorpusXml(testtools.TestCase):
         for case in cases:
             parsed = parse_string("<%s/>" % case[0])
             self.expectThat(parsed, IsInstance(case[1]))
+
+class TestCaseNormalization(testtools.TestCase):
+    def test_lower_case(self):
+        parsed = parse_string("""
+        <corpus>
+        <sentence id="one">
+        <TEXT category="FOO">bar<meta><LEMMA>bar</LEMMA><x><Y>z</Y></x></meta></TEXT>
+        </sentence>
+        </corpus>
+        """)
+        self.assertEqual([x.tag for x in parsed.iter()],
+                         ["corpus", "sentence", "text", "meta", "lemma", "x",
+                          "y"])
+        self.assertThat(parsed[0][0], IsInstance(Text))
+
+    def test_upper_case(self):
+        parsed = parse_string("""
+        <CORPUS>
+        <SENTENCE ID="one">
+        <TEXT CATEGORY="FOO">bar<META><LEMMA>bar</LEMMA></META></TEXT>
+        </SENTENCE>
+        </CORPUS>
+        """)
+        self.assertEqual([x.tag for x in parsed.iter()],
+                         ["corpus", "sentence", "text", "meta", "lemma"])
+        self.assertThat(parsed, IsInstance(Corpus))
+
+class TestIterSentences(testtools.TestCase):
+    def test_iter_sentences(self):
+        f = io.BytesIO(b"""
+        <corpus>
+        <sentence id="one">
+        <text category="FOO">bar</text>
+        </sentence>
+        <SENTENCE id="two">
+        <NONTERMINAL CATEGORY="FOO">
+        <TEXT CATEGORY="BAR">baz</TEXT>
+        </NONTERMINAL>
+        </SENTENCE>
+        </corpus>
+        """)
+        sentences = list(iter_sentences(f))
+        self.assertEqual(len(sentences), 2)
+        for s in sentences:
+            self.expectThat(s, IsInstance(Sentence))
+            self.expectThat(s.getparent(), Is(None))
+        self.assertEqual(sentences[0].id(), "one")
+        self.assertEqual(sentences[1].tag, "sentence")
+        self.assertThat(sentences[1].tree(), IsInstance(NonTerminal))
+        self.assertEqual(sentences[1].tree()[0].tag, "text")
+
+class TestParseFiles(testtools.TestCase):
+    def setUp(self):
+        super(TestParseFiles, self).setUp()
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        self.paths = [os.path.join(d, "a.deep"), os.path.join(d, "b.psdx"),
+                      os.path.join(d, "c.deep")]
+        for path in self.paths[0], self.paths[2]:
+            with open(path, "w") as f:
+                f.write("\n\n".join("( (IP (N (ORTHO w%d)))\n  (ID %s,%d))" %
+                                     (i, path, i) for i in range(10)))
+        with open(self.paths[1], "w") as f:
+            f.write("<corpus><sentence id=\"x\"><text category=\"N\">y"
+                    "</text></sentence></corpus>")
+
+    def test_parse_files(self):
+        serial = parse_files(self.paths, workers=1)
+        parallel = parse_files(self.paths, workers=2)
+        self.assertEqual(len(serial), 21)
+        self.assertEqual(lxml.etree.tostring(serial),
+                         lxml.etree.tostring(parallel))
+        self.assertThat(parallel, IsInstance(Corpus))
+        self.assertThat(parallel[10], IsInstance(Sentence))
+
+# Top-level functions, so that they can be sent to worker processes
+
+def _word(sentence):
+    return sentence.tree()[0].text
+
+def _relabel(sentence):
+    sentence.tree().set_label("XP")
+    return sentence
+
+def _odd(sentence):
+    return int(_word(sentence)[1:]) % 2 == 1
+
+def _relabel_odd(sentence):
+    # A predicate which changes the sentence it is given
+    return _odd(_relabel(sentence))
+
+class TestMapFilter(testtools.TestCase):
+    def setUp(self):
+        super(TestMapFilter, self).setUp()
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        self.path = os.path.join(d, "a.deep")
+        with open(self.path, "w") as f:
+            f.write("\n\n".join("( (IP (N (ORTHO w%d)))\n  (ID S,%d))" %
+                                 (i, i) for i in range(25)))
+        self.corpus = parse_files([self.path], workers=1)
+
+    def test_map(self):
+        words = ["w%d" % i for i in range(25)]
+        for workers in 1, 2:
+            self.assertEqual(list(self.corpus.map(_word, workers=workers,
+                                                  chunk_size=4)),
+                             words)
+        lazy = LazyCorpus(self.path)
+        self.assertEqual(list(lazy.map(_word, workers=2, chunk_size=4)),
+                         words)
+        streamed = map_sentences(_word, iter_files([self.path], workers=1),
+                                 workers=2, chunk_size=4)
+        self.assertEqual(list(streamed), words)
+
+    def test_map_trees(self):
+        before = lxml.etree.tostring(self.corpus)
+        for workers in 1, 2:
+            new = make_corpus(self.corpus.map(_relabel, workers=workers,
+                                              chunk_size=4))
+            self.assertEqual(lxml.etree.tostring(self.corpus), before)
+            self.assertEqual(len(self.corpus), 25)
+            self.assertThat(new, IsInstance(Corpus))
+            self.assertEqual(len(new), 25)
+            self.assertThat(new[3], IsInstance(Sentence))
+            self.assertEqual(new[3].tree().label(), "XP")
+            self.assertEqual(new[3].id(), "S,3")
+
+    def test_filter(self):
+        odd = ["S,%d" % i for i in range(1, 25, 2)]
+        for workers in 1, 2:
+            kept = list(self.corpus.filter(_odd, workers=workers,
+                                           chunk_size=4))
+            self.assertEqual([s.id() for s in kept], odd)
+        # The sentences themselves, not copies
+        self.assertIs(kept[0], self.corpus[1])
+        before = lxml.etree.tostring(self.corpus)
+        for workers in 1, 2:
+            kept = list(self.corpus.filter(_relabel_odd, workers=workers,
+                                           chunk_size=4))
+            self.assertEqual([s.id() for s in kept], odd)
+            self.assertEqual(lxml.etree.tostring(self.corpus), before)
+        lazy = LazyCorpus(self.path)
+        self.assertEqual([s.id() for s in lazy.filter(_odd, workers=2)], odd)
+
+class TestLazyCorpus(testtools.TestCase):
+    def setUp(self):
+        super(TestLazyCorpus, self).setUp()
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        self.path = os.path.join(d, "a.deep")
+        self.text = "\n\n".join("( (IP (N (ORTHO w%d)))\n  (ID S,%d))" %
+                                 (i, i) for i in range(10))
+        with open(self.path, "w") as f:
+            f.write(self.text)
+
+    def test_access(self):
+        c = LazyCorpus(self.path, cache_size=3)
+        self.assertEqual(len(c), 10)
+        self.assertEqual(c[4].id(), "S,4")
+        self.assertEqual(c[-1].id(), "S,9")
+        self.assertIs(c[4], c[4])
+        self.assertEqual(c.get_sentence("S,7").id(), "S,7")
+        self.assertRaises(IndexError, lambda: c[10])
+        self.assertEqual([s.id() for s in c.trees()],
+                         ["S,%d" % i for i in range(10)])
+        self.assertEqual(len(c._cache), 3)
+
+    def test_to_deep(self):
+        self.assertEqual(LazyCorpus(self.path, cache_size=2).to_deep(),
+                         self.text)
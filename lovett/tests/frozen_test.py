@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+
+import testtools
+
+from lovett.corpus import parse_string
+from lovett.frozen import (FrozenCorpus, FrozenNode, freeze_file)
+from lovett.cs.searchfns import (hasLabel, hasLemma, deep, antecedent,
+                                 isTrace, hasParent, hasSister, daughters)
+from lovett.tree import (AnnotaldXmlError, intern_label)
+import lovett.util
+
+PSDX = """<corpus>
+<sentence id="ONE">
+<nonterminal category="IP" subcategory="MAT">
+<nonterminal category="NP" subcategory="SBJ"><meta><index>1</index><idxtype>regular</idxtype></meta>
+<text category="PRO">what<meta><lemma>what</lemma></meta></text>
+</nonterminal>
+<text category="VBD">saw<meta><lemma>see</lemma><morph><tense>past</tense></morph></meta></text>
+<trace category="NP" subcategory="OB1" tracetype="T"><meta><index>1</index><idxtype>regular</idxtype></meta></trace>
+<ec category="NP" ectype="pro"/>
+<comment comtype="COM">a comment</comment>
+</nonterminal>
+</sentence>
+<sentence id="TWO">
+<nonterminal category="IP" subcategory="MAT">
+<text category="VBD">left</text>
+</nonterminal>
+</sentence>
+</corpus>
+"""
+
+DEEP = """( (IP-MAT (NP-SBJ (PRO (ORTHO I)))
+          (VBD (ORTHO saw)))
+  (ID ONE))
+
+( (IP-MAT (VBD (ORTHO left)))
+  (ID TWO))
+"""
+
+class FrozenTest(testtools.TestCase):
+    def setUp(self):
+        super(FrozenTest, self).setUp()
+        self.corpus = parse_string(PSDX)
+        self.frozen = self.corpus.freeze()
+
+    def test_structure(self):
+        f = self.frozen
+        self.assertEqual(len(f), 2)
+        s = f[0]
+        self.assertEqual(s.tag, "sentence")
+        self.assertEqual(s.id(), "ONE")
+        ip = s.tree()
+        self.assertEqual(ip.label(), "IP-MAT")
+        self.assertEqual(ip.getparent(), s)
+        self.assertEqual([x.label() for x in ip.children()],
+                         ["NP-SBJ", "VBD", "NP-OB1", "NP", "CODE"])
+        self.assertEqual([x.tag for x in ip.subtrees()],
+                         ["nonterminal", "text", "text", "trace", "ec",
+                          "comment"])
+        vbd = list(ip.children())[1]
+        self.assertEqual(vbd.text, "saw")
+        self.assertEqual(vbd.left_sibling().label(), "NP-SBJ")
+        self.assertEqual(vbd.right_sibling().tracetype(), "T")
+        self.assertIsNone(vbd.right_sibling().text)
+        comment = list(ip.children())[-1]
+        self.assertEqual(comment.comtype(), "COM")
+        self.assertEqual(comment.text, "a comment")
+        self.assertIsNone(comment.right_sibling())
+        self.assertEqual(list(ip.children())[3].ectype(), "pro")
+        self.assertEqual(ip.urtext(), "what saw")
+        self.assertEqual(f[1].tree().urtext(), "left")
+
+    def test_metadata(self):
+        ip = self.frozen[0].tree()
+        np, vbd, trace = list(ip.children())[:3]
+        self.assertEqual(lovett.util.index(np), "1")
+        self.assertEqual(lovett.util.index_type(trace), "regular")
+        self.assertIsNone(lovett.util.index(vbd))
+        self.assertEqual(vbd.get_meta("LEMMA"), "see")
+        self.assertEqual(vbd.metadata()["morph"], {"tense": "past"})
+        self.assertEqual(dict(trace.metadata()),
+                         {"index": "1", "idxtype": "regular"})
+        self.assertTrue(vbd.has_meta())
+        self.assertFalse(ip.has_meta())
+        meta = vbd.metadata()
+        def mutate():
+            meta["x"] = "y"
+        self.assertRaises(TypeError, mutate)
+        comment = list(ip.children())[-1]
+        self.assertRaises(AnnotaldXmlError, comment.metadata)
+
+    def test_searchfns(self):
+        fns = [deep(hasLabel("NP")),
+               deep(isTrace() & antecedent(hasLabel("NP"))),
+               deep(hasLemma("see")),
+               deep(hasLabel("PRO") & hasParent(hasLabel("NP"))),
+               deep(hasLabel("VBD") & hasSister(hasLabel("NP-OB1"))),
+               hasLabel("IP") & daughters(hasLabel("NP"))]
+        for fn in fns:
+            live = [(x.tag, x.label()) for s in self.corpus.trees()
+                    for x in fn(s.tree())]
+            frozen = [(x.tag, x.label()) for s in self.frozen.trees()
+                      for x in fn(s.tree())]
+            self.assertEqual(live, frozen, str(fn))
+            self.assertNotEqual(live, [], str(fn))
+        trace = list(self.frozen[0].tree().children())[2]
+        self.assertEqual(antecedent()(trace),
+                         list(self.frozen[0].tree().children())[0])
+
+    def test_sentence_label(self):
+        ip = self.frozen[0].tree()
+        self.assertIsNone(ip.getparent().label_id())
+        # The sentence has no label, so it cannot match the last label
+        # interned, whatever it is
+        intern_label("ZZZ-SENTENCE")
+        self.assertIsNone(hasParent(hasLabel("ZZZ-SENTENCE"))(ip))
+        self.assertIsNone(hasParent(hasLabel("ZZZ-SENTENCE")).compile()(ip))
+
+    def test_handles(self):
+        a = self.frozen[0].tree()
+        b = list(self.frozen[0].children())[0]
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertNotEqual(a, self.frozen[1].tree())
+        self.assertThat(a, testtools.matchers.IsInstance(FrozenNode))
+
+    def test_freeze_file(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        path = os.path.join(d, "a.psd")
+        with open(path, "w") as f:
+            f.write(DEEP)
+        frozen = freeze_file(path, format="deep")
+        self.assertThat(frozen, testtools.matchers.IsInstance(FrozenCorpus))
+        self.assertEqual([s.id() for s in frozen.trees()], ["ONE", "TWO"])
+        self.assertEqual(frozen[0].tree().urtext(), "I saw")
@@ -0,0 +1,154 @@
+import testtools
+
+from lovett.corpus import parse_string
+from lovett.cs.searchfns import (hasLabel, deep, hasParent, iPrecedes,
+                                 isLeaf)
+from lovett.cs.transformer import TreeTransformer
+from lovett.labels import (LabelIndex, label_index)
+
+PSDX = """<corpus>
+<sentence id="ONE">
+<nonterminal category="IP" subcategory="MAT">
+<nonterminal category="NP" subcategory="SBJ">
+<text category="NPR">John</text>
+</nonterminal>
+<text category="V">eats</text>
+<nonterminal category="NP" subcategory="OB1">
+<nonterminal category="NP">
+<text category="D">the</text>
+<text category="N">apple</text>
+</nonterminal>
+<ec category="NP" ectype="pro"/>
+</nonterminal>
+<comment comtype="COM">note</comment>
+</nonterminal>
+</sentence>
+<sentence id="TWO">
+<nonterminal category="IP" subcategory="MAT">
+<text category="V">left</text>
+<nonterminal category="NP">
+<text category="N">home</text>
+</nonterminal>
+</nonterminal>
+</sentence>
+</corpus>
+"""
+
+class LabelsTest(testtools.TestCase):
+    def setUp(self):
+        super(LabelsTest, self).setUp()
+        self.corpus = parse_string(PSDX)
+        self.s = self.corpus[0]
+
+    def test_index(self):
+        index = self.corpus.index_labels()
+        self.assertIs(self.corpus.index_labels(), index)
+        self.assertEqual(len(index), 16)
+        self.assertEqual([x.text for x in index.nodes("CODE")], ["note"])
+        self.assertEqual([x.text for x in index.nodes("N")],
+                         ["apple", "home"])
+        self.assertEqual([x.label() for x in index.category("NP")],
+                         ["NP-SBJ", "NP-OB1", "NP", "NP", "NP"])
+        self.assertEqual(len(index.nodes("NP")), 3)
+        self.assertEqual([x.text for x in index.nodes("N", self.s.tree())],
+                         ["apple"])
+        self.assertEqual(index.nodes("CP-REL"), [])
+        self.assertEqual(index.count("V"), 2)
+        self.assertEqual(index.count("NP-SBJ"), 1)
+        self.assertEqual(index.count("NO-SUCH"), 0)
+        self.assertIs(label_index(self.s.tree()), index)
+        self.corpus.drop_labels()
+        self.assertIsNone(label_index(self.s.tree()))
+
+    def test_searchfns(self):
+        queries = [hasLabel("NP"),
+                   hasLabel("NP", exact=True) & hasParent(hasLabel("IP")),
+                   hasLabel("V") & iPrecedes(hasLabel("NP")),
+                   hasLabel("N") | hasLabel("V"),
+                   isLeaf()]
+        queries += [q.compile() for q in queries]
+        fns = [deep(q) for q in queries]
+        fns += [fn.compile() for fn in fns]
+
+        def run(fn):
+            return [x.label() for s in self.corpus.trees()
+                    for x in fn(s.tree())]
+
+        def find(fn):
+            return [x.label() for s in self.corpus.trees()
+                    for x in TreeTransformer(s).findNodes(fn).matches()]
+        plain = [run(fn) for fn in fns]
+        found = [find(q) for q in queries]
+        self.corpus.index_labels()
+        self.assertEqual([run(fn) for fn in fns], plain)
+        self.assertEqual([find(q) for q in queries], found)
+        self.assertEqual(found[:2], [["NP-SBJ", "NP-OB1", "NP", "NP", "NP"],
+                                     ["NP"]])
+        self.assertEqual(plain[1], ["NP"])
+        self.assertEqual(plain[2], ["V", "V"])
+
+    def test_find_root(self):
+        self.corpus.index_labels()
+        tt = TreeTransformer(self.s)
+        self.assertEqual([x.label() for x in
+                          tt.findNodes(hasLabel("IP")).matches()],
+                         ["IP-MAT"])
+
+    def test_set_label(self):
+        index = self.corpus.index_labels()
+        blocks = list(index._blocks)
+        d, = index.nodes("D")
+        d.set_label("Q")
+        self.assertTrue(index._current())
+        self.assertEqual(index._blocks, blocks)
+        self.assertEqual(index.nodes("D"), [])
+        self.assertEqual(index.nodes("Q"), [d])
+        n, = index.nodes("N", self.s.tree())
+        n.set_label("NP-ADV")
+        self.assertEqual([x.label() for x in index.category("NP")],
+                         ["NP-SBJ", "NP-OB1", "NP", "NP-ADV", "NP", "NP"])
+        self.assertEqual([x.label() for x in
+                          deep(hasLabel("NP") & ~hasLabel("NP-ADV"))(
+                              self.s.tree())],
+                         ["NP-SBJ", "NP-OB1", "NP", "NP"])
+
+    def test_transformer_relabel(self):
+        index = self.corpus.index_labels()
+        blocks = list(index._blocks)
+        tt = TreeTransformer(self.s)
+        tt.findNodes(hasLabel("NP")).changeLabel("DP")
+        self.assertTrue(index._current())
+        self.assertEqual([x.label() for x in index.category("DP")],
+                         ["DP", "DP", "DP", "DP"])
+        tt.rollback()
+        self.assertEqual(index.count("DP"), 0)
+        self.assertEqual(index.count("NP-SBJ"), 1)
+        # Neither the relabelling nor the rollback reads the other
+        # sentence again, and the relabelling reads none at all
+        self.assertIs(index._blocks[1], blocks[1])
+        tt = TreeTransformer(self.corpus[1])
+        tt.findNodes(hasLabel("N")).changeLabel("NS")
+        self.assertIs(index._blocks[1], blocks[1])
+        self.assertEqual(index.count("NS"), 1)
+
+    def test_rebuild(self):
+        index = LabelIndex(self.corpus)
+        v, = index.nodes("V", self.s.tree())
+        other = index._blocks[1]
+        v.addnext(v.makeelement("text", category="N"))
+        self.assertFalse(index._current())
+        self.assertEqual(len(index.nodes("N")), 3)
+        self.assertEqual(len(index), 17)
+        self.assertIs(index._blocks[1], other)
+        self.assertEqual(index.position(self.corpus[1]), 12)
+        self.s.tree().remove(v)
+        self.assertIsNone(label_index(v))
+        self.assertEqual(index.count("V"), 1)
+        s = self.corpus[1]
+        self.corpus.remove(s)
+        self.assertEqual(len(index), 11)
+        self.assertEqual([x.text for x in index.nodes("N")], [None, "apple"])
+        self.corpus.insert(0, s)
+        self.assertEqual(index.position(s.tree()), 1)
+        self.assertEqual([x.text for x in index.nodes("N")],
+                         ["home", None, "apple"])
@@ -0,0 +1,122 @@
+import re
+
+import testtools
+
+from lovett.corpus import parse_string
+from lovett.cs.searchfns import (hasLabel, hasLemma, hasText, hasWord, deep,
+                                 hasParent, startsWith)
+from lovett.cs.transformer import TreeTransformer
+from lovett.lexicon import (LexicalIndex, lexical_index)
+from lovett.tree import invalidate_hashes
+
+PSDX = """<corpus>
+<sentence id="ONE">
+<nonterminal category="IP" subcategory="MAT">
+<nonterminal category="NP" subcategory="SBJ">
+<text category="PRO">they<meta><lemma>they</lemma></meta></text>
+</nonterminal>
+<text category="VBD">saw<meta><lemma>see</lemma></meta></text>
+<nonterminal category="NP" subcategory="OB1">
+<text category="D">the</text>
+<text category="N">saw-blade</text>
+</nonterminal>
+<comment comtype="COM">saw</comment>
+</nonterminal>
+</sentence>
+<sentence id="TWO">
+<nonterminal category="IP" subcategory="MAT">
+<text category="VBP">see<meta><lemma>see</lemma></meta></text>
+<text category="ADV">there</text>
+</nonterminal>
+</sentence>
+</corpus>
+"""
+
+class LexiconTest(testtools.TestCase):
+    def setUp(self):
+        super(LexiconTest, self).setUp()
+        self.corpus = parse_string(PSDX)
+        self.s = self.corpus[0]
+
+    def test_index(self):
+        index = self.corpus.index_lexicon()
+        self.assertIs(self.corpus.index_lexicon(), index)
+        self.assertEqual([x.tag for x in index.words("saw")],
+                         ["text", "comment"])
+        self.assertEqual([x.text for x in index.words(re.compile("^th"))],
+                         ["they", "the", "there"])
+        self.assertEqual([x.text for x in index.lemmas("see")],
+                         ["saw", "see"])
+        self.assertEqual([x.text for x in
+                          index.lemmas("see", self.corpus[1].tree())],
+                         ["see"])
+        self.assertEqual([s.get("id") for s in index.sentences("saw")],
+                         ["ONE"])
+        self.assertEqual([s.get("id") for s in
+                          index.sentences(lemma="see")], ["ONE", "TWO"])
+        self.assertEqual(index.count("saw"), 2)
+        self.assertEqual(index.count(lemma="they"), 1)
+        self.assertEqual(index.count("nothing"), 0)
+        self.assertEqual(sorted(index.vocabulary(lemmas=True)),
+                         ["see", "they"])
+        self.assertIn("saw-blade", index.vocabulary())
+        self.assertIs(lexical_index(self.s.tree()), index)
+        self.corpus.drop_lexicon()
+        self.assertIsNone(lexical_index(self.s.tree()))
+
+    def test_searchfns(self):
+        queries = [hasText("saw"),
+                   hasWord("saw"),
+                   hasWord(startsWith("th")),
+                   hasLemma("see"),
+                   hasLemma(re.compile("^t")) & hasParent(hasLabel("NP")),
+                   hasWord(re.compile("s")) & hasLabel("N")]
+        queries += [q.compile() for q in queries]
+        fns = [deep(q) for q in queries]
+
+        def run(fn):
+            return [x.text for s in self.corpus.trees()
+                    for x in fn(s.tree())]
+
+        def find(fn):
+            return [x.text for s in self.corpus.trees()
+                    for x in TreeTransformer(s).findNodes(fn).matches()]
+        plain = [run(fn) for fn in fns]
+        found = [find(q) for q in queries]
+        self.corpus.index_lexicon()
+        self.assertEqual([run(fn) for fn in fns], plain)
+        self.assertEqual([find(q) for q in queries], found)
+        self.assertEqual(plain[:6], [["saw", "saw-blade", "saw"],
+                                     ["saw", "saw"],
+                                     ["they", "the", "there"],
+                                     ["saw", "see"],
+                                     ["they"],
+                                     ["saw-blade"]])
+
+    def test_relabel(self):
+        index = self.corpus.index_lexicon()
+        blocks = list(index._blocks)
+        tt = TreeTransformer(self.s)
+        tt.findNodes(hasLemma("see")).changeLabel("VBP")
+        self.assertTrue(index._current())
+        self.assertEqual([x.label() for x in index.lemmas("see")],
+                         ["VBP", "VBP"])
+        tt.rollback()
+        self.assertEqual(index._blocks, blocks)
+        self.s.tree().set("subcategory", "SUB")
+        self.assertEqual(index._blocks, blocks)
+
+    def test_rebuild(self):
+        index = LexicalIndex(self.corpus)
+        vbp, = index.words("see")
+        vbp.metadata()["lemma"] = "view"
+        self.assertEqual(index.count(lemma="see"), 1)
+        self.assertEqual(index.lemmas("view"), [vbp])
+        first = index._blocks[0]
+        vbp.text = "view"
+        invalidate_hashes(vbp)
+        self.assertEqual(index.words("view"), [vbp])
+        self.assertIs(index._blocks[0], first)
+        index.corpus[1].tree().remove(vbp)
+        self.assertIsNone(lexical_index(vbp))
+        self.assertEqual(index.lemmas("view"), [])
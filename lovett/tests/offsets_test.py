@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+
+import testtools
+from testtools.matchers import IsInstance
+
+from lovett.offsets import (OffsetIndex, scan_offsets)
+from lovett.corpus import get_sentence
+from lovett.tree import Sentence
+
+DEEP = """( (IP (N (ORTHO foo)))
+  (ID ONE))
+
+( (IP (N (ORTHO bar)))
+  (ID TWO))
+"""
+
+PSDX = """<corpus>
+<sentence id="ONE"><text category="N">foo</text></sentence>
+<SENTENCE id="TWO"><TEXT CATEGORY="N">bar</TEXT></SENTENCE>
+<sentence><text category="N">baz</text></sentence>
+</corpus>
+"""
+
+class OffsetIndexTest(testtools.TestCase):
+    def setUp(self):
+        super(OffsetIndexTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write(self, name, contents):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def test_scan_deep(self):
+        path = self.write("a.deep", DEEP)
+        spans = scan_offsets(path)
+        self.assertEqual([s[0] for s in spans], ["ONE", "TWO"])
+        with open(path, "rb") as f:
+            data = f.read()
+        self.assertEqual(data[spans[1][1]:spans[1][2]].strip(),
+                         b"( (IP (N (ORTHO bar)))\n  (ID TWO))")
+
+    def test_scan_psdx(self):
+        path = self.write("a.psdx", PSDX)
+        spans = scan_offsets(path)
+        self.assertEqual([s[0] for s in spans], ["ONE", "TWO", None])
+
+    def test_get_sentence(self):
+        for name, contents in (("a.deep", DEEP), ("a.psdx", PSDX)):
+            path = self.write(name, contents)
+            s = get_sentence(path, "TWO")
+            self.assertThat(s, IsInstance(Sentence))
+            self.assertEqual(s.id(), "TWO")
+            self.assertEqual(s.findtext(".//text"), "bar")
+            self.assertTrue(os.path.exists(path + ".idx"))
+            self.assertRaises(KeyError, lambda: get_sentence(path, "THREE"))
+
+    def test_rebuild(self):
+        path = self.write("a.deep", DEEP)
+        index = OffsetIndex(path)
+        self.assertEqual(len(index), 2)
+        self.write("a.deep", DEEP + "\n( (IP (N (ORTHO baz)))\n  (ID THREE))\n")
+        self.assertEqual(len(index), 3)
+        self.assertEqual(OffsetIndex(path).get_sentence("THREE").id(),
+                         "THREE")
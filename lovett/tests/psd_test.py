@@ -1,3 +1,4 @@
+import io
 import testtools
 import lovett.psd_tree
 import lovett.psd as Psd
@@ -38,3 +39,72 @@ class TestPsd(testtools.TestCase):
             "lovett", "tests/data/icepahc-test.psdx")))
         self.assertThat(Psd.parse_deep_string(xml_parse_string(s).to_deep()),
                         MatchesXml(s))
+
+    def test_iter_deep_file(self):
+        s = """( (IP-MAT (NP-SBJ (PRO (ORTHO I)))
+          (VBD (ORTHO saw)))
+  (ID ONE))
+
+( (IP-MAT (VBD (ORTHO left)))
+  (ID TWO))
+"""
+        sentences = list(Psd.iter_deep_file(io.StringIO(s)))
+        corpus = Psd.parse_deep_string(s.strip())
+        self.assertEqual(len(sentences), 2)
+        for one, other in zip(sentences, corpus.trees()):
+            self.expectThat(one, MatchesXml(lxml.etree.tostring(other)))
+        self.assertEqual(sentences[1].id(), "TWO")
+
+    def test_parse_sentence_matches_legacy(self):
+        s = """( (IP-MAT (NP-SBJ (PRO (ORTHO I)) (META (LEMMA i)))
+          (N-3 (ORTHO $bar$) (META (x y) (z (w q))))
+          (VBD=7 (ORTHO saw))
+          (CODE (ALT-ORTHO {COM:foo_bar}))
+          (NP-OB1 (ALT-ORTHO *T*-1))
+          (NP-SBJ-4 (ALT-ORTHO *pro*))
+          (WNP-5 (ALT-ORTHO 0))
+          (NP (ALT-ORTHO *))
+          (NP-OB2 (ALT-ORTHO *ICH*=3) (META (a b))))
+  (ID foo))"""
+        self.assertEqual(
+            lxml.etree.tostring(Psd._parse_sentence(s, "deep")),
+            lxml.etree.tostring(Psd._parse_sentence_legacy(s, "deep")))
+
+    def test_parse_psd(self):
+        corpus = Psd.parse_psd_string(
+            "( (IP-MAT (NP-SBJ (PRO I)) (VBD saw) (NP-OB1 *T*-1) "
+            "(WNP-2 0) (NP *pro*)) (ID bar))")
+        self.assertThat(corpus[0], MatchesXml("""
+        <sentence id="bar">
+        <nonterminal category="IP" subcategory="MAT">
+        <nonterminal category="NP" subcategory="SBJ">
+        <text category="PRO">I</text>
+        </nonterminal>
+        <text category="VBD">saw</text>
+        <trace tracetype="T" category="NP" subcategory="OB1">
+        <meta><index>1</index><idxtype>regular</idxtype></meta>
+        </trace>
+        <ec ectype="zero" category="WNP">
+        <meta><index>2</index><idxtype>regular</idxtype></meta>
+        </ec>
+        <ec ectype="pro" category="NP"/>
+        </nonterminal>
+        </sentence>
+        """))
+
+    def test_parse_malformed(self):
+        for s in ("", "( (IP (N (ORTHO a)))", "( (IP (N (ORTHO a))) ) )",
+                  "( (IP (N (ORTHO a))) (N (ORTHO b)))"):
+            self.assertRaises(Psd.PsdParseError,
+                              lambda: Psd._parse_sentence(s, "deep"))
+
+    def test_parse_psd_parallel(self):
+        s = "\n\n".join("( (IP (N (ORTHO w%d)))\n  (ID S,%d))" % (i, i)
+                         for i in range(25))
+        serial = [lxml.etree.tostring(x)
+                  for x in Psd.iter_deep_file(io.StringIO(s))]
+        parallel = [lxml.etree.tostring(x)
+                    for x in Psd.parse_psd_parallel(io.StringIO(s), workers=2,
+                                                    _type="deep",
+                                                    chunk_size=4)]
+        self.assertEqual(serial, parallel)
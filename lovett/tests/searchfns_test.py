@@ -2,6 +2,7 @@ import unittest
 from lovett.cs.transformer import TreeTransformer
 from lovett.cs.searchfns import *
 import lovett.cs.searchfns
+import lovett.psd
 import re
 from lovett.corpus import parse_string
 import lxml.etree
@@ -107,6 +108,29 @@ class TestSearchFns(unittest.TestCase):
         print(lxml.etree.tostring(self.tt.matches()[0]))
         self.assertEqual(self.tt.matches(), [leaf("N", "apple")])
 
+    def test_indices(self):
+        t = LT("""
+        <sentence>
+        <nonterminal category="IP">
+        <nonterminal category="NP"><meta><index>1</index><idxtype>regular</idxtype></meta>
+        <text category="WPRO">what</text>
+        </nonterminal>
+        <text category="V">eats</text>
+        <trace category="NP" tracetype="T"><meta><index>1</index><idxtype>regular</idxtype></meta></trace>
+        </nonterminal>
+        </sentence>
+        """)
+        before = lxml.etree.tostring(t)
+        trace = t.find(".//trace")
+        np = t.find(".//nonterminal/nonterminal")
+        self.assertIs(isIndexed()(trace), trace)
+        self.assertIsNone(isIndexed()(t.find(".//text")))
+        self.assertEqual(coIndexed()(trace), [np])
+        self.assertIs(antecedent()(trace), np)
+        self.assertIs(hasAntecedent(hasLabel("NP"))(trace), trace)
+        self.assertIsNone(antecedent()(t.find(".//text")))
+        self.assertEqual(lxml.etree.tostring(t), before)
+
     ##### Tests for ignoring()
     @unittest.skip("ignore doesn't work")
     def test_ignoring_iPrecedes(self):
@@ -137,6 +161,82 @@ class TestSearchFns(unittest.TestCase):
         self.assertGreater(len(tt.matches()), 0)
     # TODO: test hasLemma, other fns
 
+    def test_compile(self):
+        t = lovett.psd.parse_psd_string(
+            "( (IP-MAT (NP-SBJ (D the-the) (N dog-dog)) (VBD saw-see) "
+            "(NP-OB1 (D a-a) (ADJ big-big) (N cat-cat)) "
+            "(PP (P with-with) (NP (N-1 joy-joy)))))", "dash")[0].tree()
+        fns = [deep(hasLabel("N")),
+               deep(hasLabel("N") & hasParent(hasLabel("NP"))),
+               deep(hasLabel("N") & hasAncestor(hasLabel("PP")) |
+                    hasLabel("VBD")),
+               deep(~hasLabel("NP") & hasDaughter(hasLabel("N"))),
+               deep(hasLabel("D") & iPrecedes(hasLabel("N") |
+                                              hasLabel("ADJ"))),
+               deep(hasLabel("N", exact=True) & ~hasLemma("cat")),
+               deep(hasLabel(re.compile("^N")) & ~~hasLabel("NP") &
+                    hasSister(hasLabel("D"))),
+               deep(hasLabel("NP") & daughters(hasLabel("N"))),
+               hasLabel("IP") & deep(hasLabel("N") & hasLabel("N"))]
+        for fn in fns:
+            c = fn.compile()
+            self.assertEqual(str(c), str(fn))
+            self.assertIs(c.compile(), c)
+            self.assertIsNone(c(None))
+            self.assertEqual(c(t), fn(t), str(fn))
+        fn = ~hasLabel("NP") & (isLeaf() | hasLabel("N")) | \
+            hasParent(hasLabel("PP"))
+        c = fn.compile()
+        for x in t.subtrees():
+            self.assertEqual(c(x), fn(x))
+
+    def test_memo(self):
+        fns = [hasDaughter(hasSister(hasLabel("D"))),
+               hasAncestor(hasDaughter(hasLabel("ADJ"))),
+               ~hasLabel("NP") | iPrecedes(hasLabel("N"))]
+        memo = Memo()
+        for fn in fns:
+            plain = self.tt.findNodes(fn).matches()
+            self.assertEqual(self.tt.findNodes(fn, memo=memo).matches(),
+                             plain, str(fn))
+            self.assertEqual(len(memo), 0)
+        self.assertGreater(memo.hits, 0)
+        self.assertGreater(memo.misses, memo.hits)
+        self.assertIsNone(lovett.cs.searchfns._memo)
+
+    def test_memo_invalidated(self):
+        fn = hasLabel("NP") & hasDaughter(hasLabel("D"))
+        with Memo() as memo:
+            np = fn(self.t.tree()[4])
+            self.assertIs(np, self.t.tree()[4])
+            self.assertGreater(len(memo), 0)
+            np[0].set_label("Q")
+            self.assertIsNone(fn(np))
+            hits = memo.hits
+            fn(np)
+            self.assertGreater(memo.hits, hits)
+
+    def test_memo_other_tree(self):
+        c = parse_string("""<corpus>
+        <sentence><nonterminal category="NP">
+        <text category="D">a</text></nonterminal></sentence>
+        <sentence><nonterminal category="NP">
+        <text category="D">b</text></nonterminal></sentence>
+        </corpus>""")
+        c.pin()
+        one, two = (s.tree() for s in c)
+        fn = hasDaughter(hasLabel("D"))
+        with Memo() as memo:
+            fn(one)
+            fn(two)
+            self.assertEqual(len(memo), 2)
+            # Only the results for the tree which changed are forgotten
+            two[0].set_label("N")
+            self.assertEqual(len(memo), 1)
+            self.assertIs(fn(one), one)
+            self.assertEqual(memo.hits, 1)
+            self.assertIsNone(fn(two))
+
     # TODO: test and, or, etc
     def test_str(self):
         def is_search_fn(x):
@@ -164,7 +264,6 @@ class TestSearchFns(unittest.TestCase):
             i = eval(s)
             self.assertEqual(s, str(i))
 
-    @unittest.skip("not implemented yet")
     def test_startswith(self):
         self.tt.findNodes(hasWord(startsWith("t")))
         self.assertEqual(self.tt.matches(),
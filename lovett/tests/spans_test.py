@@ -0,0 +1,111 @@
+import testtools
+
+from lovett.corpus import parse_string
+from lovett.cs.searchfns import (hasLabel, deep, iPrecedes, hasAncestor,
+                                 ancestor, domsWords)
+from lovett.spans import (SpanIndex, span_index)
+
+PSDX = """<corpus>
+<sentence id="ONE">
+<nonterminal category="IP" subcategory="MAT">
+<nonterminal category="ADVP">
+<text category="Q">very</text>
+<text category="ADV">slowly</text>
+</nonterminal>
+<nonterminal category="NP" subcategory="SBJ"><meta><index>1</index></meta>
+<text category="NPR">John<meta><lemma>john</lemma></meta></text>
+</nonterminal>
+<text category="V">eats</text>
+<nonterminal category="NP" subcategory="OB1">
+<nonterminal category="NP">
+<text category="D">the</text>
+<text category="N">apple</text>
+</nonterminal>
+<ec category="NP" ectype="pro"/>
+</nonterminal>
+</nonterminal>
+</sentence>
+<sentence id="TWO">
+<nonterminal category="IP" subcategory="MAT">
+<text category="V">left</text>
+</nonterminal>
+</sentence>
+</corpus>
+"""
+
+class SpansTest(testtools.TestCase):
+    def setUp(self):
+        super(SpansTest, self).setUp()
+        self.corpus = parse_string(PSDX)
+        self.s = self.corpus[0]
+
+    def nodes(self, label):
+        return [x for x in self.s.tree().subtrees() if x.label() == label]
+
+    def test_index(self):
+        spans = self.s.index_spans()
+        self.assertIs(self.s.index_spans(), spans)
+        ip = self.s.tree()
+        advp, = self.nodes("ADVP")
+        npr, = self.nodes("NPR")
+        v, = self.nodes("V")
+        d, = self.nodes("D")
+        ec, = self.nodes("NP")[-1:]
+        self.assertEqual(len(spans), 13)
+        self.assertEqual(spans.position(ip), 1)
+        self.assertIs(spans.node(2), advp)
+        self.assertEqual(spans.depth(ip), 1)
+        self.assertEqual(spans.depth(d), 4)
+        self.assertEqual(spans.leaf_span(ip), (0, 7))
+        self.assertEqual(spans.leaf_span(v), (3, 4))
+        self.assertEqual(spans.leaf_count(advp), 2)
+        self.assertEqual(spans.word_count(ip), 6)
+        self.assertTrue(spans.dominates(ip, d))
+        self.assertFalse(spans.dominates(d, d))
+        self.assertFalse(spans.dominates(advp, v))
+        self.assertTrue(spans.precedes(advp, v))
+        self.assertFalse(spans.precedes(ip, v))
+        self.assertTrue(spans.adjacent(npr, v))
+        self.assertFalse(spans.adjacent(advp, v))
+        self.assertEqual([x.label() for x in spans.left_edge_after(v)],
+                         ["NP-OB1", "NP", "D"])
+        self.assertEqual(list(spans.left_edge_after(ec)), [])
+        self.assertIsNone(spans.position(self.corpus[1].tree()))
+        self.assertRaises(ValueError, spans.depth, self.corpus[1].tree())
+
+    def test_searchfns(self):
+        fns = [deep(hasLabel("NPR") & iPrecedes(hasLabel("V"))),
+               deep(hasLabel("V") & iPrecedes(hasLabel("D"))),
+               deep(hasLabel("Q") & iPrecedes(hasLabel("NPR"))),
+               deep(hasLabel("N") & hasAncestor(hasLabel("IP"))),
+               deep(hasLabel("N") & hasAncestor(hasLabel("ADVP"))),
+               deep(hasLabel("D") & ancestor(hasLabel("NP-OB1"))),
+               deep(domsWords(2)),
+               deep(domsWords(1))]
+        def run(fn):
+            return [x.label() for s in self.corpus.trees()
+                    for x in fn(s.tree())]
+        plain = [run(fn) for fn in fns]
+        self.corpus.index_spans()
+        self.assertIsNotNone(span_index(self.s.tree()))
+        indexed = [run(fn) for fn in fns]
+        self.assertEqual(plain, indexed)
+        self.assertEqual(plain[:4], [["NPR"], ["V"], [], ["N"]])
+        self.assertEqual(plain[5], ["NP-OB1"])
+        self.assertEqual(plain[6], ["ADVP", "NP-OB1", "NP"])
+        self.corpus.drop_spans()
+        self.assertIsNone(span_index(self.s.tree()))
+
+    def test_rebuild(self):
+        spans = SpanIndex(self.s)
+        v, = self.nodes("V")
+        d, = self.nodes("D")
+        self.assertTrue(spans.adjacent(v, d))
+        v.addnext(v.makeelement("text", category="P"))
+        self.assertFalse(spans.adjacent(v, d))
+        p, = self.nodes("P")
+        self.assertTrue(spans.adjacent(v, p))
+        self.assertEqual(len(spans), 14)
+        self.s.tree().remove(p)
+        self.assertIsNone(span_index(p))
+        self.assertTrue(spans.adjacent(v, d))
@@ -0,0 +1,161 @@
+import lxml.etree
+import testtools
+
+from lovett.corpus import parse_string
+from lovett.cs.searchfns import hasLabel
+from lovett.cs.transformer import TreeTransformer
+import lovett.util
+
+PSDX = """<corpus>
+<sentence id="ONE">
+<nonterminal category="IP" subcategory="MAT">
+<nonterminal category="NP" subcategory="SBJ">
+<text category="NPR">John</text>
+</nonterminal>
+<text category="VBD">saw</text>
+<nonterminal category="NP" subcategory="OB1">
+<text category="D">the</text>
+<nonterminal category="ADJP"><text category="ADJ">big</text></nonterminal>
+<text category="N">dog</text>
+</nonterminal>
+</nonterminal>
+</sentence>
+</corpus>
+"""
+
+class TransformerTest(testtools.TestCase):
+    def setUp(self):
+        super(TransformerTest, self).setUp()
+        self.corpus = parse_string(PSDX)
+        self.s = self.corpus[0]
+        self.before = lxml.etree.tostring(self.s)
+        self.tt = TreeTransformer(self.s)
+
+    def labels(self):
+        return [x.label() for x in self.s.tree().subtrees()]
+
+    def test_change_label(self):
+        self.tt.findNodes(hasLabel("NP")).changeLabel(lambda l: l + "X")
+        self.assertEqual(self.labels(),
+                         ["NP-SBJX", "NPR", "VBD", "NP-OB1X", "D", "ADJP",
+                          "ADJ", "N"])
+        self.tt.rollback()
+        self.assertEqual(lxml.etree.tostring(self.s), self.before)
+
+    def test_add_dash_tag(self):
+        self.tt.findNodes(hasLabel("NP")).addDashTag("FLAG")
+        self.assertEqual(self.labels()[::3],
+                         ["NP-SBJ-FLAG", "NP-OB1-FLAG", "ADJ"])
+        self.tt.findNodes(hasLabel("ADJP")).addDashTag("PRD")
+        self.assertEqual(self.labels()[5], "ADJP-PRD")
+        self.tt.rollback()
+        self.assertEqual(lxml.etree.tostring(self.s), self.before)
+
+    def test_add_parent_and_prune(self):
+        self.tt.findNodes(hasLabel("VBD")).addParentNode("VP")
+        self.assertEqual(self.labels()[:4], ["NP-SBJ", "NPR", "VP", "VBD"])
+        self.tt.findNodes(hasLabel("ADJP")).prune()
+        self.assertEqual(self.labels()[4:],
+                         ["NP-OB1", "D", "ADJ", "N"])
+        self.tt.rollback()
+        self.assertEqual(lxml.etree.tostring(self.s), self.before)
+
+    def test_add_sister_and_daughter(self):
+        self.tt.findNodes(hasLabel("NPR")).addSister("D", "the", before=True,
+                                                     coindex=True)
+        self.tt.findNodes(hasLabel("ADJP")).addDaughter("ADV", "very")
+        self.assertEqual(self.labels(),
+                         ["NP-SBJ", "D", "NPR", "VBD", "NP-OB1", "D",
+                          "ADJP", "ADV", "ADJ", "N"])
+        npr = self.tt.findNodes(hasLabel("NPR")).matches()[0]
+        self.assertEqual(lovett.util.index(npr), "1")
+        self.tt.rollback()
+        self.assertEqual(lxml.etree.tostring(self.s), self.before)
+
+    def test_snapshot(self):
+        self.tt.findNodes(hasLabel("N")).changeLabel("NS")
+        after_first = lxml.etree.tostring(self.s)
+        token = self.tt.snapshot()
+        self.tt.findNodes(hasLabel("NP")).changeLabel("DP")
+        self.tt.findNodes(hasLabel("IP")).addParentNode("CP")
+        self.assertEqual(self.s.tree().label(), "CP")
+        self.tt.rollback(token)
+        self.assertEqual(lxml.etree.tostring(self.s), after_first)
+        self.tt.commit()
+        self.tt.rollback()
+        self.assertEqual(lxml.etree.tostring(self.s), after_first)
+
+    def test_copies_only_changed_subtrees(self):
+        self.tt.findNodes(hasLabel("ADJ")).changeLabel("ADJR")
+        self.tt.findNodes(hasLabel("ADJP")).addDaughter("ADV", "very")
+        self.tt.findNodes(hasLabel("D")).changeLabel("Q")
+        # Nothing is copied: for the relabelled leaves, only their
+        # attributes are saved, and for the new daughter, where it went
+        self.assertEqual([x for _, x in self.tt._undo],
+                         [{"category": "ADJ"}, ("insert", 0),
+                          {"category": "D"}])
+        self.tt.rollback()
+        self.assertEqual(lxml.etree.tostring(self.s), self.before)
+
+    def test_rollback_keeps_nodes(self):
+        s = parse_string("""<sentence id="ONE">
+        <nonterminal category="IP" subcategory="MAT">
+        <nonterminal category="NP" subcategory="SBJ"><meta><index>1</index><idxtype>regular</idxtype></meta>
+        <text category="PRO">it</text></nonterminal>
+        <nonterminal category="VP"/>
+        </nonterminal>
+        </sentence>""")
+        before = lxml.etree.tostring(s)
+        tt = TreeTransformer(s)
+        pro = tt.findNodes(hasLabel("PRO")).matches()[0]
+        tt.findNodes(hasLabel("NP")).addParentNode("XP", move_index=True)
+        tt.findNodes(hasLabel("XP")).addSister("ADV", "so", before=False,
+                                               coindex=True)
+        tt.findNodes(hasLabel("VP")).prune()
+        tt.findNodes(hasLabel("NP")).prune()
+        self.assertEqual([x.label() for x in s.tree().subtrees()],
+                         ["XP", "PRO", "ADV"])
+        self.assertFalse(any(isinstance(x, lxml.etree._Element)
+                             for _, x in tt._undo))
+        tt.rollback()
+        self.assertEqual(lxml.etree.tostring(s), before)
+        self.assertIs(next(s.tree()[0].children()), pro)
+
+    def test_change_label_saves_attributes(self):
+        self.tt.findNodes(hasLabel("IP")).changeLabel("CP")
+        self.tt.findNodes(hasLabel("NP-OB1")).changeLabel("NP")
+        self.tt.findNodes(hasLabel("ADJ")).addSister("ADV", "very")
+        self.assertEqual([x for _, x in self.tt._undo][:2],
+                         [{"category": "IP", "subcategory": "MAT"},
+                          {"category": "NP", "subcategory": "OB1"}])
+        self.assertEqual(self.labels()[3:5], ["NP", "D"])
+        self.tt.rollback()
+        self.assertEqual(lxml.etree.tostring(self.s), self.before)
+        self.assertEqual(self.s.tree().label(), "IP-MAT")
+
+    def test_add_sister_coindexed(self):
+        s = parse_string("""<sentence id="ONE">
+        <nonterminal category="IP" subcategory="MAT">
+        <nonterminal category="NP" subcategory="SBJ"><meta><index>9</index><idxtype>regular</idxtype></meta>
+        <text category="PRO">it</text></nonterminal>
+        <nonterminal category="NP"><meta><index>10</index><idxtype>regular</idxtype></meta>
+        <text category="N">dogs</text></nonterminal>
+        </nonterminal>
+        </sentence>""")
+        tt = TreeTransformer(s)
+        tt.findNodes(hasLabel("N")).addSister("D", "the", coindex=True)
+        n = tt.findNodes(hasLabel("N")).matches()[0]
+        self.assertEqual(lovett.util.index(n), "11")
+        self.assertEqual(lovett.util.index_type(n), "regular")
+        deep = s.to_deep()
+        self.assertIn("(D-11 (ORTHO the))", deep)
+        self.assertIn("(N-11 (ORTHO dogs))", deep)
+        self.assertEqual(s.to_deep(), deep)
+
+    def test_largest_index(self):
+        s = parse_string("""<nonterminal category="IP">
+        <text category="N">a<meta><index>9</index></meta></text>
+        <text category="N">b<meta><index>10</index></meta></text>
+        </nonterminal>""")
+        self.assertEqual(lovett.util.largest_index(s), 10)
+        self.assertIsNone(lovett.util.largest_index(self.s.tree()))
@@ -4,7 +4,9 @@ import lxml.etree
 from lovett.corpus import parse_string
 from .utils import MatchesXml
 from lovett.tree import AnnotaldXmlError
+from lovett.cs.searchfns import (coIndexed, deep, hasLabel)
 import lovett.tree
+import lovett.util
 
 class TreeTest(testtools.TestCase):
     def test_eq(self):
@@ -32,6 +34,89 @@ class TreeTest(testtools.TestCase):
         two = parse_string("<text category=\",\">,</text>")
         self.assertEqual(one, two)
 
+    def test_eq_does_not_mutate(self):
+        one = parse_string("<text category=\",\"><meta/>,</text>")
+        two = parse_string("<text category=\",\">,</text>")
+        self.assertEqual(one, two)
+        self.assertEqual(len(one), 1)
+
+    def test_hash(self):
+        one = parse_string("<text category=\"N\" subcategory=\"X\">"
+                           "a<meta></meta></text>")
+        two = parse_string("<text subcategory=\"X\" category=\"N\">a</text>")
+        three = parse_string("<text category=\"N\">a</text>")
+        self.assertEqual(one, two)
+        self.assertEqual(hash(one), hash(two))
+        self.assertEqual(hash(one), lovett.tree.structural_hash(
+            lxml.etree.fromstring("<text category=\"N\" subcategory=\"X\">"
+                                  "a</text>")))
+        self.assertEqual(len({one, two, three}), 2)
+
+    def test_hash_sentences(self):
+        c = parse_string("""<corpus>
+        <sentence id="A"><text category="N">a</text></sentence>
+        <sentence id="A"><text category="N">a</text></sentence>
+        <sentence id="B"><text category="N">a</text></sentence>
+        </corpus>""")
+        one, two, three = c
+        self.assertEqual(one, two)
+        self.assertNotEqual(one, three)
+        self.assertEqual(len(set(c.trees())), 2)
+
+    def test_hash_invalidated(self):
+        c = parse_string("""<corpus><sentence><nonterminal category="NP">
+        <text category="N">a</text></nonterminal></sentence></corpus>""")
+        np = c[0].tree()
+        n = next(np.children())
+        h = hash(np)
+        n.set_label("NPR")
+        self.assertNotEqual(hash(np), h)
+        h = hash(np)
+        n.metadata()["lemma"] = "a"
+        self.assertNotEqual(hash(np), h)
+        h = hash(np)
+        del n.metadata()["lemma"]
+        self.assertNotEqual(hash(np), h)
+        h = hash(np)
+        np.append(np.makeelement("text", category="N"))
+        self.assertNotEqual(hash(np), h)
+        h = hash(np)
+        n.text = "b"
+        lovett.tree.invalidate_hashes()
+        self.assertNotEqual(hash(np), h)
+
+    def test_hash_per_tree(self):
+        c = parse_string("""<corpus>
+        <sentence id="ONE"><nonterminal category="NP">
+        <text category="N">a</text></nonterminal></sentence>
+        <sentence id="TWO"><nonterminal category="NP">
+        <text category="N">b</text></nonterminal></sentence>
+        </corpus>""")
+        c.pin()
+        one, two = c
+        h = hash(two)
+        cached = two._structural_hash
+        g1 = lovett.tree.tree_generation(one.tree()[0])
+        g2 = lovett.tree.tree_generation(two.tree()[0])
+        self.assertEqual(lovett.tree.tree_generation(one), g1)
+        # Changing one tree leaves the caches of another alone
+        one.tree()[0].set_label("NPR")
+        one.tree()[0].metadata()["lemma"] = "a"
+        one.tree().append(one.tree().makeelement("text", category="N"))
+        self.assertNotEqual(lovett.tree.tree_generation(one), g1)
+        self.assertEqual(lovett.tree.tree_generation(two), g2)
+        self.assertEqual(hash(two), h)
+        self.assertIs(two._structural_hash, cached)
+        lovett.tree.invalidate_hashes(one.tree())
+        self.assertEqual(lovett.tree.tree_generation(two), g2)
+        # Moving a node changes both trees
+        two.tree().append(one.tree()[1])
+        self.assertNotEqual(lovett.tree.tree_generation(two), g2)
+        self.assertNotEqual(hash(two), h)
+        g2 = lovett.tree.tree_generation(two)
+        lovett.tree.invalidate_hashes()
+        self.assertNotEqual(lovett.tree.tree_generation(two), g2)
+
     def test_meta_to_deep(self):
         m = lxml.etree.fromstring("<meta><x>y</x></meta>")
         self.assertEqual(lovett.tree._meta_to_deep(m, 0),
@@ -66,6 +151,57 @@ class TreeNodeTest(testtools.TestCase):
         self.assertRaises(AnnotaldXmlError,
                           lambda: s.set_label("FOO-BAR-BAZ"))
 
+    def test_set_label_drops_subcat(self):
+        s = parse_string("<text category=\"FOO\" subcategory=\"BAR\">bar</text>")
+        s.set_label("BAZ")
+        self.assertThat(s, MatchesXml(
+            "<text category=\"BAZ\">bar</text>"
+        ))
+
+    def test_label_id(self):
+        c = parse_string("""<corpus><sentence><nonterminal category="NP">
+        <text category="N">a</text><text category="N">b</text>
+        </nonterminal></sentence></corpus>""")
+        np = c[0].tree()
+        one, two = np.children()
+        self.assertEqual(one.label_id(), two.label_id())
+        self.assertNotEqual(one.label_id(), np.label_id())
+        self.assertEqual(lovett.tree.label_string(np.label_id()), "NP")
+        self.assertEqual(lovett.tree.intern_label("NP"), np.label_id())
+        c.pin()
+        one.set_label("NPR")
+        self.assertEqual(one.label(), "NPR")
+        self.assertEqual(one.label_id(), lovett.tree.intern_label("NPR"))
+        self.assertEqual(c.freeze()[0].tree().label_id(), np.label_id())
+
+    def test_set_category_pinned(self):
+        c = parse_string("""<corpus><sentence><nonterminal category="NP">
+        <text category="N">a</text></nonterminal></sentence></corpus>""")
+        c.pin()
+        n = next(c[0].tree().children())
+        self.assertEqual(n.label(), "N")
+        n.set("category", "V")
+        self.assertEqual(n.label(), "V")
+        n.set("subcategory", "X")
+        self.assertEqual(n.label_id(), lovett.tree.intern_label("V-X"))
+        self.assertEqual(deep(hasLabel("V"))(c[0].tree()), [n])
+
+    def test_subtrees(self):
+        t = parse_string("""<nonterminal category="IP">
+        <meta><index>1</index></meta>
+        <nonterminal category="NP"><meta><foo>x</foo></meta>
+        <text category="D">a<meta><lemma>a</lemma></meta></text>
+        <nonterminal category="ADJP"><text category="ADJ">b</text></nonterminal>
+        </nonterminal>
+        <trace category="NP" tracetype="T"/>
+        <comment comtype="COM">c</comment>
+        </nonterminal>""")
+        self.assertEqual([x.label() for x in t.subtrees()],
+                         ["NP", "D", "ADJP", "ADJ", "NP", "CODE"])
+        self.assertEqual([x.label() for x in t.children()],
+                         ["NP", "NP", "CODE"])
+        self.assertEqual(list(next(t.children()).children())[0].text, "a")
+
     def test_urtext(self):
         self.skipTest("unwritten test")
 
@@ -81,6 +217,24 @@ class TreeNodeTest(testtools.TestCase):
     def test_iter(self):
         self.skipTest("unwritten test")
 
+    def test_get_meta(self):
+        s = parse_string("<text category=\"FOO\">bar<meta><lemma>baz</lemma><x><y>z</y></x></meta></text>")
+        self.assertEqual(s.get_meta("lemma"), "baz")
+        self.assertEqual(s.get_meta("LEMMA"), "baz")
+        self.assertEqual(s.get_meta("x")["y"], "z")
+        self.assertEqual(s.get_meta("nope", "default"), "default")
+        self.assertTrue(s.has_meta())
+        self.assertTrue(s.has_meta("lemma"))
+        self.assertFalse(s.has_meta("nope"))
+
+    def test_get_meta_no_meta(self):
+        s = parse_string("<text category=\"FOO\">bar</text>")
+        self.assertIsNone(s.get_meta("lemma"))
+        self.assertFalse(s.has_meta())
+        self.assertIsNone(lovett.util.index(s))
+        self.assertIsNone(lovett.util.index_type(s))
+        self.assertIsNone(s.find("meta"))
+
 class MetadataDictTest(testtools.TestCase):
     def test_illegal_attrs(self):
         self.skipTest("unwritten test")
@@ -205,6 +359,58 @@ class SentenceTest(testtools.TestCase):
   (ID XYZ))
                          """.strip())
 
+    def test_to_deep_continuation(self):
+        s = parse_string("""<sentence id="XYZ">
+        <nonterminal category="ABC">
+        <nonterminal category="DEF">
+        <text category="FOO">BAR<meta><has_continuation>yes</has_continuation></meta></text>
+        </nonterminal>
+        <nonterminal category="GHI">
+        <nonterminal category="JKL">
+        <text category="XYZ">123</text>
+        </nonterminal>
+        </nonterminal>
+        </nonterminal>
+        </sentence>""")
+        self.assertEqual(s.to_deep(),
+                         """
+( (ABC (DEF (FOO (ORTHO BAR$)
+                 (META (has_continuation yes))))
+       (GHI (JKL (XYZ (ORTHO $123)))))
+  (ID XYZ))
+                         """.strip())
+
+    def test_to_deep_continuation_leaf(self):
+        s = parse_string("""<sentence id="XYZ">
+        <nonterminal category="ABC">
+        <text category="FOO">BAR<meta><has_continuation>yes</has_continuation></meta></text>
+        <text category="XYZ">123</text>
+        </nonterminal>
+        </sentence>""")
+        leaf = s.tree()[1]
+        self.assertEqual(leaf.to_deep(), "(XYZ (ORTHO $123))")
+
+    def test_to_deep_continuation_subtree(self):
+        s = parse_string("""<sentence id="XYZ">
+        <nonterminal category="ABC">
+        <nonterminal category="DEF">
+        <text category="FOO">BAR<meta><has_continuation>yes</has_continuation></meta></text>
+        <comment comtype="COM">x</comment>
+        </nonterminal>
+        <nonterminal category="GHI">
+        <nonterminal category="JKL">
+        <text category="XYZ">123</text>
+        </nonterminal>
+        </nonterminal>
+        </nonterminal>
+        </sentence>""")
+        ghi = s.tree()[1]
+        self.assertEqual(ghi.to_deep(), "(GHI (JKL (XYZ (ORTHO $123))))")
+        self.assertEqual(ghi[0][0].to_deep(), "(XYZ (ORTHO $123))")
+        self.assertIn("(ORTHO $123)", s.to_deep())
+        self.assertEqual(s.tree()[0][0].to_deep(),
+                         "(FOO (ORTHO BAR$)\n     (META (has_continuation yes)))")
+
 class TerminalTest(testtools.TestCase):
     def test_to_deep(self):
         s = parse_string("<text category=\"FOO\">BAR</text>")
@@ -229,6 +435,23 @@ class TerminalTest(testtools.TestCase):
 (FOO-1 (ORTHO BAR))
                          """.strip())
 
+    def test_to_deep_unchanged(self):
+        s = parse_string("""<sentence id="A,1">
+        <nonterminal category="IP">
+        <nonterminal category="NP"><meta><index>1</index></meta>
+        <text category="N">BAR</text></nonterminal>
+        <trace category="NP" tracetype="T"><meta><index>1</index><idxtype>regular</idxtype><x>y</x></meta></trace>
+        </nonterminal>
+        </sentence>""")
+        before = lxml.etree.tostring(s)
+        first = s.to_deep()
+        self.assertIn("(NP (ALT-ORTHO *T*-1)\n", first)
+        self.assertIn("(META (x y))", first)
+        self.assertEqual(s.to_deep(), first)
+        self.assertEqual(lxml.etree.tostring(s), before)
+        trace = s.tree()[1]
+        self.assertEqual([x.label() for x in coIndexed()(trace)], ["NP"])
+
     def test_to_deep_index_gap(self):
         s = parse_string("<text category=\"FOO\">BAR<meta><index>1</index><idxtype>gap</idxtype></meta></text>")
         self.assertEqual(s.to_deep(),
@@ -281,6 +504,23 @@ class EcTest(testtools.TestCase):
 (FOO-1 (ALT-ORTHO *pro*))
                          """.strip())
 
+    def test_to_deep_unchanged(self):
+        s = parse_string("""<sentence id="A,1">
+        <nonterminal category="IP">
+        <nonterminal category="NP"><meta><index>1</index></meta>
+        <text category="N">BAR</text></nonterminal>
+        <trace category="NP" tracetype="T"><meta><index>1</index><idxtype>regular</idxtype><x>y</x></meta></trace>
+        </nonterminal>
+        </sentence>""")
+        before = lxml.etree.tostring(s)
+        first = s.to_deep()
+        self.assertIn("(NP (ALT-ORTHO *T*-1)\n", first)
+        self.assertIn("(META (x y))", first)
+        self.assertEqual(s.to_deep(), first)
+        self.assertEqual(lxml.etree.tostring(s), before)
+        trace = s.tree()[1]
+        self.assertEqual([x.label() for x in coIndexed()(trace)], ["NP"])
+
     def test_to_deep_index_gap(self):
         s = parse_string("<ec category=\"FOO\" ectype=\"pro\"><meta><index>1</index><idxtype>gap</idxtype></meta></ec>")
         self.assertEqual(s.to_deep(),
@@ -0,0 +1,91 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+
+import testtools
+import lxml.etree
+
+from lovett.corpus import parse_string
+from lovett.psd import parse_deep_string
+from lovett.writers import (TreeWriter, DeepWriter, PsdxWriter)
+import lovett.io
+
+DEEP = """( (IP-MAT (NP-SBJ (PRO (ORTHO I)))
+          (VBD (ORTHO saw)))
+  (ID ONE))
+
+( (IP-MAT (VBD (ORTHO left)))
+  (ID TWO))
+
+( (IP-MAT (VBD (ORTHO stayed)))
+  (ID THREE))"""
+
+class WritersTest(testtools.TestCase):
+    def setUp(self):
+        super(WritersTest, self).setUp()
+        self.corpus = parse_deep_string(DEEP)
+
+    def test_deep_writer(self):
+        for size in (1, 100, 1 << 16):
+            f = io.StringIO()
+            with DeepWriter(f, buffer_size=size) as w:
+                w.write_all(self.corpus.trees())
+            self.assertEqual(f.getvalue(), self.corpus.to_deep())
+            self.assertFalse(f.closed)
+
+    def test_write_deep(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        path = os.path.join(d, "out.psd.gz")
+        self.corpus.write_deep(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), self.corpus.to_deep())
+
+    def test_empty(self):
+        f = io.StringIO()
+        TreeWriter(f).close()
+        self.assertEqual(f.getvalue(), "")
+
+    def test_write_trees(self):
+        f = io.StringIO()
+        lovett.io.writeTrees(None, ["a", "b", "c"], f)
+        self.assertEqual(f.getvalue(), "a\n\nb\n\nc")
+
+class PsdxWriterTest(testtools.TestCase):
+    def setUp(self):
+        super(PsdxWriterTest, self).setUp()
+        self.corpus = parse_deep_string(DEEP)
+
+    def test_matches_tostring(self):
+        f = io.BytesIO()
+        with PsdxWriter(f) as w:
+            w.write_all(self.corpus.trees())
+        self.assertEqual(f.getvalue(),
+                         lxml.etree.tostring(self.corpus, encoding="utf-8",
+                                             xml_declaration=True))
+
+    def test_pretty_print(self):
+        f = io.BytesIO()
+        self.corpus.write_psdx(f, pretty_print=True)
+        out = f.getvalue()
+        self.assertTrue(out.endswith(b"</sentence>\n</corpus>\n"))
+        self.assertIn(b"\n  <nonterminal", out)
+        reparsed = parse_string(out)
+        self.assertEqual(lxml.etree.tostring(reparsed),
+                         lxml.etree.tostring(self.corpus))
+
+    def test_compressed(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        path = os.path.join(d, "out.psdx.gz")
+        with PsdxWriter(path) as w:
+            for s in self.corpus.trees():
+                w.write(s)
+        with gzip.open(path) as f:
+            self.assertEqual(len(lxml.etree.parse(f).getroot()), 3)
+
+    def test_outside_with(self):
+        w = PsdxWriter(io.BytesIO())
+        self.assertRaises(ValueError, w.write, self.corpus[0])
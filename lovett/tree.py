@@ -1,43 +1,15 @@
 from lxml import etree
 
 import collections.abc
+import itertools
+import re
 
 class AnnotaldXmlError(Exception):
     pass
 
-def _isMetaElement(x):
-    return x.tag == "meta"
-
-def _match(one, other):
-    """Compare two ``lxml.etree._Element`` instances for equality.
-
-    Checks, in turn, the tag, attributes, text (and tail), and children
-    recursively.
-
-    """
-    if one.tag != other.tag:
-        return False
-    for name, value in one.attrib.items():
-        if other.attrib.get(name) != value:
-            return False
-    for name in other.attrib.keys():
-        if name not in one.attrib.keys():
-            return False
-    if not one.text == other.text:
-        return False
-    if not one.tail == other.tail:
-        return False
-    cl1 = one.getchildren()
-    cl2 = other.getchildren()
-    if len(cl1) != len(cl2):
-        return False
-    for c1, c2 in zip(cl1, cl2):
-        m = _match(c1, c2)
-        if not m:
-            return False
-    return True
-
-def _meta_to_deep(m, offset):
+def _meta_to_deep(m, offset, skip=()):
+    # skip holds keys of m not to write, such as the index of a leaf, which
+    # is written as part of its label (see _calc_trace)
     if len(m) == 0:
         if m.tag == "meta":
             return ""
@@ -46,29 +18,391 @@ def _meta_to_deep(m, offset):
         l = m.tag
         if l == "meta":
             l = "META"
-        c = list(map(lambda x: _meta_to_deep(x, offset + len(l) + 2), m))
+        c = [_meta_to_deep(x, offset + len(l) + 2) for x in m
+             if x.tag not in skip]
+        if not c:
+            return ""
         c[0] = c[0].lstrip()
         return " " * offset + ("(%s " % l) + "\n".join(c) + ")"
 
+def _has_continuation(node, meta=None):
+    if meta is None:
+        meta = node.find("meta")
+    return meta is not None and meta.findtext("has_continuation") == "yes"
+
+def _last_leaf(node):
+    # The last text, trace or ec of a subtree, or None
+    if node.tag in ("text", "trace", "ec"):
+        return node
+    if node.tag == "nonterminal":
+        for x in node.iterchildren(*_tree_tags, reversed=True):
+            r = _last_leaf(x)
+            if r is not None:
+                return r
+    return None
+
+def _preceding_leaf(node):
+    # Find the text, trace or ec which linearly precedes a node in its
+    # sentence: the last leaf of the nearest preceding sibling of the node,
+    # or of one of its ancestors, which has one.  Only needed when a leaf
+    # or subtree is serialized on its own; a whole tree keeps track of the
+    # preceding leaf as it goes (see _leaf_continued).
+    p = node
+    while True:
+        for x in p.itersiblings(*_tree_tags, preceding=True):
+            r = _last_leaf(x)
+            if r is not None:
+                return r
+        p = p.getparent()
+        if p is None or p.tag == "sentence":
+            return None
+
+def _leaf_continued(node, state, own):
+    """Find out whether the leaf before ``node`` has a continuation.
+
+    ``state`` is a one-element list, shared by all the nodes serialized in
+    one call to ``to_deep``, which carries whether the last leaf serialized
+    had a continuation.  Leaves are serialized left to right, so this is
+    the leaf which linearly precedes ``node``; ``None`` means that there has
+    not been one yet, and we must search the tree for it.  On return,
+    ``state`` is updated with ``own``, whether ``node`` itself has a
+    continuation.
+
+    """
+    continued = state[0]
+    if continued is None:
+        p = _preceding_leaf(node)
+        continued = p is not None and _has_continuation(p)
+    state[0] = own
+    return continued
+
+# The label symbol table, shared by every corpus in the process.  Labels are
+# never removed from it, so ids are stable.
+_label_strings = []
+_label_ids = {}
+
+def intern_label(label):
+    """Return the integer id of a label in the symbol table.
+
+    Two labels are equal exactly when their ids are.
+
+    :param str label: The label
+    :rtype: int
+
+    """
+    i = _label_ids.get(label)
+    if i is None:
+        i = _label_ids[label] = len(_label_strings)
+        _label_strings.append(label)
+    return i
+
+def label_string(label_id):
+    """Return the label with an id from :func:`intern_label`.
+
+    :param int label_id: The id
+    :rtype: str
+
+    """
+    return _label_strings[label_id]
+
+def _find_meta(node):
+    # Most leaves have no children at all, and len() is much cheaper than a
+    # search, which has to create a Python proxy for every child it finds.
+    if len(node) == 0:
+        return None
+    for m in node.iterchildren("meta"):
+        return m
+    return None
+
+def _meta_text(node, key):
+    """Return the text of a metadata key of a node, or ``None``.
+
+    This is the fast path for plain (non-nested) keys such as ``index`` and
+    ``idxtype``; ``key`` must already be lower case.  Nothing is allocated,
+    and the node is not changed.
+
+    """
+    m = _find_meta(node)
+    if m is None:
+        return None
+    for r in m.iterchildren(key):
+        return r.text
+    return None
+
+# The metadata keys which _calc_trace writes as part of a leaf's label
+_trace_keys = ("index", "idxtype")
+
 def _calc_trace(node):
-    m = node.metadata()
-    i = m.get("index", None)
-    it = m.get("idxtype", None)
+    # The index suffix of a leaf's label in the deep format, such as "-1",
+    # or "" if it has none.  The tree is only read: when the suffix is not
+    # empty, the caller leaves _trace_keys out of the META it writes.
+    i = _meta_text(node, "index")
+    it = _meta_text(node, "idxtype")
     if i is not None and it is not None:
-        del m["index"]
-        del m["idxtype"]
         return ("=" if it == "gap" else "-") + i
     return ""
 
+# The tags of the nodes of a tree, as opposed to its metadata.  (A metadata
+# key with one of these names would be taken for a node.)
+_tree_tags = ("nonterminal", "text", "trace", "ec", "comment")
+# The tags of the leaves of a tree
+_leaf_tags = frozenset(("text", "trace", "ec", "comment"))
+
+def _children(node):
+    # The daughters of a node, without its metadata
+    return node.iterchildren(*_tree_tags)
+
+# Structural hashes, span indexes and coindexation tables are cached on
+# nodes' Python objects, stamped with the generation of the tree they were
+# computed from.  A tree's generation is kept on its owner (its sentence, or
+# the root of the tree if it is not in a sentence), and is renewed whenever
+# the classes below change the tree.  Generations are drawn from one counter,
+# so that no two are alike, even for a new Python object for the same
+# owner.
+_generations = itertools.count(1)
+# The number of changes made to any tree
+_generation = 0
+# Incremented by invalidate_hashes() without a node, to renew the generation
+# of every tree at once
+_epoch = 0
+# Functions called with the owner of each tree which changes, before the
+# change is made (see lovett.cs.searchfns.Memo)
+_change_hooks = []
+# The attributes by which the nodes of an indexed corpus, and the corpus
+# itself, refer to its label and lexical indexes (see lovett.labels)
+_index_attrs = ("_labels", "_lexicon")
+
+def _owner(node):
+    # The sentence containing a node, or the root of its tree
+    while node.tag != "sentence":
+        p = node.getparent()
+        if p is None:
+            break
+        node = p
+    return node
+
+def _owner_generation(owner):
+    g = getattr(owner, "_tree_generation", None)
+    if g is None or g[0] != _epoch:
+        g = (_epoch, next(_generations))
+        try:
+            owner._tree_generation = g
+        except AttributeError:
+            # A plain element, which cannot carry a generation (nor any
+            # cache)
+            pass
+    return g[1]
+
+def tree_generation(node):
+    """Return the generation of the tree containing a node.
+
+    The generation changes whenever the tree is changed (see
+    :func:`invalidate_hashes`), and not otherwise, so it can be used to
+    tell whether a value computed from the tree is still current.  The
+    generation is kept on the node's sentence, for as long as its Python
+    object is alive.
+
+    :param node: The node
+    :rtype: int
+
+    """
+    return _owner_generation(_owner(node))
+
+def _changed(node, kind="tree"):
+    # Record that the tree containing node is about to change.  kind is
+    # what changes: "tree" (anything, including the structure), "label",
+    # "attrib" (another attribute) or "meta".  The owner's generation is
+    # renewed, and the indexes of its corpus are told which sentence is
+    # changing, and how.
+    global _generation
+    _generation += 1
+    owner = _owner(node)
+    for hook in _change_hooks:
+        hook(owner)
+    # An owner without a generation has nothing computed from it (the
+    # caches keep their owner's Python object, and with it the generation,
+    # alive), and will be given a new generation when it is next asked for
+    # one; new trees are built without giving them any.
+    d = getattr(owner, "__dict__", None)
+    if not d:
+        return
+    if d.get("_tree_generation") is not None:
+        owner._tree_generation = (_epoch, next(_generations))
+    for attr in _index_attrs:
+        index = d.get(attr)
+        if index is not None:
+            index._changed(owner, kind)
+
+def _moving(element):
+    # Record that element is about to be moved out of its parent
+    p = element.getparent()
+    if p is not None:
+        _changed(p)
+
+def invalidate_hashes(node=None):
+    """Forget cached structural hashes, and mark span, label and lexical
+    indexes (see :mod:`lovett.spans`, :mod:`lovett.labels` and
+    :mod:`lovett.lexicon`) and coindexation tables for rebuilding.
+
+    The classes in this module keep their caches up to date, but changes
+    made behind their backs cannot be noticed: setting the ``text`` or
+    ``tail`` of an element, changing its ``attrib`` directly, or editing a
+    ``meta`` element other than through :class:`MetadataDict`.  Call this
+    function after making such changes.
+
+    :param node: The node which was changed.  Only what was computed from
+        its tree is forgotten.  If ``None``, every tree is taken to have
+        changed.
+
+    """
+    global _epoch, _generation
+    if node is None:
+        _epoch += 1
+        _generation += 1
+        return
+    d = getattr(node, "__dict__", None)
+    if d is not None:
+        d.pop("_label_id", None)
+    _changed(node)
+
+_empty_meta_re = re.compile(rb"<meta>[^<]*</meta>")
+
+def _canonical(node):
+    # Canonical XML puts attributes in a fixed order and leaves out the
+    # node's tail.  Empty meta elements make no difference to a tree, so
+    # they are left out as well.
+    return _empty_meta_re.sub(b"", etree.tostring(node, method="c14n"))
+
+def structural_hash(node):
+    """Return a hash of the content of a node.
+
+    Nodes which compare equal have the same hash.  The hash depends on the
+    tag, attributes, text and descendants of the node (but not its tail),
+    and ignores empty ``meta`` elements.  It is cached on the nodes of a
+    tree, and recomputed once that tree has been changed (see
+    :func:`invalidate_hashes`); other elements are hashed afresh each time.
+
+    :param node: The node to hash
+    :type node: :class:`lxml.etree._Element`
+    :rtype: int
+
+    """
+    if isinstance(node, _Structural):
+        return node.structural_hash()
+    return hash(_canonical(node))
+
+class _Mutable(object):
+    # The methods of lxml.etree._Element which change an element,
+    # overridden to record the change (see _changed).  Shared by corpora,
+    # sentences and tree nodes.
+
+    def append(self, element):
+        _moving(element)
+        _changed(self)
+        super(_Mutable, self).append(element)
+
+    def extend(self, elements):
+        elements = list(elements)
+        for element in elements:
+            _moving(element)
+        _changed(self)
+        super(_Mutable, self).extend(elements)
+
+    def insert(self, index, element):
+        _moving(element)
+        _changed(self)
+        super(_Mutable, self).insert(index, element)
+
+    def remove(self, element):
+        _changed(self)
+        super(_Mutable, self).remove(element)
+
+    def replace(self, old_element, new_element):
+        _moving(new_element)
+        _changed(self)
+        super(_Mutable, self).replace(old_element, new_element)
+
+    def addnext(self, element):
+        _moving(element)
+        _changed(self)
+        super(_Mutable, self).addnext(element)
+
+    def addprevious(self, element):
+        _moving(element)
+        _changed(self)
+        super(_Mutable, self).addprevious(element)
+
+    def clear(self, *args, **kwargs):
+        _changed(self)
+        super(_Mutable, self).clear(*args, **kwargs)
+
+    def set(self, key, value):
+        if key in ("category", "subcategory"):
+            _changed(self, "label")
+            # The cached label id (see TreeNode._cache_label) is stale
+            if getattr(self, "_label_id", None) is not None:
+                del self._label_id
+        else:
+            _changed(self, "attrib")
+        super(_Mutable, self).set(key, value)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+        for element in (value if isinstance(index, slice) else [value]):
+            _moving(element)
+        _changed(self)
+        super(_Mutable, self).__setitem__(index, value)
 
-class TreeNode(etree.ElementBase):
+    def __delitem__(self, index):
+        _changed(self)
+        super(_Mutable, self).__delitem__(index)
+
+class _Structural(_Mutable):
+    # Structural hashing and equality, shared by tree nodes and sentences
+
+    def structural_hash(self):
+        """Return a hash of the content of the node.
+
+        See :func:`structural_hash`.
+
+        :rtype: int
+
+        """
+        owner = _owner(self)
+        generation = _owner_generation(owner)
+        c = getattr(self, "_structural_hash", None)
+        if c is not None and c[1] == generation:
+            return c[2]
+        h = hash(_canonical(self))
+        # Keeping the owner alive keeps its generation
+        self._structural_hash = (owner, generation, h)
+        return h
+
+    def __eq__(self, other):
+        if not isinstance(other, etree._Element):
+            return False
+        if self is other:
+            return True
+        if self.structural_hash() != structural_hash(other):
+            return False
+        return _canonical(self) == _canonical(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.structural_hash()
+
+class TreeNode(_Structural, etree.ElementBase):
     """Base class for all classes which represent elements in a PSDX tree.
 
     This class inherits from the `LXML ElementBase class
     <http://lxml.de/api/lxml.etree.ElementBase-class.html>`_.
 
     It implements equality based on comparing the XML tag, attributes, text,
-    and children.  It throws an error on being accessed as an iterator, since
+    and children, ignoring empty ``meta`` elements; nodes are hashed the same
+    way (see :func:`structural_hash`).  It throws an error on being accessed as an iterator, since
     this will return the metadata node mixed with bona fide children.  In
     order to iterate over children, use :func:`NonTerminal.children`.
 
@@ -82,6 +416,11 @@ class TreeNode(etree.ElementBase):
 
         """
 
+        # getattr with a default does not create the object's __dict__, so
+        # a miss is cheap.
+        i = getattr(self, "_label_id", None)
+        if i is not None:
+            return _label_strings[i]
         cat = self.get("category")
         subcat = self.get("subcategory", None)
         if subcat is not None:
@@ -89,6 +428,31 @@ class TreeNode(etree.ElementBase):
         else:
             return cat
 
+    def label_id(self):
+        """Return the id of the node's label in the label symbol table.
+
+        Comparing ids is cheaper than comparing label strings.  See
+        :func:`intern_label`.
+
+        :rtype: int
+
+        """
+        i = getattr(self, "_label_id", None)
+        if i is None:
+            label = self.label()
+            i = _label_ids.get(label)
+            if i is None:
+                i = intern_label(label)
+        return i
+
+    def _cache_label(self):
+        # Remember the label id on the node's Python object.  lxml discards
+        # the object, and with it the cache, once nothing refers to it, so
+        # this only pays off for pinned nodes (see Corpus.pin).  Change the
+        # label with set_label, rather than by setting the attributes
+        # directly, so that the cache is kept up to date.
+        self._label_id = self.label_id()
+
     def set_label(self, new_label):
         """Set the label of a node.
 
@@ -101,12 +465,25 @@ class TreeNode(etree.ElementBase):
         """
 
         p = new_label.split("-")
+        if len(p) > 2:
+            raise AnnotaldXmlError("cannot set multiple dash tags in XML: " +
+                                   new_label)
+        # A label index which is up to date is updated in place, rather
+        # than rebuilt.
+        index = getattr(self, "_labels", None)
+        if index is not None and index._current(self):
+            old = self.label_id()
+        else:
+            index = None
+        _changed(self, "label")
         self.attrib["category"] = p[0]
         if len(p) == 2:
             self.attrib["subcategory"] = p[1]
-        elif len(p) > 2:
-            raise AnnotaldXmlError("cannot set multiple dash tags in XML: " +
-                                   new_label)
+        elif "subcategory" in self.attrib:
+            del self.attrib["subcategory"]
+        self.__dict__.pop("_label_id", None)
+        if index is not None:
+            index._relabel(self, old)
 
     def sentence_node(self):
         """Return the ``sentence`` node dominating a node.
@@ -143,6 +520,10 @@ class TreeNode(etree.ElementBase):
     def metadata(self):
         """Return a dict-like object backed by a node's metadata.
 
+        If the node has no ``meta`` element, one is created.  To read
+        metadata without changing the tree, use :meth:`get_meta` or
+        :meth:`has_meta`.
+
         :rtype: :class:`MetadataDict`
 
         """
@@ -153,33 +534,51 @@ class TreeNode(etree.ElementBase):
             self.insert(0, meta)
         return MetadataDict(meta)
 
-    def _strip_empty_meta(self):
-        for m in self.getiterator("meta"):
-            if len(m) == 0:
-                t = m.tail
-                p = m.getparent()
-                p.remove(m)
-                if t is not None and t != "":
-                    p.text = p.text or ""
-                    p.text += t
+    def get_meta(self, key, default=None):
+        """Return the value of a metadata key, without changing the tree.
 
-    def __iter__(self):
-        raise AnnotaldXmlError("you shouldn't iterate directly over an element, you'll bogusly find metadata")
+        Unlike going through :meth:`metadata`, this never creates a ``meta``
+        element.
 
-    def __eq__(self, other):
-        if not isinstance(other, etree._Element):
+        :param str key: The key to look up
+        :param default: What to return if the key is not present
+        :returns: The text of the key, or a :class:`MetadataDict` if the key
+            holds nested metadata
+
+        """
+        m = _find_meta(self)
+        if m is None:
+            return default
+        for r in m.iterchildren(key.lower()):
+            if len(r) > 0:
+                return MetadataDict(r)
+            return r.text
+        return default
+
+    def has_meta(self, key=None):
+        """Test whether a node has metadata, without changing the tree.
+
+        :param str key: The key to test for.  If ``None``, test whether the
+            node has any metadata at all.
+        :rtype: bool
+
+        """
+        m = _find_meta(self)
+        if m is None:
             return False
-        self._strip_empty_meta()
-        try:
-            other._strip_empty_meta()
-        except AttributeError:
-            pass
-        return _match(self, other)
+        if key is None:
+            return len(m) > 0
+        for r in m.iterchildren(key.lower()):
+            return True
+        return False
 
-    def to_deep(self, offset):
+    def __iter__(self):
+        raise AnnotaldXmlError("you shouldn't iterate directly over an element, you'll bogusly find metadata")
+
+    def to_deep(self, offset, _state=None):
         raise NotImplementedError()
 
-    # Not pictured: parent_index, __hash__
+    # Not pictured: parent_index
 
 class MetadataDict(collections.abc.MutableMapping):
     """A dict-like object backed by PSDX metadata.
@@ -218,6 +617,7 @@ class MetadataDict(collections.abc.MutableMapping):
                     "comtype", "id"]:
             raise AnnotaldXmlError(
                 "Key '%s' should be set as an attribute, not metadata" % item)
+        _changed(self.element, "meta")
         r = self.element.find(item.lower())
         if r is None:
             r = self.element.makeelement(item.lower())
@@ -232,6 +632,7 @@ class MetadataDict(collections.abc.MutableMapping):
     def __delitem__(self, item):
         r = self.element.find(item.lower())
         if r is not None:
+            _changed(self.element, "meta")
             r.getparent().remove(r)
 
     def __len__(self):
@@ -253,12 +654,12 @@ class NonTerminal(TreeNode):
         :rtype: iterator
 
         """
-        for t in self.children():
-            if isinstance(t, Terminal):
-                yield t
-            else:
-                yield t
-                yield from t.subtrees()
+        # lxml's iterator walks the tree in C, rather than passing each
+        # node up through a generator for every level above it, and skips
+        # the metadata by tag.
+        it = self.iter(*_tree_tags)
+        next(it)
+        return it
 
     def children(self):
         """Access the children of a nonterminal.
@@ -267,16 +668,36 @@ class NonTerminal(TreeNode):
 
         """
 
-        yield from (x for x in self.iterchildren() if not _isMetaElement(x))
+        return self.iterchildren(*_tree_tags)
+
+    def to_deep(self, offset=0, _state=None):
+        out = []
+        self._to_deep(out, offset, [None] if _state is None else _state)
+        return "".join(out)
 
-    def to_deep(self, offset=0):
+    def _to_deep(self, out, offset, state, indent=True):
+        # Append the pieces of the deep format text to ``out``, so that
+        # serializing a tree copies each piece once, rather than once per
+        # level of embedding.
         l = self.label()
-        c = list(map(lambda x: x.to_deep(offset + len(l) + 2), self.children()))
-        c[0] = c[0].lstrip()
+        out.append((" " * offset if indent else "") + "(%s " % l)
+        o = offset + len(l) + 2
+        first = True
+        for x in self.children():
+            if not first:
+                out.append("\n")
+            if isinstance(x, NonTerminal):
+                x._to_deep(out, o, state, not first)
+            elif first:
+                out.append(x.to_deep(o, state).lstrip())
+            else:
+                out.append(x.to_deep(o, state))
+            first = False
         m = self.find("meta")
         if m is not None:
-            c.append(_meta_to_deep(m, offset + len(l) + 2))
-        return " " * offset + ("(%s " % l) + "\n".join(c) + ")"
+            out.append("\n")
+            out.append(_meta_to_deep(m, o))
+        out.append(")")
 
     def urtext(self):
         # TODO: join split words
@@ -284,8 +705,12 @@ class NonTerminal(TreeNode):
                                (s.urtext() for s in self if s.tag != "meta")))
 
 
-class Sentence(etree.ElementBase):
-    """A class representing a sentence PSDX node."""
+class Sentence(_Structural, etree.ElementBase):
+    """A class representing a sentence PSDX node.
+
+    Sentences compare equal, and hash, by their content, as tree nodes do.
+
+    """
     def tree(self):
         """Get the tree that corresponds to the sentence.
 
@@ -314,8 +739,27 @@ class Sentence(etree.ElementBase):
 
         self.set("id", new_id)
 
+    def index_spans(self):
+        """Build a span index for the sentence, or return the one it has.
+
+        The search functions in :mod:`lovett.cs.searchfns` use the index to
+        test dominance and precedence in constant time.  It lasts for as
+        long as the sentence's Python object (or the index itself) is kept
+        alive.
+
+        :rtype: :class:`lovett.spans.SpanIndex`
+
+        """
+        from .spans import SpanIndex
+        index = getattr(self, "_spans", None)
+        if index is None:
+            index = SpanIndex(self)
+        return index
+
     def to_deep(self):
-        return "( " + self.tree().to_deep(2).lstrip() + ("\n  (ID %s))" % self.id())
+        # The first leaf of a sentence is never preceded by a continuation.
+        return "( " + self.tree().to_deep(2, [False]).lstrip() + \
+            ("\n  (ID %s))" % self.id())
 
 class Terminal(TreeNode):
     """A class representing a terminal node."""
@@ -324,34 +768,16 @@ class Terminal(TreeNode):
 
 class Text(Terminal):
     """A class representing a text node."""
-    def to_deep(self, offset=0):
-        # Calculate whether the linearly preceding node has_continuation...
-        def acceptable(x):
-            return x is not None and x is not self and x.tag in ["text", "trace", "ec"]
-        pre_dollar = False
-        p = self
-        while not acceptable(p):
-            if p is None:
-                break
-            if p.tag == "nonterminal":
-                # drop down a level
-                p = p[len(p)-1]
-                continue
-            if p.getprevious() is None:
-                if p.getparent() is None or p.getparent().tag == "sentence":
-                    break
-                p = p.getparent().getprevious()
-            else:
-                p = p.getprevious()
-        if p is not None and p.metadata().get("has_continuation", None) == "yes":
-            pre_dollar = True
-        # ...back to our regularly scheduled programming
+    def to_deep(self, offset=0, _state=None):
         m = self.find("meta")
+        post_dollar = _has_continuation(self, m)
+        pre_dollar = _leaf_continued(self, _state or [None], post_dollar)
         ms = ""
         l = self.label()
         ts = _calc_trace(self)
         if m is not None:
-            ms = _meta_to_deep(m, offset + len(l) + 2)
+            ms = _meta_to_deep(m, offset + len(l) + 2,
+                               _trace_keys if ts else ())
             if ms != "":
                 ms = "\n" + ms
         return "%s(%s%s (ORTHO %s%s%s)%s)" % \
@@ -360,7 +786,7 @@ class Text(Terminal):
              ts,
              "$" if pre_dollar else "",
              self.text,
-             "$" if self.metadata().get("has_continuation", None) == "yes" else "",
+             "$" if post_dollar else "",
              ms)
 
     def urtext(self):
@@ -388,13 +814,16 @@ class Trace(Terminal):
         """
         self.set("tracetype", newtype)
 
-    def to_deep(self, offset=0):
+    def to_deep(self, offset=0, _state=None):
         m = self.find("meta")
+        if _state is not None:
+            _state[0] = _has_continuation(self, m)
         ms = ""
         l = self.label()
         ts = _calc_trace(self)
         if m is not None:
-            ms = _meta_to_deep(m, offset + len(l) + 2)
+            ms = _meta_to_deep(m, offset + len(l) + 2,
+                               _trace_keys if ts else ())
             if ms != "":
                 ms = "\n" + ms
         else:
@@ -425,13 +854,16 @@ class Ec(Terminal):
         """
         self.set("ectype", newtype)
 
-    def to_deep(self, offset=0):
+    def to_deep(self, offset=0, _state=None):
         m = self.find("meta")
+        if _state is not None:
+            _state[0] = _has_continuation(self, m)
         ms = ""
         l = self.label()
         ts = _calc_trace(self)
         if m is not None:
-            ms = _meta_to_deep(m, offset + len(l) + 2)
+            ms = _meta_to_deep(m, offset + len(l) + 2,
+                               _trace_keys if ts else ())
             if ms != "":
                 ms = "\n" + ms
         if self.ectype() == "zero":
@@ -453,6 +885,12 @@ class Comment(Terminal):
         """
         return "CODE"
 
+    def label_id(self):
+        return intern_label("CODE")
+
+    def _cache_label(self):
+        pass
+
     def set_label(self, newlabel):
         """Set the label of a comment node.
 
@@ -477,7 +915,7 @@ class Comment(Terminal):
         """
         self.set("comtype", newtype)
 
-    def to_deep(self, offset=0):
+    def to_deep(self, offset=0, _state=None):
         return " " * offset + "(CODE (ALT-ORTHO {%s:%s}))" % \
             (self.comtype(), self.text.replace(" ", "_"))
 
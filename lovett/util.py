@@ -1,45 +1,52 @@
-from functools import reduce
-import re
+import collections
+import concurrent.futures
+import os
 import lxml.etree
 
+import lovett
+from .tree import _meta_text
+
 ### Tree validation
-# TODO: this fn is untested
 def validateIndices(tree):
-    indices = []
-    for leaf in tree.leaves():
-        idx = indexOfTree(leaf)
-        if indices[idx]:
-            indices[idx] = indices[idx] + 1
-        else:
-            indices[idx] = 1
-    valid = True
-    for i in indices:
-        if not indices[i] or indices[i] == 1:
-            valid = False
-    return valid
+    """Test whether every index in a tree is borne by more than one node.
 
-### Traces/movement indices
-def _max_or_none(x, y):
-    if x is None and y is None:
-        return None
-    if y is None:
-        return x
-    if x is None:
-        return y
-    return max(x, y)
+    :param tree: Any node of the tree
+    :rtype: bool
+
+    """
+    from .coindex import coindex_table
+    return coindex_table(tree).valid()
 
+### Traces/movement indices
 def largest_index(tree):
-    return reduce(_max_or_none, map(index, tree.subtrees()))
+    """Return the largest index borne by a node under a tree.
+
+    Indices are compared as numbers, so ``10`` is larger than ``9``.
+
+    :param tree: The tree
+    :rtype: int, or ``None`` if no node has an index
 
-def set_index(tree, index):
+    """
+    return max((int(i) for i in map(index, tree.subtrees())
+                if i is not None and i.isdigit()), default=None)
+
+def set_index(tree, index, idxtype=None):
     # TODO: do we allow mutating the return value of metadata()?
-    tree.metadata()['index'] = index
+    m = tree.metadata()
+    m['index'] = index
+    if idxtype is not None:
+        m['idxtype'] = idxtype
 
 def index(tree):
-    return tree.metadata().get('index', None)
+    if isinstance(tree, lxml.etree._Element):
+        return _meta_text(tree, 'index')
+    # A lovett.frozen.FrozenNode
+    return tree.get_meta('index')
 
 def index_type(tree):
-    return tree.metadata().get('idxtype', None)
+    if isinstance(tree, lxml.etree._Element):
+        return _meta_text(tree, 'idxtype')
+    return tree.get_meta('idxtype')
 
 def index_type_short(tree):
     it = index_type(tree)
@@ -51,14 +58,11 @@ def index_type_short(tree):
         return None
 
 def remove_index(tree):
-    try:
-        del tree.metadata()['index']
-    except KeyError:
-        pass
-    try:
-        del tree.metadata()['idxtype']
-    except KeyError:
-        pass
+    if not tree.has_meta():
+        return
+    m = tree.metadata()
+    del m['index']
+    del m['idxtype']
 
 def is_leaf(t):
     # TODO: remove in favor of shorter name
@@ -82,3 +86,52 @@ def iter_flatten(iterable):
                 yield f
         else:
             yield e
+
+### Parallelism
+def default_workers():
+    """Return the number of worker processes to use when none is specified.
+
+    This is the number of CPUs, unless parallelism has been switched off by
+    setting ``lovett.parallel`` to ``False``.
+
+    """
+    if lovett.parallel:
+        return os.cpu_count() or 1
+    return 1
+
+def imap_ordered(fn, iterable, workers=None, window=None):
+    """Map a function over an iterable in a pool of worker processes.
+
+    Results are yielded in the order of the input.  At most ``window`` items
+    are in flight at once, so the input is consumed lazily and memory use is
+    bounded even for very long inputs.
+
+    :param fn: the function to apply; it must be picklable (i.e. defined at
+        the top level of a module)
+    :param iterable: the items to apply ``fn`` to
+    :param int workers: the number of processes to use (default: see
+        :func:`default_workers`).  If 1, ``fn`` is applied in this process.
+    :param int window: the maximum number of pending items (default: twice
+        ``workers``)
+    :rtype: iterator
+
+    """
+    if workers is None:
+        workers = default_workers()
+    if workers == 1:
+        yield from map(fn, iterable)
+        return
+    window = window or 2 * workers
+    pending = collections.deque()
+    executor = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        for item in iterable:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for f in pending:
+            f.cancel()
+        executor.shutdown()
@@ -0,0 +1,187 @@
+"""Writers which serialize a corpus one sentence at a time.
+
+Joining the text of every sentence into one string means holding the whole
+output in memory, on top of the trees themselves.  The writers here instead
+send each sentence to a file as soon as it has been serialized, collecting
+the pieces into a small buffer so as to keep the number of writes down.
+:class:`PsdxWriter` does the same for PSDX, so that the sentences written
+need never be collected into a corpus element.
+
+"""
+
+import contextlib
+
+from lxml import etree
+
+from .compression import open_file
+
+__docformat__ = "restructuredtext en"
+
+class TreeWriter(object):
+    """Write trees to a file, separated by blank lines.
+
+    The output is the same as that of ``"\\n\\n".join(...)`` over the
+    serialized trees: there is no separator after the last tree.  A writer
+    can be used as a context manager, which closes it on exit.
+
+    :param file: a file name or a file object opened in text mode.  A file
+        named by the writer is opened (compressed if its name asks for it,
+        see :mod:`lovett.compression`) and closed by it; a file object is
+        only flushed.
+    :param int buffer_size: The number of characters to collect before
+        writing them out
+
+    """
+
+    separator = "\n\n"
+
+    def __init__(self, file, buffer_size=1 << 16):
+        if isinstance(file, str):
+            self._file = open_file(file, "w")
+            self._owned = True
+        else:
+            self._file = file
+            self._owned = False
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+        self._first = True
+
+    def serialize(self, tree):
+        """Return the text of a tree.
+
+        Subclasses override this to choose the output format.
+
+        """
+        return str(tree)
+
+    def _emit(self, s):
+        self._buffer.append(s)
+        self._buffered += len(s)
+        if self._buffered >= self.buffer_size:
+            self._drain()
+
+    def _drain(self):
+        if self._buffer:
+            self._file.write("".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def write(self, tree):
+        """Write one tree.
+
+        :param tree: The tree to write
+
+        """
+        if self._first:
+            self._first = False
+        else:
+            self._emit(self.separator)
+        self._emit(self.serialize(tree))
+
+    def write_all(self, trees):
+        """Write every tree from an iterable.
+
+        :param trees: An iterable of trees
+
+        """
+        for tree in trees:
+            self.write(tree)
+
+    def flush(self):
+        """Send buffered text to the file, and flush the file."""
+        self._drain()
+        self._file.flush()
+
+    def close(self):
+        """Flush the writer, and close its file if the writer opened it."""
+        if self._file is None:
+            return
+        self.flush()
+        if self._owned:
+            self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+class DeepWriter(TreeWriter):
+    """Write sentences in the deep format.
+
+    See :class:`TreeWriter` for the parameters.
+
+    """
+
+    def serialize(self, tree):
+        return tree.to_deep()
+
+class PsdxWriter(object):
+    """Write sentences as a PSDX corpus, one at a time.
+
+    This is a context manager: the XML declaration and the opening
+    ``<corpus>`` tag are written on entry, and the closing tag on exit.
+    Without pretty printing, the output is the same as that of
+    ``etree.tostring(corpus, encoding="utf-8", xml_declaration=True)`` on a
+    corpus holding the sentences written.
+    Sentences are copied out as they are written, so they may be changed or
+    discarded afterwards.
+
+    :param file: a file name or a file object opened in binary mode.  A
+        file named by the writer is opened (compressed if its name asks for
+        it, see :mod:`lovett.compression`) and closed by it.
+    :param bool pretty_print: Whether to put each element on its own line,
+        indented to show the structure of the tree
+
+    """
+
+    def __init__(self, file, pretty_print=False):
+        self.file = file
+        self.pretty_print = pretty_print
+        self._stack = None
+        self._xf = None
+
+    def __enter__(self):
+        stack = contextlib.ExitStack()
+        if isinstance(self.file, str):
+            f = stack.enter_context(open_file(self.file, "wb"))
+        else:
+            f = self.file
+        if self.pretty_print:
+            # xmlfile refuses text outside the root element, so the final
+            # newline is written straight to the file.
+            stack.callback(f.write, b"\n")
+        self._xf = stack.enter_context(etree.xmlfile(f, encoding="utf-8"))
+        self._xf.write_declaration()
+        stack.enter_context(self._xf.element("corpus"))
+        if self.pretty_print:
+            self._xf.write("\n")
+        self._stack = stack
+        return self
+
+    def write(self, sentence):
+        """Write one sentence.
+
+        :param sentence: The sentence to write
+        :type sentence: :class:`lovett.tree.Sentence`
+
+        """
+        if self._xf is None:
+            raise ValueError("PsdxWriter used outside a with block")
+        self._xf.write(sentence, pretty_print=self.pretty_print)
+
+    def write_all(self, sentences):
+        """Write every sentence from an iterable.
+
+        :param sentences: An iterable of sentences
+
+        """
+        for sentence in sentences:
+            self.write(sentence)
+
+    def __exit__(self, *exc):
+        stack, self._stack, self._xf = self._stack, None, None
+        return stack.__exit__(*exc)